@@ -1,9 +1,18 @@
 from __future__ import annotations
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import json
+import logging
+import os
 import re
-from collections import Counter
 from app.llm_client import is_configured as llm_ready, chat_json_schema
 from app.agents.extraction_article import extract_information_for_article
+from app.document_text import document_text, sections_document
+from app.term_index import TermIndex
+from app.terms import TermFrequencies
+
+log = logging.getLogger("extraction")
 
 DATE_PAT = re.compile(r"\b(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}|\d{4}-\d{2}-\d{2})\b")
 MONTANT_PAT = re.compile(r"(?:€\s?|eur\s?|euro[s]?\s?)?\b\d{1,3}(?:[\s.,]\d{3})*(?:[.,]\d{2})?\s*(?:€|eur|euro[s]?)\b", re.IGNORECASE)
@@ -11,19 +20,39 @@ DUREE_PAT = re.compile(r"\b(\d+\s*(?:jour[s]?|mois|année[s]?|an[s]?))\b", re.IG
 
 SPLIT_SENT = re.compile(r"(?<=[.!?])\s+")
 
-FR_STOPWORDS = set("""
-a au aux avec ce ces dans de des du elle en et eux il je la le leur lui ma mais me même mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous c d l j s t y n m qu\'
-""".split())
-EN_STOPWORDS = set("""
-the and or of to in on for by with as is are was were be been being a an at from that this these those into over under out up down not no yes can could may might should would will shall it its it's they them their he him his she her we our us you your i me my mine ours yours theirs
-""".split())
+
+def _concat_sections_text(sections: Dict[str, Any], lower: bool = False) -> str:
+    dt = sections_document(sections.get("sections", []))
+    if dt is not None:
+        # Sections adossées au buffer partagé: titres et contenus y sont déjà, dans l'ordre
+        return dt.lower if lower else dt.text
+    text = "\n\n".join([f"## {s['title']}\n{s['content']}" for s in sections.get("sections", [])])
+    return text.lower() if lower else text
+
+
+def _section_terms(sections: Dict[str, Any], doc: Optional[Dict[str, Any]] = None) -> TermFrequencies:
+    """Fréquences des termes des sections: celles du document partagé si possible, sinon recalculées."""
+    dt = sections_document(sections.get("sections", []))
+    if dt is not None:
+        return dt.terms
+    tf = TermFrequencies.from_text(_concat_sections_text(sections, lower=True))
+    if not tf.total and doc:
+        tf = TermFrequencies.from_text(document_text(doc).pages_text(0, 3).lower())
+    return tf
 
 
-def _concat_sections_text(sections: Dict[str, Any]) -> str:
-    return "\n\n".join([f"## {s['title']}\n{s['content']}" for s in sections.get("sections", [])])
+def _keywords(terms: TermFrequencies, n: int, term_index: Optional[TermIndex] = None) -> List[str]:
+    """Mots-clés: TF-IDF contre le corpus indexé si term_index est fourni, sinon fréquences brutes."""
+    if term_index is not None and terms.total:
+        return term_index.keywords(terms, n)
+    return terms.keywords(n)
 
 
-def _extract_article(sections: Dict[str, Any], doc: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+def _sections_prompt_text(sections: Dict[str, Any]) -> str:
+    return "\n\n".join([f"# {s['title']}\n{s['content']}" for s in sections.get("sections", [])])
+
+
+def _extract_article(sections: Dict[str, Any], doc: Optional[Dict[str, Any]] = None, term_index: Optional[TermIndex] = None) -> Dict[str, Any]:
     data = {
         "probleme": None,
         "objectifs": None,
@@ -54,24 +83,72 @@ def _extract_article(sections: Dict[str, Any], doc: Optional[Dict[str, Any]] = N
     
     # Absolute fallback: use document pages text directly
     if not data["probleme"] and doc:
-        pages_text = " ".join([p.get("text", "") for p in doc.get("pages", [])[:2]])
+        pages_text = document_text(doc).pages_text(0, 2)
         if pages_text.strip():
             data["probleme"] = pages_text[:600]
             data["objectifs"] = "Analyse du document (extraction heuristique)"
             data["methodes"] = "Extraction par reconnaissance de structure"
 
-    # naive keywords by frequency
-    all_text = _concat_sections_text(sections).lower()
-    if not all_text and doc:
-        all_text = " ".join([p.get("text", "") for p in doc.get("pages", [])[:3]]).lower()
-    words = [w.strip(".,:;()[]{}\"'!?%") for w in all_text.split()]
-    words = [w for w in words if w and (w not in FR_STOPWORDS) and (w not in EN_STOPWORDS) and len(w) > 3]
-    common = [w for w, _ in Counter(words).most_common(30)]
-    data["mots_cles"] = common[:15]
+    data["mots_cles"] = _keywords(_section_terms(sections, doc), 15, term_index)
     return data
 
 
+# Scanner combiné de _extract_contrat: dates, montants, durées, mots déclencheurs
+# (parties par ligne; obligations, résiliation, pénalités par phrase) et fins de
+# phrase trouvés en une seule passe, dans l'ordre du texte. La ligne d'une partie
+# n'est délimitée (find/rfind) qu'au moment où un mot déclencheur y est trouvé.
+# Équivalent à DATE_PAT, MONTANT_PAT, DUREE_PAT et aux recherches de mots de
+# l'ancienne version, mais écrit pour que le moteur re écarte vite une position:
+# chaque alternative commence par un littéral ou une classe de caractères (les \b
+# de tête deviennent des lookbehind après le premier caractère) et le type de
+# la correspondance est un groupe nommé vide en fin d'alternative. Le texte est
+# parcouru en minuscules (littéraux sans IGNORECASE).
+_AMOUNT_TAIL = r"(?:[.,]\d{2})?\s*(?:€|eur|euro[s]?)\b"
+
+
+def _whole_word(word: str) -> str:
+    return rf"{word}(?<!\w{word})\b"
+
+
+_CONTRAT_ALTERNATIVES = [
+    r"\d(?<!\w\d)(?:\d?[\-/]\d{1,2}[\-/]\d{2,4}|\d{3}-\d{2}-\d{2})\b(?P<date>)",
+    r"\d(?<!\w\d)\d{0,2}(?:[\s.,]\d{3})*" + _AMOUNT_TAIL + "(?P<montant>)",
+    r"\d(?<!\w\d)\d*\s*(?:jour[s]?|mois|année[s]?|an[s]?)\b(?P<duree>)",
+    r"€\s?\b\d{1,3}(?:[\s.,]\d{3})*" + _AMOUNT_TAIL + "(?P<montant_devise>)",
+    r"eur(?:os?)?\s?\b\d{1,3}(?:[\s.,]\d{3})*" + _AMOUNT_TAIL + "(?P<montant_eur>)",
+    *(_whole_word(w) + f"(?P<partie_{i}>)" for i, w in enumerate(
+        ["parties", "entre", "dénommé", "dénomination", "société", "client", "fournisseur"])),
+    *(f"{w}(?P<obligation_{i}>)" for i, w in enumerate(["doit", "s'engage", "obligation", "tenu de"])),
+    *(f"{w}(?P<resiliation_{i}>)" for i, w in enumerate(["résiliation", "résilier"])),
+    *(f"{w}(?P<penalite_{i}>)" for i, w in enumerate(["pénalité", "amende", "dommage"])),
+    r"[.!?]\s+(?P<phrase>)",
+]
+CONTRAT_SCANNER = re.compile("|".join(_CONTRAT_ALTERNATIVES))
+# Repli si text.lower() ne conserve pas les offsets (rares caractères qui changent de longueur)
+_CONTRAT_SCANNER_CI = re.compile("|".join(_CONTRAT_ALTERNATIVES), re.IGNORECASE)
+_SCANNER_KINDS = {name: name.split("_")[0] for name in CONTRAT_SCANNER.groupindex}
+
+# Champ alimenté par la phrase qui contient chaque mot déclencheur
+_SENTENCE_FIELDS = {
+    "obligation": "obligations_principales",
+    "resiliation": "clauses_resiliation",
+    "penalite": "penalites",
+}
+
+
+def _stripped_span(text: str, start: int, end: int) -> List[int]:
+    chunk = text[start:end]
+    lead = len(chunk) - len(chunk.lstrip())
+    return [start + lead, start + lead + len(chunk.strip())]
+
+
 def _extract_contrat(sections: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extraction heuristique d'un contrat en une passe de CONTRAT_SCANNER.
+    data["offsets"] donne, pour chaque valeur extraite, son intervalle
+    [début, fin) dans le texte analysé (le buffer partagé document_text si
+    les sections y sont adossées).
+    """
     data = {
         "parties": [],
         "dates": {"signature": None, "debut": None, "fin": None},
@@ -81,55 +158,78 @@ def _extract_contrat(sections: Dict[str, Any]) -> Dict[str, Any]:
         "clauses_resiliation": [],
         "penalites": [],
     }
+    offsets: Dict[str, Any] = {
+        "parties": [],
+        "dates": {"signature": None, "debut": None, "fin": None},
+        "duree": None,
+        "montants": [],
+        "obligations_principales": [],
+        "clauses_resiliation": [],
+        "penalites": [],
+    }
     text = _concat_sections_text(sections)
+    low = _concat_sections_text(sections, lower=True)
+    scan = CONTRAT_SCANNER.finditer(low) if len(low) == len(text) else _CONTRAT_SCANNER_CI.finditer(text)
+    date_slots = list(data["dates"])
+    num_dates = 0
+    seen_montants: set = set()
+    last_line = -1
+    sentence_start = 0
+    sentence_fields: List[str] = []
+
+    def close_sentence(end: int) -> None:
+        span = _stripped_span(text, sentence_start, end)
+        sentence = text[span[0]:span[1]]
+        for field in sentence_fields:
+            data[field].append(sentence)
+            offsets[field].append(span)
 
-    # Parties: heuristics - lines near keywords
-    parties = []
-    for line in text.splitlines():
-        if re.search(r"\b(parties|entre|dénommé|dénomination|société|client|fournisseur)\b", line, re.IGNORECASE):
-            parties.append(line.strip())
-    data["parties"] = parties[:5]
-
-    # Dates
-    dates = DATE_PAT.findall(text)
-    if dates:
-        # naive mapping
-        if len(dates) >= 1:
-            data["dates"]["signature"] = dates[0]
-        if len(dates) >= 2:
-            data["dates"]["debut"] = dates[1]
-        if len(dates) >= 3:
-            data["dates"]["fin"] = dates[2]
-
-    # Durée
-    m = DUREE_PAT.search(text)
-    if m:
-        data["duree"] = m.group(1)
-
-    # Montants
-    data["montants"] = list({m.group(0) for m in MONTANT_PAT.finditer(text)})[:10]
-
-    # Obligations / résiliation / pénalités (collect sentences)
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    for s in sentences:
-        low = s.lower()
-        if any(k in low for k in ["doit", "s'engage", "obligation", "tenu de"]):
-            data["obligations_principales"].append(s.strip())
-        if "résiliation" in low or "résilier" in low:
-            data["clauses_resiliation"].append(s.strip())
-        if any(k in low for k in ["pénalité", "pénalités", "amende", "dommage"]):
-            data["penalites"].append(s.strip())
+    for m in scan:
+        kind = _SCANNER_KINDS[m.lastgroup]
+        start, end = m.span()
+        if kind == "date":
+            if num_dates < 3:
+                data["dates"][date_slots[num_dates]] = text[start:end]
+                offsets["dates"][date_slots[num_dates]] = [start, end]
+                num_dates += 1
+        elif kind == "montant":
+            value = text[start:end]
+            if value not in seen_montants and len(seen_montants) < 10:
+                seen_montants.add(value)
+                data["montants"].append(value)
+                offsets["montants"].append([start, end])
+        elif kind == "duree":
+            if data["duree"] is None:
+                data["duree"] = text[start:end]
+                offsets["duree"] = [start, end]
+        elif kind == "partie":
+            line_start = text.rfind("\n", 0, start) + 1
+            if line_start != last_line and len(data["parties"]) < 5:
+                last_line = line_start
+                line_end = text.find("\n", end)
+                span = _stripped_span(text, line_start, line_end if line_end >= 0 else len(text))
+                data["parties"].append(text[span[0]:span[1]])
+                offsets["parties"].append(span)
+        elif kind in _SENTENCE_FIELDS:
+            field = _SENTENCE_FIELDS[kind]
+            if field not in sentence_fields:
+                sentence_fields.append(field)
+        elif kind == "phrase":
+            if sentence_fields:
+                close_sentence(start + 1)
+                sentence_fields = []
+            sentence_start = end
 
+    if sentence_fields:
+        close_sentence(len(text))
+    data["offsets"] = offsets
     return data
 
 
-def _extract_autre(sections: Dict[str, Any]) -> Dict[str, Any]:
+def _extract_autre(sections: Dict[str, Any], term_index: Optional[TermIndex] = None) -> Dict[str, Any]:
     # Basic summary of sections and top keywords
     titles = [s.get("title", "").strip() for s in sections.get("sections", [])]
-    text = _concat_sections_text(sections).lower()
-    words = [w.strip(".,:;()[]{}\"'!?%") for w in text.split()]
-    words = [w for w in words if w and (w not in FR_STOPWORDS) and (w not in EN_STOPWORDS) and len(w) > 3]
-    common = [w for w, _ in Counter(words).most_common(40)]
+    common = _keywords(_section_terms(sections), 20, term_index)
     return {
         "sections_principales": titles[:10],
         "points_cles": common[:15],
@@ -137,14 +237,205 @@ def _extract_autre(sections: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def extract_information(doc: Dict[str, Any], sections: Dict[str, Any], use_llm: bool = False, model: Optional[str] = None) -> Dict[str, Any]:
+CONTRAT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "parties": {"type": "array", "items": {"type": "string"}},
+        "dates": {
+            "type": "object",
+            "properties": {
+                "signature": {"type": ["string", "null"]},
+                "debut": {"type": ["string", "null"]},
+                "fin": {"type": ["string", "null"]},
+            },
+            "required": ["signature", "debut", "fin"],
+        },
+        "duree": {"type": ["string", "null"]},
+        "montants": {"type": "array", "items": {"type": "string"}},
+        "obligations_principales": {"type": "array", "items": {"type": "string"}},
+        "clauses_resiliation": {"type": "array", "items": {"type": "string"}},
+        "penalites": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["parties", "dates"],
+}
+
+AUTRE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sections_principales": {"type": "array", "items": {"type": "string"}},
+        "points_cles": {"type": "array", "items": {"type": "string"}},
+        "mots_cles": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["sections_principales"],
+}
+
+# Extraction LLM "groups" (par défaut): les champs sont répartis en groupes
+# interrogés en parallèle, chacun avec les seules sections pertinentes; un groupe
+# en échec est relancé LLM_GROUP_RETRIES fois puis rempli par les heuristiques.
+# "single" garde l'ancienne requête unique (tout le texte, tous les champs).
+LLM_EXTRACTION_MODE = os.environ.get("LLM_EXTRACTION_MODE", "groups")
+LLM_EXTRACTION_WORKERS = int(os.environ.get("LLM_EXTRACTION_WORKERS", "4"))
+# Budget de texte des sections envoyées pour un groupe
+LLM_GROUP_MAX_CHARS = 8000
+LLM_GROUP_RETRIES = 1
+
+# Clés de métadonnées ajoutées au résultat (hors champs extraits)
+EXTRACTION_META_KEYS = ("offsets", "sources")
+
+# keywords: sections retenues pour le groupe (titre x3 + contenu); None = toutes
+# les sections dans l'ordre; "titles": liste des titres seulement.
+CONTRAT_FIELD_GROUPS: Dict[str, Dict[str, Any]] = {
+    "parties_dates": {
+        "fields": ("parties", "dates"),
+        "keywords": re.compile(r"parties|entre|soussign|dénomm|société|client|fournisseur|signé|prend effet|\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}", re.IGNORECASE),
+        "instructions": "parties: les parties au contrat (nom et rôle). dates: signature, début et fin du contrat (null si absente).",
+    },
+    "montants_duree": {
+        "fields": ("montants", "duree"),
+        "keywords": re.compile(r"prix|paiement|montant|rémunération|honoraires|factur|€|\beur|durée|reconduction|\d+\s*(?:jours?|mois|ans?)\b", re.IGNORECASE),
+        "instructions": "montants: sommes d'argent citées, avec leur devise. duree: durée du contrat (null si absente).",
+    },
+    "clauses": {
+        "fields": ("obligations_principales", "clauses_resiliation", "penalites"),
+        "keywords": re.compile(r"obligation|s'engage|doit|tenu de|résili|pénalit|amende|dommage|responsabilit", re.IGNORECASE),
+        "instructions": "Une phrase courte par clause: obligations principales, conditions de résiliation, pénalités.",
+    },
+}
+
+AUTRE_FIELD_GROUPS: Dict[str, Dict[str, Any]] = {
+    "structure": {
+        "fields": ("sections_principales",),
+        "keywords": "titles",
+        "instructions": "sections_principales: les titres des sections principales, dans l'ordre.",
+    },
+    "points_cles": {
+        "fields": ("points_cles", "mots_cles"),
+        "keywords": None,
+        "instructions": "points_cles: idées essentielles du document. mots_cles: termes caractéristiques (pas de mots vides).",
+    },
+}
+
+
+def _group_schema(schema: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {f: schema["properties"][f] for f in fields},
+        "required": list(fields),
+    }
+
+
+def _group_text(sections: Dict[str, Any], keywords: Any, max_chars: int = LLM_GROUP_MAX_CHARS) -> str:
+    """Sections pertinentes pour un groupe de champs, dans l'ordre du document, dans la limite de max_chars."""
+    secs = sections.get("sections", [])
+    if keywords == "titles":
+        return "\n".join(f"- {s.get('title', '')}" for s in secs)[:max_chars]
+    blocks = [f"# {s.get('title', '')}\n{s.get('content', '')}" for s in secs]
+    if keywords is None:
+        order = list(range(len(blocks)))
+    else:
+        scores = [3 * len(keywords.findall(s.get("title", ""))) + len(keywords.findall(b)) for s, b in zip(secs, blocks)]
+        order = sorted((i for i, sc in enumerate(scores) if sc), key=lambda i: -scores[i]) or list(range(len(blocks)))
+    chosen: List[int] = []
+    size = 0
+    for i in order:
+        if size + len(blocks[i]) > max_chars:
+            if chosen:
+                continue
+            blocks[i] = blocks[i][:max_chars]
+        chosen.append(i)
+        size += len(blocks[i])
+    return "\n\n".join(blocks[i] for i in sorted(chosen))
+
+
+def _llm_group(
+    name: str,
+    group: Dict[str, Any],
+    sections: Dict[str, Any],
+    schema: Dict[str, Any],
+    system: str,
+    model: Optional[str],
+) -> Optional[Dict[str, Any]]:
+    sub_schema = _group_schema(schema, group["fields"])
+    prompt = (
+        f"Extrait en JSON strict les champs {', '.join(group['fields'])} selon ce schéma:\n"
+        f"{json.dumps(sub_schema, ensure_ascii=False)}\n"
+        f"{group['instructions']}\n\n"
+        f"Sections:\n{_group_text(sections, group['keywords'])}"
+    )
+    return chat_json_schema(prompt, schema=sub_schema, system=f"{system} ({name})", model=model)
+
+
+def _extract_by_groups(
+    groups: Dict[str, Dict[str, Any]],
+    sections: Dict[str, Any],
+    schema: Dict[str, Any],
+    system: str,
+    model: Optional[str],
+    heuristic: Callable[[], Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Requêtes LLM concurrentes, une par groupe de champs; les groupes en échec
+    sont relancés puis remplis par heuristic(). data["sources"] indique pour
+    chaque groupe "llm" ou "heuristique"; data["offsets"] (si l'heuristique en
+    fournit) ne garde que les champs venus de l'heuristique.
+    """
+    def run(name: str) -> Optional[Dict[str, Any]]:
+        # Relance immédiate d'un groupe en échec, sans attendre les autres
+        for _ in range(1 + LLM_GROUP_RETRIES):
+            r = _llm_group(name, groups[name], sections, schema, system, model)
+            if r is not None:
+                return r
+        return None
+
+    workers = max(1, min(LLM_EXTRACTION_WORKERS, len(groups)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Une copie du contexte par tâche: routage des appels LLM (llm_client.route_sync_calls)
+        futures = [pool.submit(contextvars.copy_context().run, run, name) for name in groups]
+        results = {name: f.result() for name, f in zip(groups, futures)}
+    failed = [name for name, r in results.items() if r is None]
+    log.info("Extraction LLM par groupes: %d/%d groupes aboutis", len(groups) - len(failed), len(groups))
+
+    data: Dict[str, Any] = {}
+    fallback = heuristic() if failed else {}
+    for name, group in groups.items():
+        source = results[name] if results[name] is not None else fallback
+        for field in group["fields"]:
+            data[field] = source.get(field)
+    offsets = fallback.get("offsets")
+    if offsets is not None:
+        heuristic_fields = {f for name in failed for f in groups[name]["fields"]}
+        data["offsets"] = {f: v for f, v in offsets.items() if f in heuristic_fields}
+    data["sources"] = {name: "heuristique" if results[name] is None else "llm" for name in groups}
+    return data
+
+
+def extract_information(
+    doc: Dict[str, Any],
+    sections: Dict[str, Any],
+    use_llm: bool = False,
+    model: Optional[str] = None,
+    term_index: Optional[TermIndex] = None,
+) -> Dict[str, Any]:
+    """
+    Informations clés selon le type du document (LLM si demandé, sinon heuristiques).
+    Contrats et documents génériques avec le LLM: requêtes par groupe de champs
+    en parallèle (LLM_EXTRACTION_MODE="groups", voir _extract_by_groups).
+    term_index: index du corpus (app.term_index); les mots-clés heuristiques sont
+    alors classés en TF-IDF plutôt qu'en fréquence brute.
+    Avec use_llm, "sources" indique par groupe de champs (ou "document" pour une
+    requête unique) si la valeur vient du "llm" ou du repli "heuristique".
+    """
     t = doc.get("document_type", "autre")
 
     # Optional LLM-based extraction
     if use_llm and llm_ready():
-        joined = "\n\n".join([f"# {s['title']}\n{s['content']}" for s in sections.get("sections", [])])
         if t == "article_scientifique":
             return extract_information_for_article(sections, model=model)
+        if LLM_EXTRACTION_MODE == "groups":
+            if t == "contrat":
+                return _extract_by_groups(CONTRAT_FIELD_GROUPS, sections, CONTRAT_SCHEMA, "Extraction contrat", model, lambda: _extract_contrat(sections))
+            return _extract_by_groups(AUTRE_FIELD_GROUPS, sections, AUTRE_SCHEMA, "Extraction générique", model, lambda: _extract_autre(sections, term_index))
+        joined = _sections_prompt_text(sections)
         if t == "article_scientifique":
             prompt = (
                 "Extrait en JSON strict: {\n  \"probleme\": string|null, \n  \"objectifs\": string|null, \n  \"methodes\": string|null, \n  \"resultats_principaux\": string|null, \n  \"conclusion\": string|null, \n  \"mots_cles\": [string]\n}\n\n"
@@ -165,62 +456,40 @@ def extract_information(doc: Dict[str, Any], sections: Dict[str, Any], use_llm:
             data = chat_json_schema(prompt, schema=schema, system="Extraction article scientifique", model=model)
             if isinstance(data, dict) and data:
                 data.setdefault("mots_cles", [])
+                data["sources"] = {"document": "llm"}
                 return data
         elif t == "contrat":
             prompt = (
                 "Extrait en JSON strict: {\n  \"parties\": [string], \n  \"dates\": {\n    \"signature\": string|null, \n    \"debut\": string|null, \n    \"fin\": string|null\n  }, \n  \"duree\": string|null, \n  \"montants\": [string], \n  \"obligations_principales\": [string], \n  \"clauses_resiliation\": [string], \n  \"penalites\": [string]\n}\n\n"
                 f"Sections:\n{joined}"
             )
-            schema = {
-                "type": "object",
-                "properties": {
-                    "parties": {"type": "array", "items": {"type": "string"}},
-                    "dates": {
-                        "type": "object",
-                        "properties": {
-                            "signature": {"type": ["string", "null"]},
-                            "debut": {"type": ["string", "null"]},
-                            "fin": {"type": ["string", "null"]},
-                        },
-                        "required": ["signature", "debut", "fin"],
-                    },
-                    "duree": {"type": ["string", "null"]},
-                    "montants": {"type": "array", "items": {"type": "string"}},
-                    "obligations_principales": {"type": "array", "items": {"type": "string"}},
-                    "clauses_resiliation": {"type": "array", "items": {"type": "string"}},
-                    "penalites": {"type": "array", "items": {"type": "string"}},
-                },
-                "required": ["parties", "dates"],
-            }
-            data = chat_json_schema(prompt, schema=schema, system="Extraction contrat", model=model)
+            data = chat_json_schema(prompt, schema=CONTRAT_SCHEMA, system="Extraction contrat", model=model)
             if isinstance(data, dict) and data:
                 data.setdefault("dates", {"signature": None, "debut": None, "fin": None})
                 for k in ["parties", "montants", "obligations_principales", "clauses_resiliation", "penalites"]:
                     data.setdefault(k, [])
+                data["sources"] = {"document": "llm"}
                 return data
         else:
             prompt = (
                 "Extrait en JSON strict: {\n  \"sections_principales\": [string], \n  \"points_cles\": [string], \n  \"mots_cles\": [string]\n}\n\n"
                 f"Sections:\n{joined}"
             )
-            schema = {
-                "type": "object",
-                "properties": {
-                    "sections_principales": {"type": "array", "items": {"type": "string"}},
-                    "points_cles": {"type": "array", "items": {"type": "string"}},
-                    "mots_cles": {"type": "array", "items": {"type": "string"}},
-                },
-                "required": ["sections_principales"],
-            }
-            data = chat_json_schema(prompt, schema=schema, system="Extraction générique", model=model)
+            data = chat_json_schema(prompt, schema=AUTRE_SCHEMA, system="Extraction générique", model=model)
             if isinstance(data, dict) and data:
                 for k in ["sections_principales", "points_cles", "mots_cles"]:
                     data.setdefault(k, [])
+                data["sources"] = {"document": "llm"}
                 return data
 
     # Fallback heuristic
     if t == "article_scientifique":
-        return _extract_article(sections, doc)
-    if t == "contrat":
-        return _extract_contrat(sections)
-    return _extract_autre(sections)
+        data = _extract_article(sections, doc, term_index)
+    elif t == "contrat":
+        data = _extract_contrat(sections)
+    else:
+        data = _extract_autre(sections, term_index)
+    if use_llm:
+        # LLM demandé mais non configuré ou sans réponse
+        data["sources"] = {"document": "heuristique"}
+    return data
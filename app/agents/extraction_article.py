@@ -25,12 +25,9 @@ def extract_information_for_article(sections: Dict[str, Any], model: Optional[st
     Utilise le LLM pour extraire un canevas enrichi pour articles scientifiques.
     Retourne un dictionnaire conforme à ARTICLE_SCHEMA. Fallback minimal si LLM indisponible.
     """
-    joined = []
-    for s in sections.get("sections", []):
-        title = s.get("title", "")
-        content = s.get("content", "")
-        joined.append(f"[SECTION: {title}]\n{content}")
-    sections_text = "\n\n".join(joined)
+    sections_text = "\n\n".join(
+        f"[SECTION: {s.get('title', '')}]\n{s.get('content', '')}" for s in sections.get("sections", [])
+    )
 
     if llm_ready() and sections_text.strip():
         sys = (
@@ -45,6 +42,7 @@ def extract_information_for_article(sections: Dict[str, Any], model: Optional[st
         )
         data = chat_json_schema(prompt, schema=ARTICLE_SCHEMA, system=sys, model=model)
         if isinstance(data, dict):
+            data["sources"] = {"document": "llm"}
             return data
 
     # Fallback minimal
@@ -57,4 +55,5 @@ def extract_information_for_article(sections: Dict[str, Any], model: Optional[st
         "resultats_principaux": "inconnu",
         "conclusions": "inconnu",
         "mots_cles": [],
+        "sources": {"document": "heuristique"},
     }
@@ -1,30 +1,477 @@
 from __future__ import annotations
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
 from pypdf import PdfReader
+import io
+import math
+import mmap
+import multiprocessing
 import os
+import re
+import time
+import weakref
 
+try:
+    import resource
+except ImportError:  # Windows: pas de plafond mémoire, seuls les délais s'appliquent
+    resource = None
 
-def ingest_pdf(file_path: str) -> Dict[str, Any]:
+# En dessous de ce nombre de pages par worker, le pool coûte plus qu'il ne rapporte
+MIN_PAGES_PER_WORKER = 16
+
+# Mise en page (layout=True): seules les lignes assez courtes pour être des titres gardent leur style
+LAYOUT_MAX_LINE_CHARS = 120
+BOLD_FONT_RE = re.compile(r"bold|black|heavy|demi|semibold", re.IGNORECASE)
+
+_WORKER_READER: Optional[PdfReader] = None
+_WORKER_LAYOUT = False
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class PdfBuffer(NamedTuple):
+    """PDF déjà en mémoire (ex: upload Streamlit), analysé sans écriture sur disque."""
+    name: str
+    data: BytesLike
+
+
+PdfSource = Union[str, "os.PathLike[str]", PdfBuffer, BytesLike]
+
+
+class _BufferStream(io.RawIOBase):
+    """Flux en lecture seule sur un buffer existant, sans copie du contenu."""
+
+    def __init__(self, data: BytesLike):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        out = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return out
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def source_name(source: PdfSource) -> str:
+    if isinstance(source, PdfBuffer):
+        return source.name
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return "document.pdf"
+    return os.path.basename(source)
+
+
+def source_path(source: PdfSource) -> Optional[str]:
+    if isinstance(source, (PdfBuffer, bytes, bytearray, memoryview)):
+        return None
+    return os.fspath(source)
+
+
+def open_reader(source: PdfSource) -> PdfReader:
     """
-    Lit un PDF et extrait le texte page par page.
-    Retourne un dict: { filename, num_pages, pages: [ {page_number, text} ] }
+    Ouvre un PdfReader sans recopier le document: un chemin est projeté en
+    mémoire (mmap, pages chargées à la demande par l'OS), un buffer est lu sur place.
+    pypdf, lui, recopierait tout le fichier dans un BytesIO.
+    La projection verrouille le fichier sous Windows: close_reader() la ferme
+    dès que le reader ne sert plus, sinon elle est fermée quand il est libéré.
+    """
+    if isinstance(source, PdfBuffer):
+        source = source.data
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return PdfReader(_BufferStream(source))
+    with open(source, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        reader = PdfReader(mapped)
+    except Exception:
+        mapped.close()
+        raise
+    weakref.finalize(reader, mapped.close)
+    return reader
+
+
+def close_reader(reader: Optional[PdfReader]) -> None:
+    """Ferme le fichier projeté d'un reader d'open_reader (sans effet pour un buffer)."""
+    stream = getattr(reader, "stream", None)
+    if isinstance(stream, mmap.mmap):
+        stream.close()
+
+
+class LazyPages(Sequence):
+    """
+    Pages d'un PDF dont le texte n'est extrait qu'au premier accès, puis mémorisé.
+    Se comporte comme la liste [{page_number, text}] d'ingest_pdf; un pickle
+    (pool de processus) la matérialise en liste ordinaire.
+    Le fichier reste projeté tant que des pages peuvent être lues: close() (ou
+    with LazyPages(...)) le ferme, sinon il l'est quand l'objet est libéré.
+    Après fermeture, une page jamais lue a un texte vide.
+    """
+
+    def __init__(self, reader: PdfReader):
+        self._reader = reader
+        self._texts: List[Optional[str]] = [None] * len(reader.pages)
+        # Le reader garde des cycles (pages -> reader): fermeture liée à LazyPages, libérée sans attendre le gc
+        self._close = weakref.finalize(self, close_reader, reader)
+
+    def close(self) -> None:
+        self._close()
+
+    def __enter__(self) -> "LazyPages":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def text(self, index: int) -> str:
+        t = self._texts[index]
+        if t is None:
+            if not self._close.alive:
+                return ""
+            try:
+                t = self._reader.pages[index].extract_text() or ""
+            except Exception:
+                t = ""
+            self._texts[index] = t
+        return t
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return {"page_number": index + 1, "text": self.text(index)}
+
+    @property
+    def extracted(self) -> int:
+        """Nombre de pages dont le texte a déjà été extrait."""
+        return sum(1 for t in self._texts if t is not None)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [self[i] for i in range(len(self))]
+
+    def __reduce__(self):
+        return (list, (self.to_list(),))
+
+
+LineStyle = List[Any]  # [texte, taille de police, gras]
+
+
+def extract_page(page, layout: bool = False) -> Tuple[str, Optional[List[LineStyle]]]:
     """
-    reader = PdfReader(file_path)
-    pages: List[Dict[str, Any]] = []
-    for i, page in enumerate(reader.pages, start=1):
+    Texte d'une page; avec layout=True, aussi le style [texte, taille, gras] de
+    chaque ligne, relevé par le visitor de pypdf pendant le même extract_text.
+    """
+    if not layout:
+        return page.extract_text() or "", None
+
+    lines: List[LineStyle] = []
+    fragments: List[Tuple[str, float, bool]] = []
+
+    def flush() -> None:
+        text = "".join(t for t, _, _ in fragments).strip()
+        if text:
+            # Style dominant de la ligne, pondéré par le nombre de caractères
+            size = max(fragments, key=lambda f: len(f[0]))[1]
+            bold_chars = sum(len(t) for t, _, b in fragments if b)
+            lines.append([text, round(size, 1), bold_chars * 2 > sum(len(t) for t, _, _ in fragments)])
+        fragments.clear()
+
+    def visit(text, cm, tm, font_dict, font_size) -> None:
+        if not text:
+            return
+        scale = (math.hypot(tm[2], tm[3]) or 1.0) * (math.hypot(cm[2], cm[3]) or 1.0)
+        name = str(font_dict.get("/BaseFont", "")) if font_dict else ""
+        bold = bool(BOLD_FONT_RE.search(name))
+        parts = text.split("\n")
+        for k, part in enumerate(parts):
+            if part:
+                fragments.append((part, abs(font_size * scale), bold))
+            if k < len(parts) - 1:
+                flush()
+
+    text = page.extract_text(visitor_text=visit) or ""
+    flush()
+    return text, lines
+
+
+def build_layout(page_lines: List[Optional[List[LineStyle]]]) -> Dict[str, Any]:
+    """
+    Résumé de mise en page du document: taille et graisse du corps de texte
+    (les plus fréquentes en caractères) et, par page, le style des lignes courtes.
+    """
+    sizes: Counter = Counter()
+    bold_chars = total = 0
+    for lines in page_lines:
+        for text, size, bold in lines or []:
+            sizes[size] += len(text)
+            total += len(text)
+            bold_chars += len(text) if bold else 0
+    return {
+        "body_size": sizes.most_common(1)[0][0] if sizes else None,
+        "body_bold": total > 0 and bold_chars * 2 > total,
+        "pages": [[line for line in lines or [] if len(line[0]) <= LAYOUT_MAX_LINE_CHARS] for lines in page_lines],
+    }
+
+
+def _init_worker(file_path: str, layout: bool = False) -> None:
+    # Chaque worker ouvre le fichier lui-même: le document n'est jamais picklé
+    global _WORKER_READER, _WORKER_LAYOUT
+    _WORKER_READER = open_reader(file_path)
+    _WORKER_LAYOUT = layout
+
+
+def _extract_range(bounds: Tuple[int, int]) -> List[Tuple[str, Optional[List[LineStyle]]]]:
+    assert _WORKER_READER is not None
+    out = []
+    for i in range(*bounds):
         try:
-            text = page.extract_text() or ""
+            out.append(extract_page(_WORKER_READER.pages[i], _WORKER_LAYOUT))
         except Exception:
-            text = ""
-        pages.append({"page_number": i, "text": text})
+            out.append(("", [] if _WORKER_LAYOUT else None))
+    return out
 
-    return {
-        "filename": os.path.basename(file_path),
-        "path": file_path,
+
+def _extract_parallel(file_path: str, num_pages: int, workers: int, layout: bool = False) -> List[Tuple[str, Optional[List[LineStyle]]]]:
+    # Plusieurs petits lots par worker pour équilibrer les pages lourdes
+    step = max(1, -(-num_pages // (workers * 4)))
+    ranges = [(start, min(start + step, num_pages)) for start in range(0, num_pages, step)]
+    pages: List[Tuple[str, Optional[List[LineStyle]]]] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(file_path, layout)) as pool:
+        for chunk in pool.map(_extract_range, ranges):
+            pages.extend(chunk)
+    return pages
+
+
+def _extract_sequential(reader: PdfReader, layout: bool) -> List[Tuple[str, Optional[List[LineStyle]]]]:
+    out = []
+    for page in reader.pages:
+        try:
+            out.append(extract_page(page, layout))
+        except Exception:
+            out.append(("", [] if layout else None))
+    return out
+
+
+def ingest_pdf(file_path: PdfSource, lazy: bool = False, workers: Optional[int] = None, layout: bool = False) -> Dict[str, Any]:
+    """
+    Lit un PDF et extrait le texte page par page.
+    Retourne un dict: { filename, num_pages, pages: [ {page_number, text} ] }
+    file_path peut être un chemin, un PdfBuffer(name, data) ou directement des
+    bytes/memoryview: le contenu est lu via mmap ou sur place, jamais recopié.
+    Avec lazy=True, pages est une LazyPages: seul le texte des pages réellement lues est extrait.
+    Avec workers > 1, les pages sont réparties par plages sur un pool de processus
+    (l'ordre des pages est conservé); ignoré si lazy ou pour un buffer.
+    Avec layout=True (incompatible avec lazy), doc["layout"] donne la taille et la
+    graisse des lignes (voir build_layout), pour repérer les titres.
+    """
+    reader = open_reader(file_path)
+    path = source_path(file_path)
+    pages: Sequence[Dict[str, Any]] = LazyPages(reader)
+    doc_layout = None
+    if not lazy or layout:
+        n = len(pages)
+        workers = min(workers or 1, n // MIN_PAGES_PER_WORKER) if path else 1
+        if workers > 1:
+            extracted = _extract_parallel(path, n, workers, layout)
+        elif layout:
+            extracted = _extract_sequential(reader, layout)
+        else:
+            extracted = None
+            pages = pages.to_list()
+        if extracted is not None:
+            pages = [{"page_number": i, "text": t} for i, (t, _) in enumerate(extracted, start=1)]
+            if layout:
+                doc_layout = build_layout([lines for _, lines in extracted])
+        # Tout le texte est extrait: le fichier n'a plus à rester projeté
+        close_reader(reader)
+
+    doc = {
+        "filename": source_name(file_path),
+        "path": path,
         "num_pages": len(pages),
         "pages": pages,
     }
+    if doc_layout is not None:
+        doc["layout"] = doc_layout
+    return doc
+
+
+def _address_space_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _guarded_worker(conn, source: PdfSource, max_memory_mb: Optional[int], layout: bool = False) -> None:
+    reader = None
+    try:
+        if max_memory_mb and resource is not None:
+            # Plafond relatif à l'espace déjà hérité du parent (fork)
+            limit = _address_space_bytes() + max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        reader = open_reader(source)
+        conn.send(("count", len(reader.pages)))
+        for page in reader.pages:
+            try:
+                content = extract_page(page, layout)
+            except MemoryError:
+                raise
+            except Exception:
+                content = ("", [] if layout else None)
+            conn.send(("page", content))
+        conn.send(("done", None))
+    except MemoryError:
+        conn.send(("error", f"mémoire dépassée (> {max_memory_mb} Mo)"))
+    except Exception as e:
+        conn.send(("error", str(e) or e.__class__.__name__))
+    finally:
+        close_reader(reader)
+        conn.close()
+
+
+def ingest_pdf_guarded(
+    file_path: PdfSource,
+    timeout: Optional[float] = None,
+    page_timeout: Optional[float] = None,
+    max_memory_mb: Optional[int] = None,
+    layout: bool = False,
+) -> Dict[str, Any]:
+    """
+    Comme ingest_pdf, mais l'extraction tourne dans un sous-processus soumis à un
+    délai global (timeout), un délai par page (page_timeout, secondes) et un
+    plafond mémoire (max_memory_mb, POSIX). Si une limite est atteinte, le
+    processus est tué et les pages déjà extraites sont conservées:
+    doc["ingestion_status"] = {complete, reason, pages_read, pages_total}.
+    Lève RuntimeError si aucune page n'a pu être lue.
+    """
+    ctx = multiprocessing.get_context()
+    if ctx.get_start_method() != "fork":
+        if isinstance(file_path, PdfBuffer) and isinstance(file_path.data, memoryview):
+            file_path = PdfBuffer(file_path.name, file_path.data.tobytes())
+        elif isinstance(file_path, memoryview):
+            file_path = file_path.tobytes()
+
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_guarded_worker, args=(send_conn, file_path, max_memory_mb, layout), daemon=True)
+    proc.start()
+    send_conn.close()
+
+    deadline = time.monotonic() + timeout if timeout else None
+    texts: List[str] = []
+    page_lines: List[Optional[List[LineStyle]]] = []
+    total: Optional[int] = None
+    reason: Optional[str] = None
+    try:
+        while True:
+            wait = page_timeout
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                wait = remaining if wait is None else min(wait, remaining)
+            if not recv_conn.poll(wait):
+                if deadline is not None and time.monotonic() >= deadline:
+                    reason = f"délai du document dépassé ({timeout:g}s)"
+                elif total is None:
+                    reason = f"délai dépassé à l'ouverture du document ({page_timeout:g}s)"
+                else:
+                    reason = f"délai dépassé sur la page {len(texts) + 1} ({page_timeout:g}s)"
+                break
+            try:
+                kind, value = recv_conn.recv()
+            except EOFError:
+                proc.join(1)
+                reason = f"processus d'extraction interrompu (code {proc.exitcode})"
+                break
+            if kind == "count":
+                total = value
+            elif kind == "page":
+                texts.append(value[0])
+                page_lines.append(value[1])
+            elif kind == "error":
+                reason = value
+                break
+            else:
+                break
+    finally:
+        recv_conn.close()
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+
+    if reason and not texts:
+        raise RuntimeError(reason)
+
+    doc = {
+        "filename": source_name(file_path),
+        "path": source_path(file_path),
+        "num_pages": len(texts),
+        "pages": [{"page_number": i, "text": t} for i, t in enumerate(texts, start=1)],
+        "ingestion_status": {
+            "complete": reason is None,
+            "reason": reason,
+            "pages_read": len(texts),
+            "pages_total": total,
+        },
+    }
+    if layout:
+        doc["layout"] = build_layout(page_lines)
+    return doc
+
+
+def ingest_pdfs(file_paths: List[PdfSource], lazy: bool = False, workers: Optional[int] = None, layout: bool = False) -> List[Dict[str, Any]]:
+    return [ingest_pdf(p, lazy=lazy, workers=workers, layout=layout) for p in file_paths]
 
 
-def ingest_pdfs(file_paths: List[str]) -> List[Dict[str, Any]]:
-    return [ingest_pdf(p) for p in file_paths]
+def iter_page_texts(
+    doc: Dict[str, Any],
+    max_chars: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    skip_empty: bool = True,
+) -> Iterator[Tuple[Any, str]]:
+    """
+    Parcourt (page_number, text) en s'arrêtant dès que le budget est atteint:
+    au plus max_pages pages lues et max_chars caractères rendus (la dernière page
+    est tronquée). Les pages au-delà du budget ne sont jamais extraites.
+    """
+    pages = doc.get("pages", [])
+    n = len(pages) if max_pages is None else min(max_pages, len(pages))
+    total = 0
+    for i in range(n):
+        page = pages[i]
+        t = page.get("text", "")
+        if skip_empty and not t:
+            continue
+        if max_chars is not None and total + len(t) > max_chars:
+            t = t[: max(0, max_chars - total)]
+        yield page.get("page_number"), t
+        total += len(t)
+        if max_chars is not None and total >= max_chars:
+            break
@@ -2,24 +2,34 @@ from __future__ import annotations
 from typing import Dict, Any, List
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
 import os
 import datetime as dt
 import io
 import base64
+import uuid
+from xml.sax.saxutils import escape
 
 
 def _p(text: str, styles):
     return Paragraph(text.replace("\n", "<br/>"), styles["BodyText"]) 
 
 
+def _quote(quote: Dict[str, Any], styles, label: str = "p."):
+    # Citation issue de la vérification: phrase autour du passage, extrait exact en gras
+    style = ParagraphStyle("Citation", parent=styles["BodyText"], leftIndent=18, fontSize=8, leading=10, textColor=colors.HexColor("#444444"))
+    before, match, after = (" ".join(escape(quote.get(k, "")).split()) for k in ("before", "match", "after"))
+    return Paragraph(f"<i>« {before} <b>{match}</b> {after} »</i> ({label} {quote.get('page')})", style)
+
+
 def build_report(doc: Dict[str, Any], out_dir: str = "reports/generated") -> str:
     os.makedirs(out_dir, exist_ok=True)
     base = os.path.splitext(os.path.basename(doc.get("filename", "rapport")))[0]
     ts = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_path = os.path.join(out_dir, f"rapport_{base}_{ts}.pdf")
+    # Suffixe aléatoire: deux analyses du même fichier dans la même seconde (workers) ne s'écrasent pas
+    out_path = os.path.join(out_dir, f"rapport_{base}_{ts}_{uuid.uuid4().hex[:8]}.pdf")
 
     styles = getSampleStyleSheet()
     story: List[Any] = []
@@ -32,6 +42,14 @@ def build_report(doc: Dict[str, Any], out_dir: str = "reports/generated") -> str
     story.append(_p(f"Type détecté: <b>{doc.get('document_type')}</b>", styles))
     story.append(_p(f"Pages: <b>{doc.get('num_pages')}</b>", styles))
     story.append(_p(f"Date d'analyse: <b>{dt.datetime.now().strftime('%Y-%m-%d %H:%M')}</b>", styles))
+    dup = doc.get("near_duplicate")
+    if dup:
+        changed = ", ".join(map(str, dup["diff"]["changed_pages"])) or "aucune"
+        story.append(_p(
+            f"Quasi-doublon de: <b>{escape(str(dup['filename']))}</b> (similarité {dup['similarity']:.0%}, pages modifiées: {changed}, "
+            f"résultats repris: {', '.join(dup.get('reused_stages', [])) or 'aucun'})",
+            styles,
+        ))
     story.append(Spacer(1, 16))
 
     # Résumé
@@ -42,19 +60,26 @@ def build_report(doc: Dict[str, Any], out_dir: str = "reports/generated") -> str
 
     # Points clés
     kp = synth.get("key_points", [])
+    ver = doc.get("verification", {})
+    akp = ver.get("annotated_key_points", [])
     if kp:
         story.append(Paragraph("<b>Points clés</b>", styles["Heading2"]))
-        for p in kp:
+        for i, p in enumerate(kp):
             story.append(_p(f"• {p}", styles))
+            it = akp[i] if i < len(akp) else {}
+            if it.get("quote") and it.get("page_refs"):
+                story.append(_quote(it["quote"], styles))
         story.append(Spacer(1, 12))
 
     # Alertes
-    ver = doc.get("verification", {})
     alerts = ver.get("alerts", [])
+    alert_quotes = ver.get("alert_quotes", [])
     if alerts:
         story.append(Paragraph("<b>Alertes / Incertitudes</b>", styles["Heading2"]))
-        for a in alerts:
+        for i, a in enumerate(alerts):
             story.append(_p(f"• {a}", styles))
+            if i < len(alert_quotes) and alert_quotes[i]:
+                story.append(_quote(alert_quotes[i], styles, label="passage le plus proche, p."))
         story.append(Spacer(1, 12))
 
     # Informations extraites (tableaux simples selon type)
@@ -140,7 +165,6 @@ def build_report(doc: Dict[str, Any], out_dir: str = "reports/generated") -> str
                 story.append(_p(f"Erreur chargement mindmap: {str(e)}", styles))
 
     # Annexes minimales: références de pages pour quelques points clés
-    akp = ver.get("annotated_key_points", [])
     if akp:
         story.append(Spacer(1, 16))
         story.append(Paragraph("<b>Annexe: Références de pages (approx.)</b>", styles["Heading2"]))
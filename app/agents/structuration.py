@@ -1,7 +1,23 @@
 from __future__ import annotations
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import logging
+import os
 import re
 from app.llm_client import is_configured as llm_ready, chat_json_schema
+from app.document_text import DocumentText, Section, document_text
+
+log = logging.getLogger("structuration")
+
+# Budget de texte envoyé au LLM par requête de segmentation (une fenêtre de pages)
+LLM_SAMPLE_MAX_CHARS = 10000
+# Fin de l'extrait précédent reprise en tête de chaque fenêtre (contexte à la jointure)
+LLM_WINDOW_OVERLAP_CHARS = 1000
+# Fenêtres segmentées en parallèle
+LLM_SEGMENT_WORKERS = int(os.environ.get("LLM_SEGMENT_WORKERS", "4"))
+# Deux débuts de section plus proches que cela (en caractères) sont fusionnés
+SEAM_MERGE_CHARS = 200
 
 HEADING_PATTERNS = [
     r"^(?:[0-9]{1,2}|[ivxlcdm]{1,4}|[a-z])\s*[\.)\-]\s+.+$",  # 1. Title / I. Title / a) Title
@@ -12,6 +28,50 @@ HEADING_PATTERNS = [
 HEADING_RE = [re.compile(pat, re.IGNORECASE) for pat in HEADING_PATTERNS]
 
 
+# Avec la mise en page: un titre est nettement plus grand que le corps, ou en gras
+HEADING_SIZE_RATIO = 1.15
+
+
+def _layout_heading_test(layout: Optional[Dict[str, Any]]) -> Optional[Callable[[int, str], bool]]:
+    """
+    Test de titre fondé sur doc["layout"] (ingestion avec layout=True): taille
+    de police >= HEADING_SIZE_RATIO x corps, ou ligne en gras dans un corps
+    maigre. Une ligne sans ce style reste un titre si elle suit un motif de
+    HEADING_RE (numérotation, mots-clés). Les règles de casse de _is_heading
+    (majuscules, Mots Capitalisés) ne servent que pour les pages dont la mise
+    en page n'a pas été relevée. None si le document n'a pas d'informations de mise en page
+    ou si aucune ligne ne se distingue du corps (police uniforme): la mise en
+    page ne départage alors rien et _is_heading s'applique seul.
+    """
+    if not layout or not layout.get("body_size"):
+        return None
+    body_size = float(layout["body_size"])
+    body_bold = bool(layout.get("body_bold"))
+    styles = [{text: (size, bold) for text, size, bold in lines} for lines in layout.get("pages", [])]
+
+    def styled(size: float, bold: bool) -> bool:
+        if size >= body_size * HEADING_SIZE_RATIO:
+            return True
+        return bold and not body_bold and size >= body_size * 0.95
+
+    if not any(styled(size, bold) for page in styles for size, bold in page.values()):
+        return None
+
+    def test(page_index: int, line: str) -> bool:
+        s = line.strip()
+        if not s:
+            return False
+        page = styles[page_index] if page_index < len(styles) else None
+        if not page:
+            return _is_heading(line)
+        if len(s) > 120 or s.endswith((".", ",", ";")) or not any(c.isalpha() for c in s):
+            return False
+        style = page.get(s)
+        return (style is not None and styled(*style)) or any(r.match(s) for r in HEADING_RE)
+
+    return test
+
+
 def _is_heading(line: str) -> bool:
     s = line.strip()
     if not s:
@@ -25,87 +85,230 @@ def segment_document(doc: Dict[str, Any], use_llm: bool = False, model: Optional
     """
     Découpe le document en sections rudimentaires à partir des titres probables.
     Retourne { sections: [ {title, content, pages} ] }
+    Les sections sont des Section {title, start, end, pages} sur le buffer
+    partagé (document_text): section["content"] est découpé à la lecture.
+    Avec le LLM, tout le document est couvert par fenêtres de pages (_segment_llm).
+    Si l'ingestion a relevé la mise en page (doc["layout"]), les titres sont
+    repérés par la taille et la graisse de la police.
+    Avec use_llm, "source" indique "llm" ou "heuristique" (repli: LLM non
+    configuré ou sans réponse).
     """
+    dt = document_text(doc)
+
     # LLM-based segmentation if enabled
     if use_llm and llm_ready():
-        # Build a concise sample (up to ~10k chars)
-        buf = []
-        total = 0
-        for p in doc.get("pages", []):
-            t = p.get("text", "")
-            if not t:
-                continue
-            if total + len(t) > 10000:
-                t = t[: max(0, 10000 - total)]
-            buf.append(f"[Page {p.get('page_number')}]\n{t}")
-            total += len(t)
-            if total >= 10000:
-                break
-        sample = "\n\n".join(buf)
-        sys = "Tu segmentes des documents PDF en sections logiques au format JSON."
-        prompt = (
-            "Retourne JSON strict: {\n  \"sections\": [ {\n    \"title\": "
-            "string, \n    \"content\": string, \n    \"pages\": [integer]\n  } ]\n}\n"
-            "Respecte des titres plausibles selon le type (article: Introduction, Méthodes...; contrat: Parties, Durée...).\n\n"
-            f"Texte:\n{sample}"
-        )
-        schema = {
-            "type": "object",
-            "properties": {
-                "sections": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "title": {"type": "string"},
-                            "content": {"type": "string"},
-                            "pages": {"type": "array", "items": {"type": "integer"}},
-                        },
-                        "required": ["title", "content", "pages"],
-                    },
-                    "minItems": 1,
-                }
-            },
-            "required": ["sections"],
-        }
-        data = chat_json_schema(prompt, schema=schema, system=sys, model=model) or {}
-        if isinstance(data, dict) and isinstance(data.get("sections"), list) and data.get("sections"):
-            # sanitize minimal shape
-            cleaned = []
-            for s in data.get("sections", [])[:25]:
-                title = str(s.get("title", "Section")).strip()[:120]
-                content = str(s.get("content", "")).strip()
-                pages = s.get("pages") or []
-                pages = [int(p) for p in pages if isinstance(p, int)][:10]
-                if not pages:
-                    pages = [1]
-                cleaned.append({"title": title, "content": content, "pages": pages})
-            return {"sections": cleaned}
-
-    sections: List[Dict[str, Any]] = []
-    current: Dict[str, Any] | None = None
-
-    for page in doc.get("pages", []):
-        page_no = page.get("page_number")
-        text = page.get("text", "")
-        lines = text.splitlines()
-        for line in lines:
-            if _is_heading(line):
-                # start a new section
-                if current:
-                    sections.append(current)
-                current = {"title": line.strip(), "content": "", "pages": [page_no]}
-            else:
-                if not current:
-                    current = {"title": "Document", "content": "", "pages": [page_no]}
-                current["content"] += (line + "\n")
-                if page_no not in current["pages"]:
-                    current["pages"].append(page_no)
-
-    if current:
-        sections.append(current)
+        sections = _segment_llm(dt, model=model)
+        if sections:
+            return {"sections": sections, "source": "llm"}
+
+    sections = _segment_heuristic(dt, doc.get("layout"))
 
     if not sections:
-        sections = [{"title": "Document", "content": "\n".join(p.get("text", "") for p in doc.get("pages", [])), "pages": [p.get("page_number") for p in doc.get("pages", [])]}]
+        sections = [Section(dt, {"title": "Document", "start": 0, "end": len(dt.text), "pages": list(dt.page_numbers)})]
 
+    if use_llm:
+        return {"sections": sections, "source": "heuristique"}
     return {"sections": sections}
+
+
+def _page_windows(dt: DocumentText, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    Fenêtres consécutives [début, fin) (offsets dans dt.text) d'au plus
+    max_chars caractères: des pages entières regroupées, ou une page trop
+    longue découpée en plusieurs fenêtres (coupure en fin de ligne si possible).
+    Les fenêtres couvrent tout le texte.
+    """
+    windows: List[Tuple[int, int]] = []
+    n = dt.num_pages
+    i = 0
+    while i < n:
+        start, end = dt.starts[i], dt.ends[i]
+        if end - start > max_chars:
+            lo = start
+            while end - lo > max_chars:
+                cut = dt.text.rfind("\n", lo + max_chars // 2, lo + max_chars)
+                hi = cut + 1 if cut != -1 else lo + max_chars
+                windows.append((lo, hi))
+                lo = hi
+            windows.append((lo, end))
+            i += 1
+            continue
+        j, size = i, 0
+        while j < n and (j == i or size + dt.ends[j] - dt.starts[j] <= max_chars):
+            size += dt.ends[j] - dt.starts[j]
+            j += 1
+        windows.append((start, dt.ends[j - 1]))
+        i = j
+    return windows
+
+
+SEGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "page": {"type": "integer"},
+                    "start_text": {"type": "string"},
+                },
+                "required": ["title", "page", "start_text"],
+            },
+        }
+    },
+    "required": ["sections"],
+}
+
+
+def _segment_window(dt: DocumentText, window: Tuple[int, int], model: Optional[str]) -> List[Tuple[int, str]]:
+    """Map: débuts de section (offset dans dt.text, titre) trouvés par le LLM dans une fenêtre."""
+    lo, hi = window
+    parts = []
+    for i in range(dt.page_index_at(lo), dt.page_index_at(max(lo, hi - 1)) + 1):
+        a, b = max(lo, dt.starts[i]), min(hi, dt.ends[i])
+        suite = " (suite)" if a > dt.starts[i] else ""
+        parts.append(f"[Page {dt.page_numbers[i]}{suite}]\n{dt.text[a:b]}")
+    if lo > 0:
+        # Contexte à la jointure: fin de l'extrait précédent (page précédente, ou même page si elle est découpée)
+        prev = dt.page_index_at(lo - 1)
+        end = min(lo, dt.ends[prev])
+        lo = max(dt.starts[prev], end - LLM_WINDOW_OVERLAP_CHARS)
+        parts.insert(0, f"[Page {dt.page_numbers[prev]} (extrait précédent)]\n{dt.text[lo:end]}")
+    sample = "\n\n".join(parts)
+    sys = "Tu segmentes des documents PDF en sections logiques au format JSON."
+    prompt = (
+        "Retourne JSON strict: {\n  \"sections\": [ {\n    \"title\": string, \n    \"page\": integer, \n"
+        "    \"start_text\": string\n  } ]\n}\n"
+        "Liste uniquement les sections qui COMMENCENT dans cet extrait: leur titre, la page où elles commencent "
+        "et leurs premiers mots recopiés exactement (5 à 10 mots). Liste vide si aucune.\n"
+        "Respecte des titres plausibles selon le type (article: Introduction, Méthodes...; contrat: Parties, Durée...).\n\n"
+        f"Texte:\n{sample}"
+    )
+    data = chat_json_schema(prompt, schema=SEGMENT_SCHEMA, system=sys, model=model) or {}
+    found = []
+    for s in data.get("sections", [])[:25]:
+        title = str(s.get("title", "Section")).strip()[:120] or "Section"
+        offset = _locate(dt, s.get("page"), str(s.get("start_text", "")), title, lo, hi)
+        if offset is not None:
+            found.append((offset, title))
+    return found
+
+
+def _words_pattern(text: str, max_words: int = 8) -> Optional[re.Pattern]:
+    words = re.findall(r"\w+", text)[:max_words]
+    if not words:
+        return None
+    return re.compile(r"\W+".join(re.escape(w) for w in words), re.IGNORECASE)
+
+
+def _locate(dt: DocumentText, page: Any, start_text: str, title: str, lo: int, hi: int) -> Optional[int]:
+    """Offset du début d'une section dans [lo, hi): premiers mots, sinon titre, sinon début de page."""
+    page_lo: Optional[int] = None
+    if isinstance(page, int):
+        for i in range(dt.page_index_at(lo), dt.page_index_at(max(lo, hi - 1)) + 1):
+            if dt.page_numbers[i] == page:
+                page_lo = dt.starts[i]
+                break
+    for text in (start_text, title):
+        pat = _words_pattern(text)
+        if pat is None:
+            continue
+        m = (page_lo is not None and pat.search(dt.text, page_lo, hi)) or pat.search(dt.text, lo, hi)
+        if m:
+            return m.start()
+    return page_lo
+
+
+def _merge_boundaries(boundaries: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Reduce: trie les débuts de section et fusionne ceux vus deux fois à la jointure des fenêtres."""
+    merged: List[Tuple[int, str]] = []
+    for offset, title in sorted(boundaries):
+        if merged:
+            prev_offset, prev_title = merged[-1]
+            if offset - prev_offset < SEAM_MERGE_CHARS or (title.lower() == prev_title.lower() and offset - prev_offset < 2 * SEAM_MERGE_CHARS):
+                continue
+        merged.append((offset, title))
+    return merged
+
+
+def _segment_llm(dt: DocumentText, model: Optional[str] = None) -> List[Section]:
+    """
+    Segmentation LLM en map-reduce sur tout le document: fenêtres de pages,
+    une page trop longue étant découpée en plusieurs fenêtres (LLM_SAMPLE_MAX_CHARS
+    chacune, fin de l'extrait précédent incluse) segmentées
+    en parallèle par LLM_SEGMENT_WORKERS threads, puis débuts de section
+    fusionnés et dédoublonnés aux jointures. Chaque section est un intervalle
+    du buffer, jusqu'au début de la suivante.
+    Retourne [] si aucune fenêtre n'a abouti (repli heuristique).
+    """
+    windows = _page_windows(dt, LLM_SAMPLE_MAX_CHARS - LLM_WINDOW_OVERLAP_CHARS)
+    if not windows or not dt.text.strip():
+        return []
+    workers = max(1, min(LLM_SEGMENT_WORKERS, len(windows)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Une copie du contexte par tâche: routage des appels LLM (llm_client.route_sync_calls)
+        futures = [pool.submit(contextvars.copy_context().run, _segment_window, dt, w, model) for w in windows]
+        results = [f.result() for f in futures]
+    log.info("Segmentation LLM: %d fenêtres, %d sans réponse", len(windows), sum(1 for r in results if not r))
+
+    boundaries = _merge_boundaries([b for r in results for b in r])
+    if not boundaries:
+        return []
+    if dt.text[:boundaries[0][0]].strip():
+        boundaries.insert(0, (0, "Document"))
+
+    sections: List[Section] = []
+    for k, (start, title) in enumerate(boundaries):
+        end = boundaries[k + 1][0] if k + 1 < len(boundaries) else len(dt.text)
+        first, last = dt.page_index_at(start), dt.page_index_at(max(start, end - 1))
+        pages = [dt.page_numbers[i] for i in range(first, last + 1)]
+        sections.append(Section(dt, {"title": title, "start": start, "end": end, "pages": pages}))
+    return sections
+
+
+def _segment_heuristic(dt: DocumentText, layout: Optional[Dict[str, Any]] = None) -> List[Section]:
+    """
+    Découpage par titres en une passe sur le buffer partagé: chaque section est
+    l'intervalle [start, end) de ses lignes (titre exclu) dans dt.text, son
+    contenu n'est jamais recopié. Les pages sont suivies via une liste doublée
+    d'un ensemble (test d'appartenance en O(1)).
+    Les titres viennent de la mise en page si layout est fourni, sinon de _is_heading.
+    """
+    layout_test = _layout_heading_test(layout)
+    sections: List[Section] = []
+    title: Optional[str] = None
+    start = end = 0
+    has_content = False
+    pages: List[Any] = []
+    seen: set = set()
+
+    def close() -> None:
+        if title is not None:
+            sections.append(Section(dt, {"title": title, "start": start, "end": end, "pages": pages}))
+
+    for i in range(dt.num_pages):
+        page_no = dt.page_numbers[i]
+        text = dt.page_text(i)
+        pos = dt.starts[i]
+        for raw, line in zip(text.splitlines(keepends=True), text.splitlines()):
+            line_start, pos = pos, pos + len(raw)
+            if layout_test(i, line) if layout_test else _is_heading(line):
+                # start a new section
+                close()
+                title, pages, seen = line.strip(), [page_no], {page_no}
+                start = end = pos
+                has_content = False
+                continue
+            if title is None:
+                title, pages, seen = "Document", [page_no], {page_no}
+            if not has_content:
+                start, has_content = line_start, True
+            end = line_start + len(line)
+            if page_no not in seen:
+                seen.add(page_no)
+                pages.append(page_no)
+
+    close()
+    return sections
@@ -2,9 +2,14 @@ from __future__ import annotations
 from typing import Dict, Any, List, Optional
 from app.llm_client import is_configured as llm_ready, chat_json_schema
 from app.agents.synthese_article import synthesize_article
+from app.agents.extraction import EXTRACTION_META_KEYS
 
 
 def synthesize(doc: Dict[str, Any], sections: Dict[str, Any], extracted: Dict[str, Any], use_llm: bool = False, model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Résumé et points clés (LLM si demandé, sinon heuristiques). Avec use_llm,
+    "source" indique "llm" ou "heuristique" (repli: LLM non configuré ou sans réponse).
+    """
     t = doc.get("document_type", "autre")
     summary = ""
     key_points: List[str] = []
@@ -13,12 +18,12 @@ def synthesize(doc: Dict[str, Any], sections: Dict[str, Any], extracted: Dict[st
     # Optional LLM summarization
     if use_llm and llm_ready():
         if t == "article_scientifique":
-            return synthesize_article(extracted, model=model)
+            return synthesize_article({k: v for k, v in extracted.items() if k not in EXTRACTION_META_KEYS}, model=model)
         sys = "Tu rends un JSON strict contenant summary, key_points, et éventuellement risks_or_remarks."
         prompt = (
             "Donne un JSON strict: {\n  \"summary\": string, \n  \"key_points\": [string], \n  \"risks_or_remarks\": [string]\n}\n\n"
             f"Type: {t}\n\n"
-            f"Infos extraites:\n{extracted}\n"
+            f"Infos extraites:\n{ {k: v for k, v in extracted.items() if k not in EXTRACTION_META_KEYS} }\n"
         )
         schema = {
             "type": "object",
@@ -32,6 +37,7 @@ def synthesize(doc: Dict[str, Any], sections: Dict[str, Any], extracted: Dict[st
         data = chat_json_schema(prompt, schema=schema, system=sys, model=model)
         if isinstance(data, dict) and data.get("summary") and isinstance(data.get("key_points"), list):
             data.setdefault("risks_or_remarks", [])
+            data["source"] = "llm"
             return data
 
     if t == "article_scientifique":
@@ -110,8 +116,11 @@ def synthesize(doc: Dict[str, Any], sections: Dict[str, Any], extracted: Dict[st
         for k in (extracted.get("mots_cles") or [])[:5]:
             key_points.append(f"Mot-clé: {k}")
 
-    return {
+    result = {
         "summary": summary,
         "key_points": key_points,
         "risks_or_remarks": risks_or_remarks,
     }
+    if use_llm:
+        result["source"] = "heuristique"
+    return result
@@ -34,6 +34,7 @@ def synthesize_article(extracted_info: Dict[str, Any], model: Optional[str] = No
         )
         data = chat_json_schema(prompt, schema=SYNTH_SCHEMA, system=sys, model=model)
         if isinstance(data, dict):
+            data["source"] = "llm"
             return data
 
     # Fallback simple
@@ -45,4 +46,4 @@ def synthesize_article(extracted_info: Dict[str, Any], model: Optional[str] = No
         f"Résultats: {extracted_info.get('resultats_principaux', 'inconnu')}. "
         f"Conclusions: {extracted_info.get('conclusions', 'inconnu')}."
     )
-    return {"summary": text, "key_points": []}
+    return {"summary": text, "key_points": [], "source": "heuristique"}
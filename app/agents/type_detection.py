@@ -1,7 +1,28 @@
 from __future__ import annotations
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, FrozenSet, List, Optional, Pattern, Sequence, Tuple, Union
+import hashlib
+import json
+import os
 import re
+import numpy as np
 from app.llm_client import is_configured as llm_ready, chat_json
+from app.agents.ingestion import iter_page_texts
+from app.document_text import DocumentText
+from app.terms import tokenize
+
+DOCUMENT_TYPES = ("article_scientifique", "contrat", "cv", "cours", "autre")
+
+# Modèle linéaire optionnel (JSON produit par scripts/train_type_model.py)
+TYPE_MODEL_PATH = os.environ.get("TYPE_MODEL_PATH")
+
+# Mode cascade: le LLM n'est appelé que si les heuristiques hésitent
+# (confiance sous le seuil ou écart trop faible entre les deux meilleures classes)
+ESCALATION_MIN_CONFIDENCE = float(os.environ.get("TYPE_LLM_MIN_CONFIDENCE", "0.8"))
+ESCALATION_MIN_MARGIN = float(os.environ.get("TYPE_LLM_MIN_MARGIN", "0.1"))
+
+# Budget de lecture: seules ces pages sont extraites pour la détection
+SAMPLE_MAX_PAGES = 3
+SAMPLE_MAX_CHARS = 3000
 
 ARTICLE_HINTS = [
     r"\babstract\b",
@@ -43,58 +64,391 @@ COURS_HINTS = [
     r"\bobjectifs?\s+pédagogiques\b|\blearning\s+outcomes\b",
 ]
 
+HINTS: Dict[str, List[str]] = {
+    "article_scientifique": ARTICLE_HINTS,
+    "contrat": CONTRACT_HINTS,
+    "cv": CV_HINTS,
+    "cours": COURS_HINTS,
+}
+
+# Séparateurs internes des mots de app.terms.WORD_RE ("l'article", "co-contractant"), frontières \b pour les indices
+_WORD_JOINERS = re.compile(r"['’-]")
+# Alternatives réductibles à une recherche de mot: \bmot\b, \bmots?\b, \bmot(s)?\b, \b(mot1|mot2)\b
+_SIMPLE_WORD = re.compile(r"^\\b(\w+?)(s\?|\(s\)\?)?\\b$")
+_WORD_GROUP = re.compile(r"^\\b\((?:\?:)?(\w+(?:\|\w+)*)\)\\b$")
 
-def _sample_text(doc: Dict[str, Any], max_chars: int = 3000) -> str:
-    buf = []
-    total = 0
-    for page in doc.get("pages", [])[:3]:
-        t = page.get("text", "")
-        if not t:
+
+def _hint_words(tokens: Sequence[str]) -> FrozenSet[str]:
+    """Mots testés contre les indices: chaque mot et ses parties ("l'université" -> l, université), comme \bmot\b."""
+    words = set(tokens)
+    for w in [w for w in words if _WORD_JOINERS.search(w)]:
+        words.update(p for p in _WORD_JOINERS.split(w) if p)
+    return frozenset(words)
+
+
+def _split_alternatives(pattern: str) -> List[str]:
+    """Découpe un motif sur ses '|' de premier niveau (hors groupes et échappements)."""
+    parts: List[str] = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
             continue
-        if total + len(t) > max_chars:
-            t = t[: max(0, max_chars - total)]
-        buf.append(t)
-        total += len(t)
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    parts.append(pattern[start:])
+    return parts
+
+
+class HintDetector:
+    """
+    Détecteur compilé des indices de type. Chaque indice est décomposé une fois
+    pour toutes: les alternatives \bmot\b deviennent un ensemble de mots testé
+    contre les tokens du texte (une seule tokenisation), le reste est compilé en
+    une regex par indice, exécutée seulement si les mots n'ont rien donné.
+    Résultat identique à re.search(indice, texte) pour chaque indice.
+    """
+
+    def __init__(self, hints: Dict[str, List[str]]):
+        self.classes = list(hints)
+        self._hints: List[Tuple[int, FrozenSet[str], Optional[Pattern[str]]]] = []
+        self._sizes = [len(hints[c]) for c in self.classes]
+        for ci, cls in enumerate(self.classes):
+            for pattern in hints[cls]:
+                words = set()
+                residual = []
+                for alt in _split_alternatives(pattern):
+                    m = _SIMPLE_WORD.match(alt)
+                    g = _WORD_GROUP.match(alt)
+                    if m:
+                        words.add(m.group(1))
+                        if m.group(2):
+                            words.add(m.group(1) + "s")
+                    elif g:
+                        words.update(g.group(1).split("|"))
+                    else:
+                        residual.append(alt)
+                regex = re.compile("|".join(residual)) if residual else None
+                self._hints.append((ci, frozenset(words), regex))
+
+    def hit_vectors(self, text: str, tokens: Optional[Sequence[str]] = None) -> Dict[str, List[int]]:
+        """
+        Pour chaque classe, vecteur 0/1 des indices présents dans text (en
+        minuscules). tokens: mots de text déjà découpés (DocumentText.tokens),
+        sinon text est tokenisé ici.
+        """
+        present = _hint_words(tokenize(text) if tokens is None else tokens)
+        vectors: List[List[int]] = [[] for _ in self.classes]
+        for ci, words, regex in self._hints:
+            hit = not present.isdisjoint(words) or (regex is not None and regex.search(text) is not None)
+            vectors[ci].append(1 if hit else 0)
+        return dict(zip(self.classes, vectors))
+
+    def scores(self, text: str, tokens: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        return {cls: sum(v) for cls, v in self.hit_vectors(text, tokens).items()}
+
+    @property
+    def num_hints(self) -> int:
+        return len(self._hints)
+
+    def hint_classes(self) -> np.ndarray:
+        """Matrice (indices x classes) d'appartenance: X @ hint_classes() donne les scores."""
+        out = np.zeros((len(self._hints), len(self.classes)), dtype=np.int32)
+        for j, (ci, _, _) in enumerate(self._hints):
+            out[j, ci] = 1
+        return out
+
+    def matrix(self, texts: Sequence[str], tokens: Optional[Sequence[Optional[Sequence[str]]]] = None) -> np.ndarray:
+        """Matrice documents x indices (0/1), remplie en une passe sur les textes (tokens: voir hit_vectors)."""
+        X = np.zeros((len(texts), len(self._hints)), dtype=np.uint8)
+        for i, text in enumerate(texts):
+            given = tokens[i] if tokens is not None else None
+            present = _hint_words(tokenize(text) if given is None else given)
+            row = X[i]
+            for j, (_, words, regex) in enumerate(self._hints):
+                if not present.isdisjoint(words) or (regex is not None and regex.search(text) is not None):
+                    row[j] = 1
+        return X
+
+
+DETECTOR = HintDetector(HINTS)
+_HINT_CLASSES = DETECTOR.hint_classes()
+
+
+def _top2_margin(scores: np.ndarray) -> np.ndarray:
+    """Écart entre les deux meilleurs scores de chaque ligne."""
+    if scores.shape[1] < 2:
+        return scores[:, 0].astype(np.float64) if scores.shape[1] else np.zeros(len(scores))
+    top2 = np.partition(scores, -2, axis=1)[:, -2:]
+    return (top2[:, 1] - top2[:, 0]).astype(np.float64)
+
+
+def score_hits(X: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Scoring heuristique vectorisé d'une matrice documents x indices:
+    classe au plus grand nombre d'indices (première en cas d'égalité),
+    confiance min(0.55 + 0.05 * hits, 0.95), ("autre", 0.4) sans aucun indice.
+    La marge (écart d'indices entre les deux meilleures classes) est exprimée
+    dans la même unité que la confiance: 0.05 par indice.
+    """
+    scores = X.astype(np.int32) @ _HINT_CLASSES
+    best = scores.argmax(axis=1)
+    hits = scores[np.arange(len(scores)), best]
+    conf = np.where(hits == 0, 0.4, np.minimum(0.55 + 0.05 * hits, 0.95))
+    types = ["autre" if h == 0 else DETECTOR.classes[b] for b, h in zip(best, hits)]
+    return types, conf, 0.05 * _top2_margin(scores)
+
+
+# Bornes de la confiance du modèle: celles du comptage d'indices (0.55 + 0.05 par indice, au plus 0.95)
+MODEL_MIN_CONFIDENCE = 0.6
+MODEL_MAX_CONFIDENCE = 0.95
+
+
+class TypeModel:
+    """
+    Régression logistique multinomiale sur les indices (X @ W + b, softmax).
+    Entraînée hors ligne par scripts/train_type_model.py et sauvegardée en JSON.
+    Les règles du comptage d'indices restent autour du modèle: sans aucun
+    indice le document est ("autre", 0.4), sinon la confiance (probabilité de
+    la classe prédite) est bornée à [MODEL_MIN_CONFIDENCE, MODEL_MAX_CONFIDENCE].
+    """
+
+    def __init__(self, classes: Sequence[str], weights: np.ndarray, bias: np.ndarray):
+        self.classes = list(classes)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        if self.weights.shape != (DETECTOR.num_hints, len(self.classes)):
+            raise ValueError(
+                f"Modèle incompatible: {self.weights.shape} au lieu de {(DETECTOR.num_hints, len(self.classes))}"
+            )
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        z = X.astype(np.float64) @ self.weights + self.bias
+        z -= z.max(axis=1, keepdims=True)
+        p = np.exp(z)
+        return p / p.sum(axis=1, keepdims=True)
+
+    def predict(self, X: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """(types, confiance de la classe prédite, écart de probabilité avec la deuxième classe)."""
+        proba = self.predict_proba(X)
+        best = proba.argmax(axis=1)
+        none = ~X.any(axis=1)
+        conf = np.where(none, 0.4, np.clip(proba[np.arange(len(proba)), best], MODEL_MIN_CONFIDENCE, MODEL_MAX_CONFIDENCE))
+        types = ["autre" if n else self.classes[b] for b, n in zip(best, none)]
+        return types, conf, np.where(none, 0.0, _top2_margin(proba))
+
+    @classmethod
+    def fit(cls, X: np.ndarray, labels: Sequence[str], epochs: int = 500, lr: float = 0.5, l2: float = 1e-3) -> "TypeModel":
+        classes = sorted(set(labels))
+        y = np.zeros((len(labels), len(classes)))
+        y[np.arange(len(labels)), [classes.index(l) for l in labels]] = 1.0
+        Xf = X.astype(np.float64)
+        model = cls(classes, np.zeros((Xf.shape[1], len(classes))), np.zeros(len(classes)))
+        for _ in range(epochs):
+            grad = (model.predict_proba(Xf) - y) / len(Xf)
+            model.weights -= lr * (Xf.T @ grad + l2 * model.weights)
+            model.bias -= lr * grad.sum(axis=0)
+        return model
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "classes": self.classes,
+            "hints": [p for patterns in HINTS.values() for p in patterns],
+            "weights": self.weights.tolist(),
+            "bias": self.bias.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TypeModel":
+        hints = [p for patterns in HINTS.values() for p in patterns]
+        if data.get("hints") != hints:
+            raise ValueError("Modèle entraîné sur une autre liste d'indices, à ré-entraîner")
+        return cls(data["classes"], np.array(data["weights"]), np.array(data["bias"]))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "TypeModel":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+_MODELS: Dict[str, Tuple[float, TypeModel]] = {}
+_MODEL_IDS: Dict[str, Tuple[float, int, str]] = {}
+
+
+def load_type_model(path: Optional[str] = None) -> Optional[TypeModel]:
+    """Modèle de TYPE_MODEL_PATH (ou path), rechargé si le fichier change; None si absent."""
+    path = path or TYPE_MODEL_PATH
+    if not path or not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _MODELS.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _MODELS[path] = (mtime, TypeModel.load(path))
+    return cached[1]
+
+
+def type_model_id(path: Optional[str] = None) -> Optional[str]:
+    """
+    Empreinte du modèle actif (entre dans la clé de cache de la détection),
+    recalculée seulement si la date ou la taille du fichier change.
+    """
+    path = path or TYPE_MODEL_PATH
+    if not path or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    cached = _MODEL_IDS.get(path)
+    if cached is None or cached[:2] != (st.st_mtime, st.st_size):
+        with open(path, "rb") as f:
+            cached = _MODEL_IDS[path] = (st.st_mtime, st.st_size, hashlib.sha256(f.read()).hexdigest()[:16])
+    return cached[2]
+
+
+def _sample_text(doc: Dict[str, Any], max_chars: int = SAMPLE_MAX_CHARS) -> str:
+    buf = [t for _, t in iter_page_texts(doc, max_chars=max_chars, max_pages=SAMPLE_MAX_PAGES)]
+    return "\n".join(buf).lower()
+
+
+def _sample_tokens(doc: Dict[str, Any], max_chars: int = SAMPLE_MAX_CHARS) -> Optional[List[str]]:
+    """
+    Mots de l'échantillon (_sample_text) repris de DocumentText.tokens si le
+    document a déjà son buffer partagé (pipeline), sinon None (tokenisation de
+    l'échantillon). Un buffer n'est jamais construit ici pour ne pas lire tout
+    le document.
+    """
+    dt = doc.get("document_text")
+    if not isinstance(dt, DocumentText):
+        return None
+    total = end = 0
+    for i in range(min(SAMPLE_MAX_PAGES, dt.num_pages)):
+        start, stop = dt.page_span(i)
+        if stop == start:
+            continue
+        take = min(stop - start, max_chars - total)
+        end = start + take
+        total += take
         if total >= max_chars:
             break
-    return "\n".join(buf).lower()
+    return dt.tokens_before(end)
+
 
+def _llm_type(text: str, model: Optional[str]) -> Optional[Tuple[str, float]]:
+    prompt = (
+        "Classifie ce document en JSON: {\"type\": \"article_scientifique|contrat|cv|cours|autre\", \"confidence\": 0.8}\n\n"
+        f"Texte:\n{text[:2000]}"
+    )
+    data = chat_json(prompt, system="Classifieur PDF", model=model) or {}
+    t = (data.get("type") or "").strip()
+    c = float(data.get("confidence") or 0)
+    if t in {"article_scientifique", "contrat", "cv", "cours", "autre"} and 0 <= c <= 1:
+        return (t, max(0.5, c))
+    return None
 
-def detect_document_type(doc: Dict[str, Any], use_llm: bool = False, model: Optional[str] = None) -> Tuple[str, float]:
+
+def detect_document_type(
+    doc: Dict[str, Any],
+    use_llm: bool = False,
+    model: Optional[str] = None,
+    cascade: bool = False,
+) -> Tuple[str, float]:
     """
     Retourne (document_type, confidence) parmi {"article_scientifique", "contrat", "cv", "cours", "autre"}
     Heuristiques simples basées sur des mots-clés, avec option LLM.
+    Si un modèle linéaire est configuré (TYPE_MODEL_PATH), il remplace le comptage d'indices.
+    Avec cascade=True, les heuristiques passent d'abord et le LLM n'est consulté
+    que si elles hésitent (voir detect_document_type_cascade).
+    """
+    if cascade:
+        r = detect_document_type_cascade(doc, use_llm=use_llm, model=model)
+        return (r["type"], r["confidence"])
+    r = detect_document_type_llm(doc, use_llm=use_llm, model=model)
+    return (r["type"], r["confidence"])
+
+
+def detect_document_type_llm(doc: Dict[str, Any], use_llm: bool = False, model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    detect_document_type hors cascade, avec la source de la réponse:
+    {type, confidence, llm_used}. llm_used est faux si le LLM n'a pas été
+    demandé, n'est pas configuré ou n'a pas répondu (repli heuristique).
     """
     text = _sample_text(doc)
 
     # Optional LLM pass
     if use_llm and llm_ready() and text.strip():
-        prompt = (
-            "Classifie ce document en JSON: {\"type\": \"article_scientifique|contrat|cv|cours|autre\", \"confidence\": 0.8}\n\n"
-            f"Texte:\n{text[:2000]}"
-        )
-        data = chat_json(prompt, system="Classifieur PDF", model=model) or {}
-        t = (data.get("type") or "").strip()
-        c = float(data.get("confidence") or 0)
-        if t in {"article_scientifique", "contrat", "cv", "cours", "autre"} and 0 <= c <= 1:
-            return (t, max(0.5, c))
-
-    article_hits = sum(1 for pat in ARTICLE_HINTS if re.search(pat, text))
-    contract_hits = sum(1 for pat in CONTRACT_HINTS if re.search(pat, text))
-    cv_hits = sum(1 for pat in CV_HINTS if re.search(pat, text))
-    cours_hits = sum(1 for pat in COURS_HINTS if re.search(pat, text))
-
-    scores = {
-        "article_scientifique": article_hits,
-        "contrat": contract_hits,
-        "cv": cv_hits,
-        "cours": cours_hits,
-    }
-
-    best_type, best_hits = max(scores.items(), key=lambda x: x[1])
-
-    if best_hits == 0:
-        return ("autre", 0.4)
-
-    conf = min(0.55 + 0.05 * best_hits, 0.95)
-    return (best_type, conf)
+        found = _llm_type(text, model)
+        if found is not None:
+            return {"type": found[0], "confidence": found[1], "llm_used": True}
+
+    t, c, _ = _classify([text], tokens=[_sample_tokens(doc)])[0]
+    return {"type": t, "confidence": c, "llm_used": False}
+
+
+def detect_document_type_cascade(
+    doc: Dict[str, Any],
+    use_llm: bool = True,
+    model: Optional[str] = None,
+    min_confidence: Optional[float] = None,
+    min_margin: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Heuristiques compilées d'abord; escalade vers le LLM seulement si la
+    confiance est sous min_confidence ou si l'écart entre les deux meilleures
+    classes est sous min_margin (défauts: TYPE_LLM_MIN_CONFIDENCE / TYPE_LLM_MIN_MARGIN).
+    Retourne {type, confidence, margin, escalated, llm_used}: escalated indique
+    qu'un appel LLM était nécessaire, llm_used qu'il a fourni la réponse.
+    """
+    min_confidence = ESCALATION_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    min_margin = ESCALATION_MIN_MARGIN if min_margin is None else min_margin
+    text = _sample_text(doc)
+    t, c, margin = _classify([text], tokens=[_sample_tokens(doc)])[0]
+    result = {"type": t, "confidence": c, "margin": margin, "escalated": False, "llm_used": False}
+    if c >= min_confidence and margin >= min_margin:
+        return result
+
+    result["escalated"] = True
+    if use_llm and llm_ready() and text.strip():
+        found = _llm_type(text, model)
+        if found is not None:
+            result["type"], result["confidence"] = found
+            result["llm_used"] = True
+    return result
+
+
+def _classify(
+    texts: Sequence[str],
+    model: Union[TypeModel, str, None] = None,
+    tokens: Optional[Sequence[Optional[Sequence[str]]]] = None,
+) -> List[Tuple[str, float, float]]:
+    if isinstance(model, str):
+        model = load_type_model(model)
+    elif model is None:
+        model = load_type_model()
+    X = DETECTOR.matrix(texts, tokens)
+    types, conf, margin = model.predict(X) if model is not None else score_hits(X)
+    return [(t, float(c), float(m)) for t, c, m in zip(types, conf, margin)]
+
+
+def detect_document_types(
+    docs: Sequence[Dict[str, Any]],
+    model: Union[TypeModel, str, None] = None,
+) -> List[Tuple[str, float]]:
+    """
+    Version par lot de detect_document_type (heuristiques seules): construit la
+    matrice documents x indices en une passe puis score tout le corpus d'un coup.
+    model: TypeModel ou chemin JSON; par défaut TYPE_MODEL_PATH s'il existe,
+    sinon le comptage d'indices habituel.
+    """
+    return [(t, c) for t, c, _ in _classify([_sample_text(doc) for doc in docs], model, [_sample_tokens(doc) for doc in docs])]
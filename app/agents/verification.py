@@ -1,30 +1,100 @@
 from __future__ import annotations
-from typing import Dict, Any, List
-from rapidfuzz import fuzz
+from typing import Dict, Any, List, Optional, Tuple
+import os
 
+import numpy as np
+from rapidfuzz import fuzz, process
 
-def verify_and_annotate(doc: Dict[str, Any], synthesis: Dict[str, Any]) -> Dict[str, Any]:
-    pages = doc.get("pages", [])
+from app.document_text import DocumentText, document_text
+from app.grounding import locate_quote
+
+# Seuils du score flou (0-100) entre un point clé et un passage du document
+SUPPORT_STRONG = 70
+SUPPORT_WEAK = 40
+# Passages (ou pages) retenus comme références par point clé
+TOP_K = 2
+
+# "index": passages présélectionnés par l'index d'ancrage (app.grounding);
+# "matrix": matrice complète points clés x pages en un seul cdist.
+VERIFICATION_ENGINES = ("index", "matrix")
+VERIFICATION_ENGINE = os.environ.get("VERIFICATION_ENGINE", "index")
+
+# (début, fin, page, score) d'une référence dans le buffer document_text
+Ref = Tuple[int, int, int, float]
+
+
+def _rank_index(dt: DocumentText, key_points: List[str], k: int = TOP_K) -> List[List[Ref]]:
+    index = dt.grounding
+    return [[(*index.chunk(c), score) for c, score in ranked[:k]] for ranked in index.ground(key_points)]
+
+
+def _rank_matrix(dt: DocumentText, key_points: List[str], k: int = TOP_K) -> List[List[Ref]]:
+    """
+    Toute la matrice points clés x pages en un appel rapidfuzz.process.cdist
+    (multi-thread), puis les k meilleures pages par ligne avec np.argpartition.
+    À score égal, la page la plus proche du début l'emporte (comme un tri stable).
+    """
+    n = dt.num_pages
+    if not n:
+        return [[] for _ in key_points]
+    matrix = process.cdist(key_points, [dt.page_text(i) for i in range(n)], scorer=fuzz.token_set_ratio, workers=-1)
+    k = min(k, n)
+    kth = np.partition(matrix, n - k, axis=1)[:, n - k]
+    out: List[List[Ref]] = []
+    for row, threshold in zip(matrix, kth):
+        top = np.flatnonzero(row >= threshold)
+        top = top[np.lexsort((top, -row[top]))][:k]
+        out.append([(dt.starts[i], dt.ends[i], dt.page_numbers[i], float(row[i])) for i in top])
+    return out
+
+
+def verify_and_annotate(doc: Dict[str, Any], synthesis: Dict[str, Any], engine: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rattache chaque point clé de la synthèse aux passages du document qui le
+    soutiennent. Chaque point annoté garde page_refs et gagne
+    spans: [{start, end, page, score}] (offsets dans le buffer document_text)
+    et quote: citation du meilleur passage (extrait exact, phrase autour, page;
+    cf. grounding.locate_quote), aussi pour les points en alerte, pour montrer
+    le passage le plus proche; None si aucun passage.
+    engine (VERIFICATION_ENGINE par défaut): "index" (présélection BM25 puis
+    score flou en lot sur des passages de phrases) ou "matrix" (score flou de
+    chaque point contre chaque page entière, calculé en une matrice).
+    """
+    engine = engine or VERIFICATION_ENGINE
+    if engine not in VERIFICATION_ENGINES:
+        raise ValueError(f"Moteur de vérification inconnu: {engine!r} (attendu: {', '.join(VERIFICATION_ENGINES)})")
     key_points = synthesis.get("key_points", [])
+    dt = document_text(doc)
+    if not key_points:
+        ranked: List[List[Ref]] = []
+    elif engine == "matrix":
+        ranked = _rank_matrix(dt, key_points)
+    else:
+        ranked = _rank_index(dt, key_points)
 
     annotated_key_points: List[Dict[str, Any]] = []
     alerts: List[str] = []
+    alert_quotes: List[Optional[Dict[str, Any]]] = []
 
-    for kp in key_points:
-        scores = []
-        for p in pages:
-            text = p.get("text", "")
-            score = fuzz.token_set_ratio(kp, text)
-            scores.append((score, p.get("page_number")))
-        scores.sort(reverse=True, key=lambda x: x[0])
-        top = [pg for sc, pg in scores[:2] if sc >= 40]
-        support = "fort" if scores and scores[0][0] >= 70 else ("moyen" if scores and scores[0][0] >= 40 else "incertain")
+    for kp, refs in zip(key_points, ranked):
+        best = refs[0][3] if refs else 0
+        spans = [
+            {"start": start, "end": end, "page": page, "score": round(score, 1)}
+            for start, end, page, score in refs
+            if score >= SUPPORT_WEAK
+        ]
+        top = list(dict.fromkeys(s["page"] for s in spans))
+        support = "fort" if best >= SUPPORT_STRONG else ("moyen" if best >= SUPPORT_WEAK else "incertain")
+        quote = locate_quote(dt, kp, refs[0][0], refs[0][1]) if refs else None
         if not top:
             alerts.append(f"Point non clairement supporté: '{kp[:60]}...'")
+            alert_quotes.append(quote)
         annotated_key_points.append({
             "text": kp,
             "page_refs": top,
             "support": support,
+            "spans": spans,
+            "quote": quote,
         })
 
     annotated_summary = synthesis.get("summary", "")
@@ -33,4 +103,5 @@ def verify_and_annotate(doc: Dict[str, Any], synthesis: Dict[str, Any]) -> Dict[
         "annotated_summary": annotated_summary,
         "annotated_key_points": annotated_key_points,
         "alerts": alerts,
+        "alert_quotes": alert_quotes,
     }
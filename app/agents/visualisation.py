@@ -1,13 +1,22 @@
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import os
 import io
 import base64
-from collections import Counter
+import threading
 import logging
 
+from app.document_text import document_text
+from app.terms import TermFrequencies
+
 log = logging.getLogger("visualisation")
 
+# Termes les plus fréquents transmis au nuage de mots
+WORDCLOUD_MAX_TERMS = 200
+
+# pyplot repose sur un état global: une seule figure à la fois entre threads
+_PLOT_LOCK = threading.Lock()
+
 # Import des bibliothèques de visualisation
 try:
     from wordcloud import WordCloud
@@ -21,8 +30,8 @@ except ImportError:
     log.warning("Bibliothèques de visualisation non disponibles. Installez: wordcloud, matplotlib, networkx")
 
 
-def generate_wordcloud(text: str, max_words: int = 100) -> str | None:
-    """Génère un nuage de mots et retourne l'image en base64"""
+def generate_wordcloud(frequencies: Dict[str, int], max_words: int = 100) -> str | None:
+    """Génère un nuage de mots à partir des fréquences de termes et retourne l'image en base64"""
     if not VISUALIZATION_AVAILABLE:
         return None
     
@@ -36,7 +45,7 @@ def generate_wordcloud(text: str, max_words: int = 100) -> str | None:
             colormap='viridis',
             relative_scaling=0.5,
             min_font_size=10
-        ).generate(text)
+        ).generate_from_frequencies(frequencies)
         
         # Sauvegarder dans un buffer
         buf = io.BytesIO()
@@ -56,8 +65,8 @@ def generate_wordcloud(text: str, max_words: int = 100) -> str | None:
         return None
 
 
-def generate_statistics_chart(extracted_info: Dict[str, Any], doc_type: str) -> str | None:
-    """Génère un graphique de statistiques selon le type de document"""
+def generate_statistics_chart(extracted_info: Dict[str, Any], doc_type: str, terms: Optional[TermFrequencies] = None) -> str | None:
+    """Génère un graphique de statistiques selon le type de document (fréquences réelles si terms est fourni)"""
     if not VISUALIZATION_AVAILABLE:
         return None
     
@@ -68,10 +77,12 @@ def generate_statistics_chart(extracted_info: Dict[str, Any], doc_type: str) ->
         if 'mots_cles' in extracted_info:
             keywords = extracted_info['mots_cles'][:10]
             if keywords:
-                axes[0].barh(range(len(keywords)), [1] * len(keywords), color='steelblue')
+                counts = [terms.frequency(k) for k in keywords] if terms is not None else []
+                real = any(counts)
+                axes[0].barh(range(len(keywords)), counts if real else [1] * len(keywords), color='steelblue')
                 axes[0].set_yticks(range(len(keywords)))
                 axes[0].set_yticklabels(keywords)
-                axes[0].set_xlabel('Fréquence relative')
+                axes[0].set_xlabel('Occurrences' if real else 'Fréquence relative')
                 axes[0].set_title('Top 10 Mots-Clés')
                 axes[0].invert_yaxis()
         
@@ -93,8 +104,8 @@ def generate_statistics_chart(extracted_info: Dict[str, Any], doc_type: str) ->
             data = {
                 'Parties': len(extracted_info.get('parties', [])),
                 'Montants': len(extracted_info.get('montants', [])),
-                'Obligations': len(extracted_info.get('obligations_principales', []))[:5],
-                'Clauses': len(extracted_info.get('clauses_resiliation', []))[:5],
+                'Obligations': len(extracted_info.get('obligations_principales', [])),
+                'Clauses': len(extracted_info.get('clauses_resiliation', [])),
             }
             axes[1].bar(data.keys(), data.values(), color='coral')
             axes[1].set_ylabel('Nombre d\'éléments')
@@ -215,20 +226,17 @@ def create_visualizations(doc: Dict[str, Any], extracted_info: Dict[str, Any]) -
             "status": "unavailable"
         }
     
-    # Extraire le texte complet pour le wordcloud
-    full_text = ""
-    for page in doc.get("pages", []):
-        full_text += page.get("text", "") + " "
-    
-    # Limiter le texte pour éviter les problèmes de mémoire
-    full_text = full_text[:10000]
+    # Fréquences de termes partagées avec l'extraction (calculées une fois par document)
+    terms = document_text(doc).terms
+    frequencies = dict(terms.most_common(WORDCLOUD_MAX_TERMS))
     
     doc_type = doc.get("document_type", "autre")
     doc_title = doc.get("filename", "Document")
     
-    return {
-        "wordcloud": generate_wordcloud(full_text, max_words=80) if full_text.strip() else None,
-        "statistics": generate_statistics_chart(extracted_info, doc_type),
-        "mindmap": generate_mindmap(extracted_info, doc_type, doc_title),
-        "status": "generated"
-    }
+    with _PLOT_LOCK:
+        return {
+            "wordcloud": generate_wordcloud(frequencies, max_words=80) if frequencies else None,
+            "statistics": generate_statistics_chart(extracted_info, doc_type, terms),
+            "mindmap": generate_mindmap(extracted_info, doc_type, doc_title),
+            "status": "generated"
+        }
@@ -0,0 +1,216 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+log = logging.getLogger("cache")
+
+# À incrémenter dès qu'un agent change la forme ou le contenu de sa sortie
+PIPELINE_VERSION = "7"
+
+CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", os.path.join("data", "cache"))
+CACHE_MAX_MB = int(os.environ.get("ANALYSIS_CACHE_MAX_MB", "512"))
+
+STAGES = (
+    "ingestion",
+    "detection",
+    "structuration",
+    "extraction",
+    "synthese",
+    "verification",
+    "visualisation",
+    "rapport",
+)
+
+
+def file_sha256(source: Any, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 d'un fichier (par chemin) ou d'un buffer bytes/memoryview."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    h = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stage_key(stage: str, **inputs: Any) -> str:
+    """Clé d'une sortie d'agent: nom de l'étape + ses entrées déclarées + PIPELINE_VERSION."""
+    payload = json.dumps(
+        {"stage": stage, "version": PIPELINE_VERSION, "inputs": inputs},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache persistant des sorties d'agents: un fichier JSON par (étape, clé),
+    rangé sous <root>/<étape>/<clé[:2]>/<clé>.json.
+    L'éviction est LRU sur la taille totale (la date de modification est
+    rafraîchie à chaque lecture). Les écritures sont atomiques, le cache peut
+    donc être partagé entre threads et processus.
+    La taille totale est tenue dans <root>/size.sqlite, mise à jour à chaque
+    écriture par toutes les instances: le cache n'est parcouru en entier que
+    pour l'éviction, ou pour recompter après invalidate()/clear().
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+
+    def _size_db(self) -> sqlite3.Connection:
+        os.makedirs(self.root, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.root, "size.sqlite"), timeout=30, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        return conn
+
+    def _add_size(self, delta: Optional[int]) -> int:
+        """
+        Ajoute delta à la taille enregistrée et la retourne; delta=None l'oublie
+        (recomptée au prochain appel). Taille inconnue: un parcours complet.
+        """
+        with self._lock:
+            conn = self._size_db()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if delta is None:
+                        conn.execute("DELETE FROM size")
+                        total = 0
+                    else:
+                        row = conn.execute("SELECT bytes FROM size WHERE id = 0").fetchone()
+                        total = self.size() if row is None else row[0] + delta
+                        conn.execute("INSERT OR REPLACE INTO size (id, bytes) VALUES (0, ?)", (total,))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.close()
+        return total
+
+    def _set_size(self, total: int) -> None:
+        with self._lock:
+            conn = self._size_db()
+            try:
+                conn.execute("INSERT OR REPLACE INTO size (id, bytes) VALUES (0, ?)", (total,))
+            finally:
+                conn.close()
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.root, stage, key[:2], f"{key}.json")
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        out = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, path))
+        return out
+
+    def get(self, stage: str, key: str) -> Any | None:
+        path = self._path(stage, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            log.warning("Entrée de cache illisible ignorée: %s", path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, stage: str, key: str, value: Any) -> None:
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            size = os.path.getsize(tmp)
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        if self._add_size(size) > self.max_bytes:
+            self.evict()
+
+    def invalidate(self, stage: str, key: Optional[str] = None) -> int:
+        """Supprime la sortie d'une étape pour une clé, ou pour toutes les clés si key est None."""
+        if stage not in STAGES:
+            raise ValueError(f"Étape inconnue: {stage!r}")
+        removed = 0
+        if key is not None:
+            path = self._path(stage, key)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                removed = 1
+            except FileNotFoundError:
+                pass
+            else:
+                self._add_size(-size)
+            return removed
+        else:
+            stage_dir = os.path.join(self.root, stage)
+            if os.path.isdir(stage_dir):
+                removed = sum(len(files) for _, _, files in os.walk(stage_dir))
+                shutil.rmtree(stage_dir, ignore_errors=True)
+        self._add_size(None)
+        return removed
+
+    def clear(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._files())
+
+    def stats(self) -> Dict[str, Any]:
+        files = self._files()
+        return {"entries": len(files), "bytes": sum(size for _, size, _ in files), "root": self.root}
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Supprime les entrées les moins récemment utilisées jusqu'à passer sous max_bytes."""
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._set_size(total)
+        if removed:
+            log.info("Cache: %d entrées évincées (%.1f Mo restants)", removed, total / (1024 * 1024))
+        return removed
@@ -0,0 +1,267 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from array import array
+from collections.abc import Sequence as SequenceABC
+from bisect import bisect_left, bisect_right
+
+from app.grounding import GroundingIndex, SentenceTable
+from app.terms import WORD_RE, TermFrequencies
+
+PAGE_SEP = "\n"
+
+
+class DocumentText:
+    """
+    Texte complet d'un document dans un seul buffer, avec un tableau d'offsets
+    par page. Les agents partagent cette instance (via document_text(doc)) au
+    lieu de reconcaténer les pages; les vues minuscules et tokenisées sont
+    calculées une seule fois.
+    """
+
+    __slots__ = ("text", "page_numbers", "starts", "ends", "_lower", "_tokens", "_token_starts", "_terms", "_sentences", "_grounding")
+
+    def __init__(self, texts: Sequence[str], page_numbers: Optional[Sequence[int]] = None):
+        self.text = PAGE_SEP.join(texts)
+        self.page_numbers = array("i", page_numbers if page_numbers is not None else range(1, len(texts) + 1))
+        self.starts = array("q")
+        self.ends = array("q")
+        pos = 0
+        for t in texts:
+            self.starts.append(pos)
+            self.ends.append(pos + len(t))
+            pos += len(t) + len(PAGE_SEP)
+        self._lower: Optional[str] = None
+        self._tokens: Optional[List[str]] = None
+        self._token_starts: Optional[array] = None
+        self._terms: Optional[TermFrequencies] = None
+        self._sentences: Optional[SentenceTable] = None
+        self._grounding: Optional[GroundingIndex] = None
+
+    @classmethod
+    def from_pages(cls, pages: Sequence[Dict[str, Any]]) -> "DocumentText":
+        texts, numbers = [], []
+        for i, p in enumerate(pages, start=1):
+            texts.append(p.get("text", "") or "")
+            numbers.append(p.get("page_number") or i)
+        return cls(texts, numbers)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @property
+    def num_pages(self) -> int:
+        return len(self.starts)
+
+    @property
+    def lower(self) -> str:
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    @property
+    def tokens(self) -> List[str]:
+        """
+        Mots en minuscules (app.terms.WORD_RE), dans l'ordre du texte: seule
+        tokenisation du document, reprise par les termes, l'ancrage et la
+        détection de type.
+        """
+        if self._tokens is None:
+            self._tokenize()
+        return self._tokens
+
+    @property
+    def token_starts(self) -> array:
+        """Offset dans text du début de chaque mot de tokens."""
+        if self._token_starts is None:
+            self._tokenize()
+        return self._token_starts
+
+    def _tokenize(self) -> None:
+        # lower() peut changer la longueur (ex: "İ"): les offsets sont alors pris sur text
+        same = len(self.lower) == len(self.text)
+        matches = list(WORD_RE.finditer(self.lower if same else self.text))
+        self._tokens = [m.group() if same else m.group().lower() for m in matches]
+        self._token_starts = array("q", [m.start() for m in matches])
+
+    def tokens_before(self, offset: int) -> List[str]:
+        """Mots qui commencent avant offset (ex: échantillon des premières pages)."""
+        return self.tokens[:bisect_left(self.token_starts, offset)]
+
+    @property
+    def terms(self) -> TermFrequencies:
+        """Fréquences des termes du document (app.terms), calculées au premier accès."""
+        if self._terms is None:
+            self._terms = TermFrequencies.from_tokens(self.tokens)
+        return self._terms
+
+    @property
+    def sentences(self) -> SentenceTable:
+        """Table des phrases par page (offsets dans text), calculée au premier accès."""
+        if self._sentences is None:
+            self._sentences = SentenceTable(self.text, self.starts, self.ends)
+        return self._sentences
+
+    @property
+    def grounding(self) -> GroundingIndex:
+        """Index d'ancrage (passages + index inversé, app.grounding), construit au premier accès."""
+        if self._grounding is None:
+            self._grounding = GroundingIndex.from_document_text(self)
+        return self._grounding
+
+    def release(self) -> None:
+        """Libère les vues dérivées (minuscules, tokens, termes, phrases, ancrage); le texte reste."""
+        self._lower = self._tokens = self._token_starts = self._terms = self._sentences = self._grounding = None
+
+    def page_span(self, index: int) -> Tuple[int, int]:
+        return self.starts[index], self.ends[index]
+
+    def page_text(self, index: int) -> str:
+        return self.text[self.starts[index]:self.ends[index]]
+
+    def pages_text(self, start: int = 0, stop: Optional[int] = None) -> str:
+        """Texte des pages [start, stop) (indices 0-based), en une seule tranche du buffer."""
+        stop = self.num_pages if stop is None else min(stop, self.num_pages)
+        if start >= stop:
+            return ""
+        return self.text[self.starts[start]:self.ends[stop - 1]]
+
+    def page_index_at(self, offset: int) -> int:
+        return max(0, bisect_right(self.starts, offset) - 1)
+
+    def page_number_at(self, offset: int) -> int:
+        return self.page_numbers[self.page_index_at(offset)]
+
+    def iter_pages(self) -> Iterator[Tuple[int, str]]:
+        for i in range(self.num_pages):
+            yield self.page_numbers[i], self.page_text(i)
+
+    @property
+    def pages(self) -> "PageView":
+        return PageView(self)
+
+
+class PageView(SequenceABC):
+    """
+    Séquence [{page_number, text}] adossée au buffer d'un DocumentText: le texte
+    d'une page n'est découpé qu'au moment où on la lit, aucune copie n'est gardée.
+    """
+
+    __slots__ = ("_dt",)
+
+    def __init__(self, dt: DocumentText):
+        self._dt = dt
+
+    def __len__(self) -> int:
+        return self._dt.num_pages
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return {"page_number": self._dt.page_numbers[index], "text": self._dt.page_text(index)}
+
+    def __reduce__(self):
+        return (PageView, (self._dt,))
+
+
+class Section(dict):
+    """
+    Section {title, start, end, pages} décrite par un intervalle [start, end) du
+    buffer d'un DocumentText: "content" n'est découpé qu'à la lecture et jamais
+    stocké. Une section sans buffer (ex: produite par le LLM) garde son
+    "content" littéral. Sérialisée en JSON, seule la forme compacte est écrite.
+    Attention: "content" n'est pas une vraie clé (absent de dict(section),
+    items(), json.dumps): les résultats rendus par le pipeline passent par
+    to_plain().
+    """
+
+    __slots__ = ("_dt",)
+
+    def __init__(self, dt: Optional[DocumentText], fields: Dict[str, Any]):
+        super().__init__(fields)
+        self._dt = dt if "content" not in fields else None
+
+    @property
+    def content(self) -> str:
+        if dict.__contains__(self, "content"):
+            return dict.__getitem__(self, "content")
+        if self._dt is None:
+            return ""
+        return self._dt.text[dict.get(self, "start", 0):dict.get(self, "end", 0)]
+
+    @property
+    def document(self) -> Optional[DocumentText]:
+        return self._dt
+
+    def __getitem__(self, key):
+        if key == "content":
+            return self.content
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == "content":
+            return self.content
+        return dict.get(self, key, default)
+
+    def __contains__(self, key) -> bool:
+        return key == "content" or dict.__contains__(self, key)
+
+    def __reduce__(self):
+        return (Section, (self._dt, dict(self)))
+
+
+def to_plain(value: Any) -> Any:
+    """
+    Copie de value (dicts et listes imbriqués) sans vues sur un buffer: chaque
+    Section devient un dict avec son "content", une PageView la liste de ses
+    pages. Forme rendue aux appelants (cache JSON, export, copies du dict).
+    """
+    if isinstance(value, Section):
+        return {**{k: to_plain(v) for k, v in dict.items(value)}, "content": value.content}
+    if isinstance(value, PageView):
+        return value[:]
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    return value
+
+
+def bind_sections(dt: DocumentText, sections: Sequence[Dict[str, Any]]) -> List[Section]:
+    """
+    (Re)lie des sections au buffer dt: celles qui ont start/end et pas de
+    content (ex: relues depuis le cache JSON) redeviennent des vues sur dt.
+    """
+    return [s if isinstance(s, Section) else Section(dt, s) for s in sections]
+
+
+def sections_document(sections: Sequence[Dict[str, Any]]) -> Optional[DocumentText]:
+    """Buffer commun si toutes les sections sont des intervalles d'un même DocumentText, sinon None."""
+    dt = None
+    for s in sections:
+        if not isinstance(s, Section) or s.document is None or (dt is not None and s.document is not dt):
+            return None
+        dt = s.document
+    return dt
+
+
+def share_document_text(doc: Dict[str, Any]) -> DocumentText:
+    """
+    Range tout le texte du document dans un DocumentText et remplace doc["pages"]
+    par une vue sur ce buffer: une seule copie du texte reste en mémoire.
+    """
+    dt = document_text(doc)
+    doc["pages"] = dt.pages
+    return dt
+
+
+def document_text(doc: Dict[str, Any]) -> DocumentText:
+    """DocumentText du document, construit au premier appel puis partagé par les agents."""
+    dt = doc.get("document_text")
+    if not isinstance(dt, DocumentText):
+        dt = DocumentText.from_pages(doc.get("pages", []))
+        doc["document_text"] = dt
+    return dt
@@ -0,0 +1,230 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from array import array
+from bisect import bisect_right
+import math
+import os
+import re
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from app.terms import STOPWORDS, tokenize
+
+# Taille max d'un passage (phrases consécutives d'une même page)
+CHUNK_MAX_CHARS = 400
+# Longueur max d'une citation (phrase autour du passage trouvé)
+QUOTE_MAX_CHARS = 300
+# Passages présélectionnés par BM25 pour chaque requête avant le score flou
+GROUNDING_CANDIDATES = int(os.environ.get("GROUNDING_CANDIDATES", "8"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class SentenceTable:
+    """
+    Table des phrases d'un document: intervalles [début, fin) dans le buffer,
+    calculés une fois page par page (une phrase ne franchit pas une page) et
+    triés par offset. page_first[i] .. page_first[i + 1] sont les phrases de la
+    page d'indice i. Sert au découpage en passages et aux citations.
+    """
+
+    __slots__ = ("starts", "ends", "page_first")
+
+    def __init__(self, text: str, page_starts: Sequence[int], page_ends: Sequence[int]):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.page_first = array("q")
+        for lo, hi in zip(page_starts, page_ends):
+            self.page_first.append(len(self.starts))
+            start = lo
+            for m in SENTENCE_END.finditer(text, lo, hi):
+                self.starts.append(start)
+                self.ends.append(m.start())
+                start = m.end()
+            if start < hi:
+                self.starts.append(start)
+                self.ends.append(hi)
+        self.page_first.append(len(self.starts))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def page_sentences(self, page_index: int) -> List[Tuple[int, int]]:
+        lo, hi = self.page_first[page_index], self.page_first[page_index + 1]
+        return list(zip(self.starts[lo:hi], self.ends[lo:hi]))
+
+    def index_at(self, offset: int) -> int:
+        """Indice de la phrase qui contient (ou précède) offset."""
+        return max(0, bisect_right(self.starts, offset) - 1)
+
+    def cover(self, start: int, end: int) -> Tuple[int, int]:
+        """[début, fin) des phrases qui couvrent l'intervalle [start, end)."""
+        if not len(self.starts):
+            return start, end
+        first, last = self.index_at(start), self.index_at(max(start, end - 1))
+        return min(self.starts[first], start), max(self.ends[last], end)
+
+
+def _page_chunks(text: str, sentences: Sequence[Tuple[int, int]], max_chars: int) -> List[Tuple[int, int]]:
+    """Passages [début, fin) d'une page: phrases regroupées jusqu'à max_chars, phrases trop longues coupées aux espaces."""
+    chunks: List[Tuple[int, int]] = []
+    cur: Optional[List[int]] = None
+    for a, b in sentences:
+        while b - a > max_chars:
+            if cur is not None:
+                chunks.append((cur[0], cur[1]))
+                cur = None
+            cut = max(text.rfind(" ", a + max_chars // 2, a + max_chars), text.rfind("\n", a + max_chars // 2, a + max_chars))
+            if cut <= a:
+                cut = a + max_chars
+            chunks.append((a, cut))
+            a = cut + 1 if text[cut].isspace() else cut
+        if a >= b:
+            continue
+        if cur is None:
+            cur = [a, b]
+        elif b - cur[0] <= max_chars:
+            cur[1] = b
+        else:
+            chunks.append((cur[0], cur[1]))
+            cur = [a, b]
+    if cur is not None:
+        chunks.append((cur[0], cur[1]))
+    return chunks
+
+
+class GroundingIndex:
+    """
+    Index d'ancrage d'un document, construit une fois sur le buffer partagé
+    (DocumentText.grounding): passages de phrases d'une même page, index
+    inversé mot -> (passage, tf) en tableaux CSR numpy, et présélection BM25.
+    ground() rapproche des textes (points clés...) de leurs meilleurs passages:
+    BM25 retient GROUNDING_CANDIDATES passages par requête, puis un seul
+    rapidfuzz.process.cpdist (workers=-1) note toutes les paires en lot.
+    """
+
+    __slots__ = ("text", "starts", "ends", "pages", "vocab", "indptr", "post_chunks", "post_tf", "chunk_len", "avg_len")
+
+    def __init__(self, text: str, tokens: Sequence[str], token_starts: Sequence[int], sentences: SentenceTable, page_numbers: Sequence[int]):
+        self.text = text
+        self.starts = array("q")
+        self.ends = array("q")
+        self.pages = array("i")
+        for i, page_no in enumerate(page_numbers):
+            for a, b in _page_chunks(text, sentences.page_sentences(i), CHUNK_MAX_CHARS):
+                self.starts.append(a)
+                self.ends.append(b)
+                self.pages.append(page_no)
+
+        # Index inversé: (mot, passage) -> tf, trié par mot (indptr[mot] .. indptr[mot + 1])
+        self.vocab: dict = {}
+        token_ids = [self.vocab.setdefault(w, len(self.vocab)) for w in tokens]
+        n = len(self.starts)
+        chunk_ids = np.searchsorted(np.frombuffer(self.starts, dtype=np.int64), np.asarray(token_starts, dtype=np.int64), side="right") - 1
+        keys, tf = np.unique(np.asarray(token_ids, dtype=np.int64) * max(n, 1) + chunk_ids, return_counts=True)
+        self.post_chunks = (keys % max(n, 1)).astype(np.int32)
+        self.post_tf = tf.astype(np.float32)
+        self.indptr = np.searchsorted(keys // max(n, 1), np.arange(len(self.vocab) + 1))
+        self.chunk_len = np.bincount(chunk_ids, minlength=n).astype(np.float32) if n else np.zeros(0, dtype=np.float32)
+        self.avg_len = float(self.chunk_len.mean()) if n else 0.0
+
+    @classmethod
+    def from_document_text(cls, dt: Any) -> "GroundingIndex":
+        return cls(dt.text, dt.tokens, dt.token_starts, dt.sentences, dt.page_numbers)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def chunk(self, index: int) -> Tuple[int, int, int]:
+        """(début, fin, numéro de page) d'un passage."""
+        return self.starts[index], self.ends[index], self.pages[index]
+
+    def chunk_text(self, index: int) -> str:
+        return self.text[self.starts[index]:self.ends[index]]
+
+    def _query_ids(self, query: str) -> List[int]:
+        words = {w for w in tokenize(query.lower()) if len(w) > 1 and w not in STOPWORDS}
+        return [self.vocab[w] for w in words if w in self.vocab]
+
+    def candidates(self, query: str, k: int = GROUNDING_CANDIDATES) -> np.ndarray:
+        """Indices des k meilleurs passages selon BM25 (score > 0), du meilleur au moins bon."""
+        n = len(self)
+        ids = self._query_ids(query)
+        if not n or not ids:
+            return np.zeros(0, dtype=np.int64)
+        chunks, weights = [], []
+        for t in ids:
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            c = self.post_chunks[lo:hi]
+            tf = self.post_tf[lo:hi]
+            df = hi - lo
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.chunk_len[c] / (self.avg_len or 1.0))
+            chunks.append(c)
+            weights.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        scores = np.bincount(np.concatenate(chunks), weights=np.concatenate(weights), minlength=n)
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        return hits[np.argsort(-scores[hits], kind="stable")]
+
+    def ground(self, queries: Sequence[str], k: int = GROUNDING_CANDIDATES, scorer: Any = fuzz.token_set_ratio) -> List[List[Tuple[int, float]]]:
+        """
+        Pour chaque requête, ses passages candidats [(indice, score 0-100)] du
+        meilleur au moins bon. Toutes les paires (requête, candidat) sont notées
+        en un seul appel rapidfuzz.process.cpdist (workers=-1).
+        """
+        cands = [self.candidates(q, k) for q in queries]
+        pairs_q = [q for q, c in zip(queries, cands) for _ in range(len(c))]
+        if not pairs_q:
+            return [[] for _ in queries]
+        texts = [self.chunk_text(int(i)) for c in cands for i in c]
+        scores = process.cpdist(pairs_q, texts, scorer=scorer, workers=-1)
+        out: List[List[Tuple[int, float]]] = []
+        pos = 0
+        for c in cands:
+            row = scores[pos:pos + len(c)]
+            pos += len(c)
+            order = np.argsort(-row, kind="stable")
+            out.append([(int(c[j]), float(row[j])) for j in order])
+        return out
+
+
+def locate_quote(dt: Any, query: str, start: int, end: int) -> Optional[Dict[str, Any]]:
+    """
+    Citation d'un texte (point clé) dans la zone [start, end) du buffer
+    (passage ou page): meilleur alignement partiel (fuzz.partial_ratio_alignment)
+    puis phrase(s) qui l'entourent, lues dans la table dt.sentences.
+    Retourne {start, end, page, score, before, match, after, sentence_start,
+    sentence_end} ou None si la zone est vide; la phrase est bornée à
+    QUOTE_MAX_CHARS autour du passage trouvé.
+    """
+    lower = dt.lower if len(dt.lower) == len(dt.text) else None
+    zone = lower[start:end] if lower is not None else dt.text[start:end].lower()
+    if not zone.strip() or not query.strip():
+        return None
+    al = fuzz.partial_ratio_alignment(query.lower(), zone)
+    text = dt.text
+    m_start, m_end = start + al.dest_start, start + al.dest_end
+    # Extrait élargi aux mots entiers
+    while m_start > start and text[m_start - 1].isalnum():
+        m_start -= 1
+    while m_end < end and text[m_end].isalnum():
+        m_end += 1
+    s_start, s_end = dt.sentences.cover(m_start, m_end)
+    margin = max(0, QUOTE_MAX_CHARS - (m_end - m_start)) // 2
+    s_start, s_end = max(s_start, m_start - margin), min(s_end, m_end + margin)
+    return {
+        "start": m_start,
+        "end": m_end,
+        "page": dt.page_number_at(m_start),
+        "score": round(al.score, 1),
+        "before": text[s_start:m_start].lstrip(),
+        "match": text[m_start:m_end],
+        "after": text[m_end:s_end].rstrip(),
+        "sentence_start": s_start,
+        "sentence_end": s_end,
+    }
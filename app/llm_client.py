@@ -1,26 +1,107 @@
 from __future__ import annotations
+import asyncio
+import contextvars
 import os
 import json
 import re
-from typing import Optional, Dict, Any
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 
+import httpx
 from mistralai import Mistral
 from jsonschema import validate as js_validate, ValidationError  # type: ignore
 
+# Appels LLM simultanés au plus: sémaphore des appels synchrones (tous threads)
+# et sémaphore par boucle asyncio; c'est aussi la taille des pools de connexions HTTP.
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_S = float(os.environ.get("LLM_TIMEOUT_S", "120"))
 
 _CLIENT: Optional[Mistral] = None
+_CLIENT_LOCK = threading.Lock()
+_SYNC_SLOTS = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+# Client asynchrone (pool httpx.AsyncClient partagé) et sémaphore de chaque boucle asyncio
+_ASYNC: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[Mistral, httpx.AsyncClient, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+# Boucle vers laquelle chat() (appelé depuis un thread) route ses appels (voir route_sync_calls).
+# Variable de contexte: deux analyses asynchrones concurrentes (boucles différentes) ne se mélangent pas.
+_ROUTED_LOOP: "contextvars.ContextVar[Optional[asyncio.AbstractEventLoop]]" = contextvars.ContextVar("llm_routed_loop", default=None)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY)
+
+
+def _client_options() -> Dict[str, Any]:
+    api_key = os.environ.get("MISTRAL_API_KEY")
+    if not api_key:
+        raise RuntimeError("MISTRAL_API_KEY non définie")
+    # MISTRAL_SERVER_URL: autre serveur compatible (proxy, faux serveur local de test)
+    return {"api_key": api_key, "server_url": os.environ.get("MISTRAL_SERVER_URL") or None}
 
 
 def _get_client() -> Mistral:
     global _CLIENT
-    if _CLIENT is None:
-        api_key = os.environ.get("MISTRAL_API_KEY")
-        if not api_key:
-            raise RuntimeError("MISTRAL_API_KEY non définie")
-        _CLIENT = Mistral(api_key=api_key)
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = Mistral(**_client_options(), client=httpx.Client(limits=_limits(), timeout=LLM_TIMEOUT_S))
     return _CLIENT
 
 
+def _get_async_client() -> Tuple[Mistral, asyncio.Semaphore]:
+    """Client et sémaphore de la boucle courante, créés au premier appel (un httpx.AsyncClient est lié à sa boucle)."""
+    loop = asyncio.get_running_loop()
+    state = _ASYNC.get(loop)
+    if state is None:
+        http = httpx.AsyncClient(limits=_limits(), timeout=LLM_TIMEOUT_S)
+        state = (Mistral(**_client_options(), async_client=http), http, asyncio.Semaphore(LLM_MAX_CONCURRENCY))
+        _ASYNC[loop] = state
+    return state[0], state[2]
+
+
+async def aclose() -> None:
+    """Ferme le pool de connexions asynchrone de la boucle courante."""
+    state = _ASYNC.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state[1].aclose()
+
+
+@contextmanager
+def route_sync_calls(loop: asyncio.AbstractEventLoop) -> Iterator[None]:
+    """
+    Pendant le bloc, chat() appelé depuis un autre thread que celui de loop
+    (agents synchrones lancés dans un pool) passe par achat() sur loop: même
+    pool de connexions et même sémaphore que les appels asynchrones.
+    Le réglage vit dans le contexte courant (contextvars): les threads doivent
+    être lancés dans une copie de ce contexte (contextvars.copy_context().run).
+    """
+    token = _ROUTED_LOOP.set(loop)
+    try:
+        yield
+    finally:
+        _ROUTED_LOOP.reset(token)
+
+
+def _routed_loop() -> Optional[asyncio.AbstractEventLoop]:
+    loop = _ROUTED_LOOP.get()
+    if loop is None or loop.is_closed() or not loop.is_running():
+        return None
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    # Depuis le thread de la boucle elle-même, attendre le résultat bloquerait la boucle
+    return None if running is loop else loop
+
+
+def _messages(prompt: str, system: Optional[str]) -> List[Dict[str, str]]:
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
 def is_configured() -> bool:
     """Return True if Mistral API key is available."""
     return os.environ.get("MISTRAL_API_KEY") is not None
@@ -52,21 +133,26 @@ def chat(
     max_tokens: Optional[int] = None,
 ) -> str:
     """Chat with Mistral API, return text or empty string on error."""
+    loop = _routed_loop()
+    if loop is not None:
+        future = asyncio.run_coroutine_threadsafe(
+            achat(prompt, system=system, model=model, temperature=temperature, max_tokens=max_tokens), loop
+        )
+        try:
+            return future.result()
+        except Exception:
+            return ""
     try:
         client = _get_client()
         model = model or os.environ.get("MISTRAL_MODEL", "mistral-small-latest")
-        
-        messages = []
-        if system:
-            messages.append({"role": "system", "content": system})
-        messages.append({"role": "user", "content": prompt})
-
-        response = client.chat.complete(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens or 1024,
-        )
+
+        with _SYNC_SLOTS:
+            response = client.chat.complete(
+                model=model,
+                messages=_messages(prompt, system),
+                temperature=temperature,
+                max_tokens=max_tokens or 1024,
+            )
         
         return response.choices[0].message.content or ""
     except Exception:
@@ -74,6 +160,33 @@ def chat(
         return ""
 
 
+async def achat(
+    prompt: str,
+    system: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """
+    Version asynchrone de chat() (client.chat.complete_async): au plus
+    LLM_MAX_CONCURRENCY appels en vol par boucle, connexions HTTP réutilisées.
+    Retourne "" en cas d'erreur.
+    """
+    try:
+        client, slots = _get_async_client()
+        model = model or os.environ.get("MISTRAL_MODEL", "mistral-small-latest")
+        async with slots:
+            response = await client.chat.complete_async(
+                model=model,
+                messages=_messages(prompt, system),
+                temperature=temperature,
+                max_tokens=max_tokens or 1024,
+            )
+        return response.choices[0].message.content or ""
+    except Exception:
+        return ""
+
+
 def _extract_json(text: str) -> Optional[Dict[str, Any]]:
     text = re.sub(r"^```(json)?\n|\n```$", "", text.strip(), flags=re.IGNORECASE)
     m = re.search(r"\{[\s\S]*\}$", text)
@@ -110,6 +223,10 @@ def chat_json_schema(
     max_tokens: Optional[int] = None,
 ) -> Optional[Dict[str, Any]]:
     data = chat_json(prompt, system=system, model=model, temperature=temperature, max_tokens=max_tokens)
+    return _validated(data, schema)
+
+
+def _validated(data: Any, schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if not isinstance(data, dict):
         return None
     try:
@@ -117,3 +234,26 @@ def chat_json_schema(
         return data
     except ValidationError:
         return None
+
+
+async def achat_json(
+    prompt: str,
+    system: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    text = await achat(prompt, system=system, model=model, temperature=temperature, max_tokens=max_tokens)
+    return _extract_json(text)
+
+
+async def achat_json_schema(
+    prompt: str,
+    schema: Dict[str, Any],
+    system: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    data = await achat_json(prompt, system=system, model=model, temperature=temperature, max_tokens=max_tokens)
+    return _validated(data, schema)
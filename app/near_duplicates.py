@@ -0,0 +1,263 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import difflib
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+
+log = logging.getLogger("near_duplicates")
+
+NEAR_DUPLICATE_INDEX_PATH = os.environ.get("NEAR_DUPLICATE_INDEX_PATH", os.path.join("data", "index", "near_duplicates.sqlite"))
+# Similarité de Jaccard estimée (shingles de mots) à partir de laquelle deux documents sont des quasi-doublons
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+# MinHash: NUM_PERM permutations, LSH en LSH_BANDS bandes de NUM_PERM / LSH_BANDS lignes.
+# Avec 16 x 8, une paire à 0.8 de similarité partage au moins un seau dans ~95 % des cas,
+# une paire à 0.5 dans ~6 %.
+NUM_PERM = 128
+LSH_BANDS = 16
+SHINGLE_WORDS = 5
+# Nombre de shingles traités par bloc (borne la matrice NUM_PERM x bloc en mémoire)
+_BLOCK = 8192
+
+_PRIME = np.uint64(4294967311)  # plus petit premier > 2**32
+_rng = np.random.RandomState(20240917)
+# a < 2**31 et h < 2**32: a * h + b tient dans un uint64 sans débordement
+_PERM_A = _rng.randint(1, 2**31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_PERM_B = _rng.randint(0, 2**31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    num_pages INTEGER NOT NULL,
+    report_path TEXT,
+    signature BLOB NOT NULL,
+    pages BLOB NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS buckets_doc ON buckets (doc_id);
+CREATE TABLE IF NOT EXISTS stages (
+    doc_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (doc_id, stage)
+) WITHOUT ROWID;
+"""
+
+
+def minhash_signature(tokens: Sequence[str], shingle_words: int = SHINGLE_WORDS) -> Optional[np.ndarray]:
+    """
+    Signature MinHash (NUM_PERM valeurs uint64) de l'ensemble des shingles de
+    shingle_words mots consécutifs. Les mots sont hachés une fois (crc32 par mot
+    distinct), les shingles par un hachage polynomial vectorisé. None si le
+    texte n'a aucun mot.
+    """
+    if not tokens:
+        return None
+    vocab: Dict[str, int] = {}
+    ids = np.fromiter((vocab.setdefault(t, len(vocab)) for t in tokens), dtype=np.int64, count=len(tokens))
+    word_hash = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in vocab), dtype=np.uint64, count=len(vocab))[ids]
+    k = min(shingle_words, len(word_hash))
+    # h = sum(mot[i + j] * 31**j) mod 2**32 (arithmétique uint64 puis masque)
+    shingles = np.zeros(len(word_hash) - k + 1, dtype=np.uint64)
+    for j in range(k):
+        shingles = (shingles * np.uint64(31) + word_hash[j:len(word_hash) - k + 1 + j]) & np.uint64(0xFFFFFFFF)
+    shingles = np.unique(shingles)
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for lo in range(0, len(shingles), _BLOCK):
+        block = shingles[lo:lo + _BLOCK]
+        hashed = (_PERM_A[:, None] * block[None, :] + _PERM_B[:, None]) % _PRIME
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return signature
+
+
+def lsh_buckets(signature: np.ndarray, bands: int = LSH_BANDS) -> List[int]:
+    """Seau (entier signé 64 bits, pour sqlite) de chaque bande de la signature."""
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "big", signed=True)
+        for band in np.split(signature, bands)
+    ]
+
+
+def estimated_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Similarité de Jaccard estimée: part des permutations de même minimum."""
+    return float(np.mean(a == b))
+
+
+def page_fingerprints(pages: Sequence[str]) -> np.ndarray:
+    """Empreinte 64 bits du texte de chaque page (casse et espaces normalisés)."""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(" ".join(p.lower().split()).encode("utf-8"), digest_size=8).digest(), "big", signed=True) for p in pages],
+        dtype=np.int64,
+    )
+
+
+def page_diff(old: np.ndarray, new: np.ndarray) -> Dict[str, Any]:
+    """
+    Différences page à page entre une version antérieure et le document courant
+    (numéros de page à partir de 1): pages identiques, pages modifiées ou
+    ajoutées dans le nouveau document, pages retirées de l'ancien.
+    """
+    matcher = difflib.SequenceMatcher(None, old.tolist(), new.tolist(), autojunk=False)
+    changed: List[int] = []
+    removed: List[int] = []
+    identical = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            identical += i2 - i1
+        else:
+            changed.extend(range(j1 + 1, j2 + 1))
+            if tag == "delete" or (tag == "replace" and i2 - i1 > j2 - j1):
+                removed.extend(range(i1 + 1 + (j2 - j1), i2 + 1))
+    return {"identical_pages": identical, "changed_pages": changed, "removed_pages": removed}
+
+
+class NearDuplicateIndex:
+    """
+    Index persistant (sqlite) des documents analysés pour repérer les quasi-
+    doublons (même contrat légèrement modifié, nouveau scan...): signature
+    MinHash du texte ingéré et seaux LSH par bande. find() ne lit que les
+    documents qui partagent un seau avec la requête (lookup indexé, sous-
+    linéaire en taille du corpus), puis compare leurs signatures.
+    Pour chaque document sont aussi gardées les empreintes de ses pages (diff)
+    et les clés de cache de ses étapes avec le réglage qui les a produites:
+    l'orchestrateur reprend ces sorties au lieu de relancer les agents.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: Optional[float] = None):
+        self.path = path or NEAR_DUPLICATE_INDEX_PATH
+        self.threshold = NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "NearDuplicateIndex":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def num_documents(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def find(self, sha256: str, signature: np.ndarray, pages: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        """
+        Document indexé le plus proche (autre que sha256) dont la similarité
+        estimée atteint le seuil, ou None. Retourne {sha256, filename,
+        report_path, similarity, stages: {étape: (réglage, clé)}} et, si pages
+        est donné, diff (voir page_diff).
+        """
+        conn = self._conn
+        candidates = set()
+        for band, bucket in enumerate(lsh_buckets(signature)):
+            candidates.update(r[0] for r in conn.execute("SELECT doc_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)))
+        best: Optional[Tuple[float, tuple]] = None
+        for doc_id in candidates:
+            row = conn.execute(
+                "SELECT id, sha256, filename, report_path, signature, pages FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if row is None or row[1] == sha256:
+                continue
+            score = estimated_similarity(signature, np.frombuffer(row[4], dtype=np.uint64))
+            if score >= self.threshold and (best is None or score > best[0]):
+                best = (score, row)
+        if best is None:
+            return None
+        score, (doc_id, sha, filename, report_path, _, old_pages) = best
+        match: Dict[str, Any] = {
+            "sha256": sha,
+            "filename": filename,
+            "report_path": report_path,
+            "similarity": round(score, 3),
+            "stages": {stage: (settings, key) for stage, settings, key in conn.execute(
+                "SELECT stage, settings, key FROM stages WHERE doc_id = ?", (doc_id,)
+            )},
+        }
+        if pages is not None:
+            match["diff"] = page_diff(np.frombuffer(old_pages, dtype=np.int64), pages)
+        return match
+
+    def add_document(
+        self,
+        sha256: str,
+        signature: np.ndarray,
+        pages: np.ndarray,
+        filename: Optional[str] = None,
+        report_path: Optional[str] = None,
+        stages: Optional[Dict[str, Tuple[str, str]]] = None,
+    ) -> None:
+        """
+        Ajoute (ou remplace) un document: signature, seaux LSH, empreintes de
+        pages et clés d'étapes. stages=None (analyse sans cache) garde les clés
+        d'étapes déjà enregistrées pour ce document.
+        """
+        conn = self._conn
+        values = (filename, len(pages), report_path, signature.astype(np.uint64).tobytes(), pages.astype(np.int64).tobytes(), time.time())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None:
+                doc_id = row[0]
+                conn.execute(
+                    "UPDATE documents SET filename = ?, num_pages = ?, report_path = ?, signature = ?, pages = ?, indexed_at = ? WHERE id = ?",
+                    (*values, doc_id),
+                )
+                conn.execute("DELETE FROM buckets WHERE doc_id = ?", (doc_id,))
+                if stages is not None:
+                    conn.execute("DELETE FROM stages WHERE doc_id = ?", (doc_id,))
+            else:
+                doc_id = conn.execute(
+                    "INSERT INTO documents (filename, num_pages, report_path, signature, pages, indexed_at, sha256) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*values, sha256),
+                ).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO buckets (band, bucket, doc_id) VALUES (?, ?, ?)",
+                ((band, bucket, doc_id) for band, bucket in enumerate(lsh_buckets(signature))),
+            )
+            conn.executemany(
+                "INSERT INTO stages (doc_id, stage, settings, key) VALUES (?, ?, ?, ?)",
+                ((doc_id, stage, settings, key) for stage, (settings, key) in (stages or {}).items()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove_document(self, sha256: str) -> bool:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None:
+                self._remove(row[0])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def _remove(self, doc_id: int) -> None:
+        conn = self._conn
+        conn.execute("DELETE FROM buckets WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM stages WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
@@ -1,79 +1,405 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Collection, Iterator, Optional, Tuple
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+import asyncio
+import contextvars
 import os
 import logging
+import multiprocessing
+import queue
 import random
+import weakref
 
-from app.agents.ingestion import ingest_pdfs
-from app.agents.type_detection import detect_document_type
+from app.agents.ingestion import ingest_pdf, ingest_pdf_guarded, PdfBuffer, PdfSource, source_name, source_path
+from app.agents.type_detection import (
+    detect_document_type_cascade,
+    detect_document_type_llm,
+    type_model_id,
+    ESCALATION_MIN_CONFIDENCE,
+    ESCALATION_MIN_MARGIN,
+)
 from app.agents.structuration import segment_document
-from app.agents.extraction import extract_information
+from app.agents.extraction import extract_information, EXTRACTION_META_KEYS, LLM_EXTRACTION_MODE
 from app.agents.synthese import synthesize
-from app.agents.verification import verify_and_annotate
+from app.agents.verification import verify_and_annotate, VERIFICATION_ENGINE
 from app.agents.rapport import build_report
 from app.agents.visualisation import create_visualizations
+from app.cache import ResultCache, stage_key, file_sha256
+from app.term_index import TermIndex
+from app.near_duplicates import NearDuplicateIndex, minhash_signature, page_fingerprints
+from app.document_text import bind_sections, document_text, share_document_text, to_plain
 from app.logging_config import configure_logging
+from app.llm_client import LLM_MAX_CONCURRENCY, aclose as llm_aclose, route_sync_calls
 
+EXECUTORS = ("thread", "process")
 
-def analyze_pdfs(file_paths: List[str], use_llm: bool = False, llm_model: str | None = None, force_type: str | None = None, detection_mode: str | None = None) -> List[Dict[str, Any]]:
-    configure_logging()
-    log = logging.getLogger("orchestrator")
-    docs = ingest_pdfs(file_paths)
-    results: List[Dict[str, Any]] = []
+# Agents pouvant appeler le LLM (use_llm peut en désigner un sous-ensemble)
+LLM_STAGES = ("detection", "structuration", "extraction", "synthese")
 
-    for doc in docs:
-        # Initialiser le suivi des agents
-        agent_details = {
-            "ingestion": {"status": "✅", "description": f"{doc.get('num_pages', 0)} pages extraites", "data": {}},
-            "detection": {"status": "⏳", "description": "En cours...", "data": {}},
-            "structuration": {"status": "⏳", "description": "En attente", "data": {}},
-            "extraction": {"status": "⏳", "description": "En attente", "data": {}},
-            "synthese": {"status": "⏳", "description": "En attente", "data": {}},
-            "verification": {"status": "⏳", "description": "En attente", "data": {}},
-            "visualisation": {"status": "⏳", "description": "En attente", "data": {}},
-        }
-        
-        log.info("[1/6] Détection du type...")
-        if force_type in {"article_scientifique", "contrat", "cv", "cours", "autre"}:
-            doc["document_type"] = force_type
-            doc["type_confidence"] = 1.0
-            log.info(f"Type forcé: %s pour %s", force_type, doc.get("filename"))
-            agent_details["detection"] = {
-                "status": "✅", 
+# Entrées déclarées de chaque agent: étapes amont (via leur clé de cache) et
+# options/valeurs qui influencent sa sortie. Une étape n'est recalculée que si
+# l'une de ses entrées change; "llm" vaut le modèle si l'agent utilise le LLM.
+STAGE_GRAPH: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "ingestion": {"stages": (), "inputs": ("file", "layout")},
+    "detection": {"stages": ("ingestion",), "inputs": ("llm", "force_type", "detection_mode", "type_model", "escalation")},
+    "structuration": {"stages": ("ingestion",), "inputs": ("llm",)},
+    "extraction": {"stages": ("ingestion", "structuration"), "inputs": ("llm", "document_type", "term_index", "extraction_mode")},
+    "synthese": {"stages": ("ingestion", "structuration", "extraction"), "inputs": ("llm", "document_type")},
+    "verification": {"stages": ("ingestion", "synthese"), "inputs": ("verification_engine",)},
+    "visualisation": {"stages": ("ingestion", "extraction"), "inputs": ("document_type", "filename")},
+    "rapport": {
+        "stages": ("ingestion", "extraction", "synthese", "verification", "visualisation"),
+        "inputs": ("document_type", "filename", "near_duplicate"),
+    },
+}
+
+# Étapes reprises d'une version antérieure dont toutes les pages sont identiques
+# (near_duplicates=True): leurs sorties ne référencent pas d'offsets dans le texte
+# (sauf "offsets" de l'extraction, retiré). Structuration, vérification (contre
+# le nouveau texte), visualisations et rapport sont recalculés. Dès qu'une page
+# diffère, rien n'est repris: ces agents tournent sur le nouveau texte.
+NEAR_DUPLICATE_STAGES = ("detection", "extraction", "synthese")
+
+
+def llm_fallback(value: Any) -> bool:
+    """
+    Vrai si la sortie d'un agent LLM vient du repli heuristique (LLM non
+    configuré, en échec ou hors délai), d'après "llm_fallback" (détection),
+    "source" (structuration, synthèse) ou "sources" (extraction, par groupe).
+    """
+    if not isinstance(value, dict):
+        return False
+    if value.get("llm_fallback") or value.get("source") == "heuristique":
+        return True
+    return any(v != "llm" for v in (value.get("sources") or {}).values())
+
+
+def downstream_stages(stage: str) -> List[str]:
+    """Étapes qui dépendent (directement ou non) de stage, dans l'ordre du pipeline."""
+    affected = {stage}
+    for name, spec in STAGE_GRAPH.items():
+        if any(dep in affected for dep in spec["stages"]):
+            affected.add(name)
+    return [name for name in STAGE_GRAPH if name in affected and name != stage]
+
+
+def _llm_enabled(use_llm: bool | Collection[str], stage: str) -> bool:
+    if isinstance(use_llm, bool):
+        return use_llm
+    return stage in use_llm
+
+
+def _pending_agent_details() -> Dict[str, Dict[str, Any]]:
+    return {
+        "ingestion": {"status": "⏳", "description": "En cours...", "data": {}},
+        "detection": {"status": "⏳", "description": "En attente", "data": {}},
+        "structuration": {"status": "⏳", "description": "En attente", "data": {}},
+        "extraction": {"status": "⏳", "description": "En attente", "data": {}},
+        "synthese": {"status": "⏳", "description": "En attente", "data": {}},
+        "verification": {"status": "⏳", "description": "En attente", "data": {}},
+        "visualisation": {"status": "⏳", "description": "En attente", "data": {}},
+    }
+
+
+def _detect(doc: Dict[str, Any], use_llm: bool, llm_model: str | None, force_type: str | None, detection_mode: str | None) -> Dict[str, Any]:
+    log = logging.getLogger("orchestrator")
+    if force_type in {"article_scientifique", "contrat", "cv", "cours", "autre"}:
+        log.info(f"Type forcé: %s pour %s", force_type, doc.get("filename"))
+        return {
+            "document_type": force_type,
+            "type_confidence": 1.0,
+            "details": {
+                "status": "✅",
                 "description": f"Type forcé: {force_type}",
                 "data": {"type": force_type, "confidence": 1.0, "method": "Forcé par utilisateur"}
-            }
+            },
+        }
+    if detection_mode == "random":
+        dtype = random.choice(["article_scientifique", "contrat", "cv", "cours", "autre"])
+        conf = 0.5
+        llm_fallback = False
+        log.info("Type choisi aléatoirement: %s pour %s", dtype, doc.get("filename"))
+        details = {
+            "status": "✅",
+            "description": f"Type: {dtype} (aléatoire)",
+            "data": {"type": dtype, "confidence": conf, "method": "Sélection aléatoire"}
+        }
+    elif detection_mode == "cascade":
+        r = detect_document_type_cascade(doc, use_llm=use_llm, model=llm_model)
+        dtype, conf = r["type"], r["confidence"]
+        # Escalade nécessaire mais sans réponse du LLM: repli heuristique
+        llm_fallback = use_llm and r["escalated"] and not r["llm_used"]
+        if r["llm_used"]:
+            method = "Heuristiques puis LLM (cas incertain)"
+        elif r["escalated"]:
+            method = "Heuristiques (cas incertain, LLM indisponible)"
         else:
-            if detection_mode == "random":
-                dtype = random.choice(["article_scientifique", "contrat", "cv", "cours", "autre"])
-                conf = 0.5
-                log.info("Type choisi aléatoirement: %s pour %s", dtype, doc.get("filename"))
-                agent_details["detection"] = {
-                    "status": "✅", 
-                    "description": f"Type: {dtype} (aléatoire)",
-                    "data": {"type": dtype, "confidence": conf, "method": "Sélection aléatoire"}
-                }
+            method = "Heuristiques (LLM évité)"
+        details = {
+            "status": "✅",
+            "description": f"Type: {dtype} (conf: {conf:.2f})",
+            "data": {
+                "type": dtype,
+                "confidence": conf,
+                "method": method,
+                "margin": r["margin"],
+                "llm_escalated": r["escalated"],
+                "llm_call_saved": use_llm and not r["escalated"],
+            }
+        }
+    else:
+        r = detect_document_type_llm(doc, use_llm=use_llm, model=llm_model)
+        dtype, conf = r["type"], r["confidence"]
+        llm_fallback = use_llm and not r["llm_used"]
+        details = {
+            "status": "✅",
+            "description": f"Type: {dtype} (conf: {conf:.2f})",
+            "data": {
+                "type": dtype,
+                "confidence": conf,
+                "method": ("LLM" if r["llm_used"] else "Heuristiques (LLM sans réponse)") if use_llm else "Heuristiques seules"
+            }
+        }
+    log.info("Type détecté: %s (%.2f) pour %s", dtype, conf, doc.get("filename"))
+    return {"document_type": dtype, "type_confidence": conf, "details": details, "llm_fallback": llm_fallback}
+
+
+def detection_counters(docs: List[Dict[str, Any]], counters: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Compteurs du mode cascade sur un lot de résultats: documents tranchés par les
+    heuristiques, escalades vers le LLM et appels LLM évités. Avec counters, les
+    compteurs existants sont mis à jour (cumul au fil des résultats d'un flux).
+    """
+    if counters is None:
+        counters = {"documents": 0, "heuristic_only": 0, "llm_escalated": 0, "llm_calls_saved": 0}
+    for doc in docs:
+        data = doc.get("agent_details", {}).get("detection", {}).get("data", {})
+        if "llm_escalated" not in data:
+            continue
+        counters["documents"] += 1
+        counters["llm_escalated" if data["llm_escalated"] else "heuristic_only"] += 1
+        counters["llm_calls_saved"] += int(bool(data.get("llm_call_saved")))
+    return counters
+
+
+def analyze_pdf(
+    file_path: PdfSource,
+    use_llm: bool | Collection[str] = False,
+    llm_model: str | None = None,
+    force_type: str | None = None,
+    detection_mode: str | None = None,
+    on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    use_cache: bool = False,
+    ingest_workers: int | None = None,
+    timeout: float | None = None,
+    page_timeout: float | None = None,
+    max_memory_mb: int | None = None,
+    layout: bool = False,
+    term_index: bool = False,
+    near_duplicates: bool = False,
+) -> Dict[str, Any]:
+    """
+    Exécute le pipeline complet (ingestion -> rapport) pour un seul PDF
+    (chemin ou PdfBuffer déjà en mémoire).
+    Une erreur dans un agent n'est pas propagée: le document est retourné avec
+    la clé "error" et l'agent fautif marqué "❌" dans agent_details.
+    on_stage(stage, details) est appelé à la fin de chaque agent.
+    use_llm: True/False pour tous les agents, ou les noms des agents (LLM_STAGES)
+    qui doivent utiliser le LLM.
+    detection_mode: None (LLM puis heuristiques), "random", ou "cascade"
+    (heuristiques d'abord, LLM seulement pour les cas incertains; voir detection_counters).
+    use_cache: réutilise les sorties d'agents stockées dans le ResultCache. Chaque
+    agent a sa propre clé dérivée de ses entrées (STAGE_GRAPH): changer une option
+    ne recalcule que les agents qui en dépendent. La détection aléatoire n'est
+    jamais mise en cache.
+    ingest_workers: extraction du texte répartie sur un pool de processus (gros PDF).
+    timeout / page_timeout / max_memory_mb: l'extraction pypdf tourne dans un
+    sous-processus borné (délai par document et par page en secondes, mémoire
+    en Mo). Une limite atteinte donne un résultat partiel (ou en échec si aucune
+    page n'a été lue) avec la raison dans agent_details["ingestion"].
+    layout: relève taille et graisse de police à l'ingestion; la structuration
+    s'en sert pour repérer les vrais titres (moins de sections parasites).
+    term_index: ajoute le document à l'index persistant du corpus (app.term_index,
+    identifié par le SHA-256 du PDF) et classe ses mots-clés en TF-IDF contre ce
+    corpus. La taille du corpus, par paliers (TERM_INDEX_CACHE_GROWTH), entre
+    dans la clé de cache de l'extraction.
+    near_duplicates: compare le texte ingéré aux documents déjà analysés
+    (app.near_duplicates, MinHash/LSH). Pour un quasi-doublon, doc["near_duplicate"]
+    donne le document d'origine, la similarité et le diff par page. Si aucune
+    page n'a changé et avec use_cache, les sorties de NEAR_DUPLICATE_STAGES
+    obtenues avec les mêmes réglages sont reprises au lieu de relancer ces agents
+    (et le LLM); doc["near_duplicate"]["reused_stages"] liste ce qui a été repris.
+    """
+    log = logging.getLogger("orchestrator")
+    agent_details = _pending_agent_details()
+    stage = "ingestion"
+    doc: Dict[str, Any] = {
+        "filename": source_name(file_path),
+        "path": source_path(file_path),
+        "num_pages": 0,
+        "pages": [],
+    }
+
+    cache: ResultCache | None = None
+    index: TermIndex | None = None
+    dup_index: NearDuplicateIndex | None = None
+    dup_match: Dict[str, Any] | None = None
+    keys: Dict[str, str] = {}
+    settings: Dict[str, str] = {}
+    cache_hits: List[str] = []
+    reused: List[str] = []
+    reusable = False
+    file_hash: List[str] = []
+
+    def llm(name: str) -> bool:
+        return _llm_enabled(use_llm, name)
+
+    def file_id() -> str:
+        if not file_hash:
+            file_hash.append(file_sha256(file_path.data if isinstance(file_path, PdfBuffer) else file_path))
+        return file_hash[0]
+
+    def key_for(name: str) -> str:
+        spec = STAGE_GRAPH[name]
+        values = input_values(name)
+        # Réglage de l'étape: ses entrées hors document (comparé avant de reprendre un quasi-doublon)
+        settings[name] = stage_key(name, **{k: v for k, v in values.items() if k != "file"})
+        return stage_key(name, **{dep: keys[dep] for dep in spec["stages"]}, **values)
+
+    def input_values(name: str) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for inp in STAGE_GRAPH[name]["inputs"]:
+            if inp == "file":
+                values[inp] = file_id()
+            elif inp == "verification_engine":
+                values[inp] = VERIFICATION_ENGINE
+            elif inp == "extraction_mode":
+                values[inp] = LLM_EXTRACTION_MODE if llm(name) else None
+            elif inp == "term_index":
+                values[inp] = index.size_bucket() if index is not None else None
+            elif inp == "llm":
+                values[inp] = (llm_model or "default") if llm(name) else None
+            elif inp in ("document_type", "filename"):
+                values[inp] = doc.get(inp)
+            elif inp == "type_model":
+                values[inp] = type_model_id()
+            elif inp == "escalation":
+                values[inp] = (ESCALATION_MIN_CONFIDENCE, ESCALATION_MIN_MARGIN) if detection_mode == "cascade" else None
+            elif inp == "near_duplicate":
+                values[inp] = (dup_match["sha256"], reused) if dup_match else None
+            else:
+                values[inp] = options[inp]
+        return values
+
+    options = {"force_type": force_type, "detection_mode": detection_mode, "layout": layout}
+
+    def memo(
+        name: str,
+        compute: Callable[[], Any],
+        valid: Callable[[Any], bool] | None = None,
+        cacheable: Callable[[Any], bool] | None = None,
+    ) -> Any:
+        if cache is None or (name == "detection" and detection_mode == "random"):
+            return compute()
+        keys[name] = key = key_for(name)
+        value = cache.get(name, key)
+        if value is not None and (valid is None or valid(value)):
+            cache_hits.append(name)
+            return value
+        earlier = dup_match["stages"].get(name) if reusable and name in NEAR_DUPLICATE_STAGES else None
+        if earlier is not None and earlier[0] == settings[name]:
+            value = cache.get(name, earlier[1])
+            if value is not None:
+                # Les étapes aval s'appuient sur la clé de la sortie reprise
+                keys[name] = earlier[1]
+                reused.append(name)
+                return value
+        value = compute()
+        # Un repli heuristique n'est pas stocké sous la clé du mode LLM: le LLM sera
+        # réessayé; les étapes aval sont indexées sur une clé propre au repli.
+        if llm(name) and name in LLM_STAGES and llm_fallback(value):
+            keys[name] = stage_key(name, llm_fallback=key)
+            return value
+        if cacheable is None or cacheable(value):
+            cache.put(name, key, value)
+        return value
+
+    def done(name: str) -> None:
+        details = agent_details.get(name, {"status": "✅", "description": "Terminé", "data": {}})
+        if name in cache_hits:
+            details["description"] = f"{details.get('description', '')} (cache)"
+        elif name in reused:
+            details["description"] = f"{details.get('description', '')} (repris de {dup_match['filename']})"
+        if on_stage is not None:
+            on_stage(name, details)
+
+    try:
+        if use_cache:
+            cache = ResultCache()
+
+        def ingest() -> Dict[str, Any]:
+            if timeout or page_timeout or max_memory_mb:
+                ingested = ingest_pdf_guarded(file_path, timeout=timeout, page_timeout=page_timeout, max_memory_mb=max_memory_mb, layout=layout)
             else:
-                dtype, conf = detect_document_type(doc, use_llm=use_llm, model=llm_model)
-                agent_details["detection"] = {
-                    "status": "✅", 
-                    "description": f"Type: {dtype} (conf: {conf:.2f})",
-                    "data": {
-                        "type": dtype, 
-                        "confidence": conf, 
-                        "method": "LLM + Heuristiques" if use_llm else "Heuristiques seules"
-                    }
-                }
-            doc["document_type"] = dtype
-            doc["type_confidence"] = conf
-            log.info("Type détecté: %s (%.2f) pour %s", dtype, conf, doc.get("filename"))
+                # Extraction complète: la structuration lit toutes les pages, le reader est fermé ici
+                # (lazy=True n'a d'intérêt que pour les lectures d'un échantillon, ex: scripts/evaluate_types.py)
+                ingested = ingest_pdf(file_path, workers=ingest_workers, layout=layout)
+            return {k: v for k, v in ingested.items() if k in ("num_pages", "pages", "ingestion_status", "layout")}
 
+        # Un résultat partiel (limite atteinte) n'est jamais mis en cache
+        ingested = memo("ingestion", ingest, cacheable=lambda v: v.get("ingestion_status", {}).get("complete", True))
+        doc.update(ingested)
+        share_document_text(doc)
+        status = doc.get("ingestion_status") or {}
+        if status.get("complete", True):
+            agent_details["ingestion"] = {"status": "✅", "description": f"{doc.get('num_pages', 0)} pages extraites", "data": {}}
+        else:
+            total = status.get("pages_total")
+            agent_details["ingestion"] = {
+                "status": "⚠️",
+                "description": f"{status['pages_read']}/{total if total is not None else '?'} pages extraites (arrêt: {status['reason']})",
+                "data": status,
+            }
+        if near_duplicates and status.get("complete", True):
+            dt = document_text(doc)
+            signature = minhash_signature(dt.tokens)
+            if signature is not None:
+                dup_index = NearDuplicateIndex()
+                fingerprints = page_fingerprints([text for _, text in dt.iter_pages()])
+                dup_match = dup_index.find(file_id(), signature, fingerprints)
+            if dup_match:
+                diff = dup_match["diff"]
+                # Une page modifiée peut changer montants, dates, points clés...: tout est recalculé
+                reusable = not diff["changed_pages"] and not diff["removed_pages"]
+                doc["near_duplicate"] = {k: v for k, v in dup_match.items() if k != "stages"}
+                doc["near_duplicate"]["reused_stages"] = reused
+                agent_details["ingestion"]["description"] += (
+                    f" (quasi-doublon de {dup_match['filename']}, similarité {dup_match['similarity']:.0%},"
+                    f" {len(diff['changed_pages'])} page(s) modifiée(s)"
+                    f"{'' if reusable else ', analyse complète relancée'})"
+                )
+                agent_details["ingestion"]["data"] = {**agent_details["ingestion"]["data"], "near_duplicate": doc["near_duplicate"]}
+                log.info("Quasi-doublon: %s ~ %s (%.2f)", doc.get("filename"), dup_match["filename"], dup_match["similarity"])
+        done("ingestion")
+
+        stage = "detection"
+        log.info("[1/6] Détection du type...")
+        detected = memo("detection", lambda: _detect(doc, llm("detection"), llm_model, force_type, detection_mode))
+        doc["document_type"] = detected["document_type"]
+        doc["type_confidence"] = detected["type_confidence"]
+        agent_details["detection"] = detected["details"]
+        done("detection")
+
+        stage = "structuration"
         log.info("[2/6] Structuration...")
-        sections = segment_document(doc, use_llm=use_llm, model=llm_model)
+        sections = memo("structuration", lambda: segment_document(doc, use_llm=llm("structuration"), model=llm_model))
+        # Les sections relues du cache (JSON) redeviennent des vues sur le buffer du document
+        sections["sections"] = bind_sections(document_text(doc), sections.get("sections", []))
         doc["sections"] = sections
         # Gérer sections qui peuvent être des dicts ou des strings
         section_titles = []
-        for s in sections:
+        for s in sections["sections"]:
             if isinstance(s, dict):
                 section_titles.append(s.get("title", "Sans titre"))
             elif isinstance(s, str):
@@ -82,22 +408,40 @@ def analyze_pdfs(file_paths: List[str], use_llm: bool = False, llm_model: str |
                 section_titles.append("Section")
         agent_details["structuration"] = {
             "status": "✅",
-            "description": f"{len(sections)} sections identifiées",
-            "data": {"sections": section_titles, "count": len(sections)}
+            "description": f"{len(section_titles)} sections identifiées",
+            "data": {"sections": section_titles, "count": len(section_titles)}
         }
+        done("structuration")
 
+        stage = "extraction"
         log.info("[3/6] Extraction...")
-        extracted = extract_information(doc, sections, use_llm=use_llm, model=llm_model)
+        if term_index:
+            # Le document entre dans le corpus avant le classement TF-IDF de ses mots-clés
+            index = TermIndex()
+            index.add_document(file_id(), document_text(doc).terms, filename=doc.get("filename"), document_type=doc.get("document_type"))
+        extracted = memo("extraction", lambda: extract_information(doc, sections, use_llm=llm("extraction"), model=llm_model, term_index=index))
+        if "extraction" in reused:
+            # Offsets relatifs au texte de la version antérieure
+            extracted = {k: v for k, v in extracted.items() if k != "offsets"}
         doc["extracted_info"] = extracted
-        extracted_fields = list(extracted.keys()) if isinstance(extracted, dict) else []
+        extracted_fields = [k for k in extracted if k not in EXTRACTION_META_KEYS] if isinstance(extracted, dict) else []
+        method = "LLM + Extraction" if llm("extraction") else "Extraction heuristique"
+        sources = extracted.get("sources") if isinstance(extracted, dict) else None
+        if sources and "document" in sources:
+            method = "LLM + Extraction" if sources["document"] == "llm" else "Extraction heuristique (LLM sans réponse)"
+        elif sources:
+            n_llm = sum(1 for v in sources.values() if v == "llm")
+            method = f"LLM par groupes de champs ({n_llm}/{len(sources)} groupes, le reste en heuristique)"
         agent_details["extraction"] = {
             "status": "✅",
             "description": f"{len(extracted_fields)} champs extraits",
-            "data": {"fields": extracted_fields, "method": "LLM + Extraction" if use_llm else "Extraction heuristique"}
+            "data": {"fields": extracted_fields, "method": method}
         }
+        done("extraction")
 
+        stage = "synthese"
         log.info("[4/6] Synthèse...")
-        synth = synthesize(doc, sections, extracted, use_llm=use_llm, model=llm_model)
+        synth = memo("synthese", lambda: synthesize(doc, sections, extracted, use_llm=llm("synthese"), model=llm_model))
         doc["synthesis"] = synth
         agent_details["synthese"] = {
             "status": "✅",
@@ -105,21 +449,25 @@ def analyze_pdfs(file_paths: List[str], use_llm: bool = False, llm_model: str |
             "data": {
                 "summary_length": len(synth.get("summary", "")),
                 "key_points_count": len(synth.get("key_points", [])),
-                "method": "LLM" if use_llm else "Heuristique"
+                "method": ("Heuristique (LLM sans réponse)" if llm_fallback(synth) else "LLM") if llm("synthese") else "Heuristique"
             }
         }
+        done("synthese")
 
+        stage = "verification"
         log.info("[5/6] Vérification...")
-        ver = verify_and_annotate(doc, synth)
+        ver = memo("verification", lambda: verify_and_annotate(doc, synth))
         doc["verification"] = ver
         agent_details["verification"] = {
             "status": "✅",
             "description": f"{len(ver.get('alerts', []))} alertes détectées",
             "data": {"alerts_count": len(ver.get("alerts", [])), "severity": "Haute" if ver.get("alerts") else "Basse"}
         }
+        done("verification")
 
+        stage = "visualisation"
         log.info("[6/7] Visualisations...")
-        visualizations = create_visualizations(doc, extracted)
+        visualizations = memo("visualisation", lambda: create_visualizations(doc, extracted))
         doc["visualizations"] = visualizations
         viz_count = sum(1 for v in [visualizations.get("wordcloud"), visualizations.get("statistics"), visualizations.get("mindmap")] if v)
         agent_details["visualisation"] = {
@@ -131,12 +479,360 @@ def analyze_pdfs(file_paths: List[str], use_llm: bool = False, llm_model: str |
                 "mindmap": "Disponible" if visualizations.get("mindmap") else "Non généré"
             }
         }
+        done("visualisation")
 
+        stage = "rapport"
         log.info("[7/7] Génération du rapport...")
-        report_path = build_report(doc)
+        report_path = memo("rapport", lambda: build_report(doc), valid=lambda path: os.path.exists(path))
         doc["report_path"] = report_path
-        doc["agent_details"] = agent_details
+        if index is not None:
+            index.set_report(file_id(), report_path)
+        if dup_index is not None:
+            # Clés d'étapes connues seulement avec le cache; une sortie reprise garde la clé d'origine
+            dup_index.add_document(
+                file_id(), signature, fingerprints, filename=doc.get("filename"), report_path=report_path,
+                stages={name: (settings[name], keys[name]) for name in NEAR_DUPLICATE_STAGES if name in keys} if cache is not None else None,
+            )
+        done("rapport")
+    except Exception as e:
+        log.exception("Échec de l'agent %s pour %s", stage, doc.get("filename"))
+        doc["error"] = f"{stage}: {e}"
+        if stage in agent_details:
+            agent_details[stage] = {"status": "❌", "description": f"Erreur: {e}", "data": {}}
+        if on_stage is not None:
+            on_stage(stage, {"status": "❌", "description": f"Erreur: {e}", "data": {}})
+    finally:
+        if index is not None:
+            index.close()
+        if dup_index is not None:
+            dup_index.close()
+
+    if cache_hits:
+        log.info("Cache: %s réutilisé(s) pour %s", ", ".join(cache_hits), doc.get("filename"))
+    if reused:
+        log.info("Quasi-doublon: %s repris de %s pour %s", ", ".join(reused), dup_match["filename"], doc.get("filename"))
+    doc["agent_details"] = agent_details
+    # Résultat en dicts et listes ordinaires: pages et sections ne sont plus des vues sur le buffer
+    dt = doc.pop("document_text", None)
+    if dt is not None:
+        dt.release()
+    return to_plain(doc)
+
+
+def _make_executor(executor: str, max_workers: int) -> Executor:
+    if executor == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyze")
+
+
+def _picklable(source: PdfSource) -> PdfSource:
+    # Un memoryview ne traverse pas la frontière d'un processus
+    if isinstance(source, PdfBuffer) and isinstance(source.data, memoryview):
+        return PdfBuffer(source.name, source.data.tobytes())
+    return source
+
+
+def _put_stage_event(events: Any, index: int, filename: str, stage: str, details: Dict[str, Any]) -> None:
+    events.put({
+        "event": "stage",
+        "index": index,
+        "filename": filename,
+        "stage": stage,
+        "status": details.get("status"),
+        "description": details.get("description"),
+    })
+
+
+def _drain(events: Any) -> Iterator[Dict[str, Any]]:
+    while True:
+        try:
+            yield events.get_nowait()
+        except queue.Empty:
+            return
+
+
+def iter_analyze_pdfs(
+    file_paths: List[PdfSource],
+    use_llm: bool | Collection[str] = False,
+    llm_model: str | None = None,
+    force_type: str | None = None,
+    detection_mode: str | None = None,
+    max_workers: int | None = None,
+    executor: str | None = None,
+    progress: bool = False,
+    use_cache: bool = False,
+    ingest_workers: int | None = None,
+    timeout: float | None = None,
+    page_timeout: float | None = None,
+    max_memory_mb: int | None = None,
+    layout: bool = False,
+    term_index: bool = False,
+    near_duplicates: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Version générateur de analyze_pdfs: chaque document est émis dès qu'il est prêt,
+    sous la forme {"event": "result", "index", "doc"} (index = position dans file_paths).
+    Avec progress=True, des événements {"event": "stage", "index", "filename", "stage",
+    "status", "description"} sont émis à la fin de chaque agent.
+
+    En parallèle, les résultats arrivent dans l'ordre de complétion et au plus
+    2 * max_workers documents sont en cours à la fois, ce qui borne la mémoire.
+    Chaque document est isolé: si un processus du pool meurt (mémoire, crash),
+    le pool est recréé et ses documents relancés une fois; un échec persistant
+    ou un résultat illisible (pickle) donne un document avec la clé "error".
+    """
+    configure_logging()
+    if executor is None:
+        executor = "thread" if use_llm else "process"
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor inconnu: {executor!r} (attendu: {', '.join(EXECUTORS)})")
+
+    run_one = partial(
+        analyze_pdf,
+        use_llm=use_llm,
+        llm_model=llm_model,
+        force_type=force_type,
+        detection_mode=detection_mode,
+        use_cache=use_cache,
+        ingest_workers=ingest_workers,
+        timeout=timeout,
+        page_timeout=page_timeout,
+        max_memory_mb=max_memory_mb,
+        layout=layout,
+        term_index=term_index,
+        near_duplicates=near_duplicates,
+    )
+    workers = min(max_workers or 1, len(file_paths))
+    if workers <= 1 and not progress:
+        for index, source in enumerate(file_paths):
+            yield {"event": "result", "index": index, "doc": run_one(source)}
+        return
+
+    workers = max(workers, 1)
+    manager = None
+    events: Any = None
+    if progress:
+        if executor == "process" and workers > 1:
+            manager = multiprocessing.Manager()
+            events = manager.Queue()
+        else:
+            events = queue.Queue()
+
+    logging.getLogger("orchestrator").info("Analyse de %d documents (%s x%d)", len(file_paths), executor, workers)
+    todo = iter(enumerate(file_paths))
+    # Documents dont le processus a été tué (pool cassé): relancés une fois, un à la fois
+    retries: List[Tuple[int, PdfSource]] = []
+    retried: set = set()
+    pending: Dict[Any, Tuple[int, PdfSource, Executor]] = {}
+    kind = executor if workers > 1 else "thread"
+    pool = _make_executor(kind, workers)
+
+    def renew_pool(broken: Executor) -> None:
+        nonlocal pool
+        if broken is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            pool = _make_executor(kind, workers)
+
+    def submit_next() -> bool:
+        if retries and not any(i in retried for i, _, _ in pending.values()):
+            index, source = retries.pop(0)
+        else:
+            item = next(todo, None)
+            if item is None:
+                return False
+            index, source = item
+        on_stage = None
+        if events is not None:
+            on_stage = partial(_put_stage_event, events, index, source_name(source))
+        task = _picklable(source) if kind == "process" else source
+        try:
+            fut = pool.submit(run_one, task, on_stage=on_stage)
+        except BrokenExecutor:
+            renew_pool(pool)
+            fut = pool.submit(run_one, task, on_stage=on_stage)
+        pending[fut] = (index, source, pool)
+        return True
+
+    try:
+        while len(pending) < 2 * workers and submit_next():
+            pass
+
+        while pending:
+            done_futures, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if events is not None:
+                yield from _drain(events)
+            for fut in done_futures:
+                index, source, fut_pool = pending.pop(fut)
+                try:
+                    doc = fut.result()
+                except BrokenExecutor as e:
+                    # Processus tué (mémoire, crash de pypdf...): tous ses documents en cours échouent
+                    renew_pool(fut_pool)
+                    if index not in retried:
+                        retried.add(index)
+                        retries.append((index, source))
+                        continue
+                    doc = _failed_result(source, f"processus d'analyse interrompu ({type(e).__name__}: {e})")
+                except Exception as e:
+                    logging.getLogger("orchestrator").exception("Résultat perdu pour %s", source_name(source))
+                    doc = _failed_result(source, f"{type(e).__name__}: {e}")
+                yield {"event": "result", "index": index, "doc": doc}
+            while len(pending) < 2 * workers and submit_next():
+                pass
+    finally:
+        pool.shutdown(wait=not pending, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
 
-        results.append(doc)
+def _failed_result(source: PdfSource, error: str) -> Dict[str, Any]:
+    # Même forme qu'un document dont un agent a échoué dans le worker
+    return {
+        "filename": source_name(source),
+        "path": source_path(source),
+        "num_pages": 0,
+        "pages": [],
+        "error": error,
+        "agent_details": _pending_agent_details(),
+    }
 
+
+def analyze_pdfs(
+    file_paths: List[PdfSource],
+    use_llm: bool | Collection[str] = False,
+    llm_model: str | None = None,
+    force_type: str | None = None,
+    detection_mode: str | None = None,
+    max_workers: int | None = None,
+    executor: str | None = None,
+    use_cache: bool = False,
+    ingest_workers: int | None = None,
+    timeout: float | None = None,
+    page_timeout: float | None = None,
+    max_memory_mb: int | None = None,
+    layout: bool = False,
+    term_index: bool = False,
+    near_duplicates: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Analyse une liste de PDF (chemins ou PdfBuffer) et retourne les résultats dans l'ordre d'entrée.
+
+    max_workers: nombre de documents traités en parallèle (None ou 1 = séquentiel).
+    executor: "process" (agents CPU: pypdf, rapidfuzz, wordcloud, reportlab) ou
+    "thread" (agents bloqués sur les appels LLM). Par défaut "thread" si use_llm,
+    sinon "process".
+    use_cache: sert les documents déjà analysés depuis le cache disque (app.cache);
+    seuls les agents dont une entrée a changé sont relancés (voir STAGE_GRAPH).
+    ingest_workers: processus d'extraction par document, pour les PDF de plusieurs
+    centaines de pages.
+    timeout / page_timeout / max_memory_mb: limites d'extraction par document
+    (voir analyze_pdf); un PDF pathologique ne bloque plus le lot.
+    layout: titres repérés par la police (voir analyze_pdf).
+    term_index: alimente l'index du corpus au fil du lot et classe les mots-clés
+    en TF-IDF contre ce corpus (voir analyze_pdf).
+    near_duplicates: repère les quasi-doublons des documents déjà analysés et
+    reprend leurs résultats avec use_cache (voir analyze_pdf). Dans un même lot,
+    seul un document terminé avant le début d'un autre peut lui servir d'origine.
+    """
+    results: List[Dict[str, Any]] = [{} for _ in file_paths]
+    for event in iter_analyze_pdfs(
+        file_paths,
+        use_llm=use_llm,
+        llm_model=llm_model,
+        force_type=force_type,
+        detection_mode=detection_mode,
+        max_workers=max_workers,
+        executor=executor,
+        use_cache=use_cache,
+        ingest_workers=ingest_workers,
+        timeout=timeout,
+        page_timeout=page_timeout,
+        max_memory_mb=max_memory_mb,
+        layout=layout,
+        term_index=term_index,
+        near_duplicates=near_duplicates,
+    ):
+        results[event["index"]] = event["doc"]
+    if detection_mode == "cascade":
+        _log_detection_counters(results)
+    return results
+
+
+def _log_detection_counters(results: List[Dict[str, Any]]) -> None:
+    c = detection_counters(results)
+    logging.getLogger("orchestrator").info(
+        "Détection en cascade: %d/%d documents sans LLM, %d escalades, %d appels LLM évités",
+        c["heuristic_only"], c["documents"], c["llm_escalated"], c["llm_calls_saved"],
+    )
+
+
+# aanalyze_pdfs en cours par boucle: le pool HTTP de la boucle est fermé à la fin du dernier
+_ASYNC_RUNS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, int]" = weakref.WeakKeyDictionary()
+
+
+async def aanalyze_pdfs(
+    file_paths: List[PdfSource],
+    use_llm: bool | Collection[str] = False,
+    llm_model: str | None = None,
+    force_type: str | None = None,
+    detection_mode: str | None = None,
+    max_workers: int | None = None,
+    use_cache: bool = False,
+    ingest_workers: int | None = None,
+    timeout: float | None = None,
+    page_timeout: float | None = None,
+    max_memory_mb: int | None = None,
+    layout: bool = False,
+    term_index: bool = False,
+    near_duplicates: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Version asyncio de analyze_pdfs (await aanalyze_pdfs(...) depuis une boucle,
+    ex: un serveur web), résultats dans l'ordre d'entrée.
+    Les documents sont analysés en parallèle dans un pool de threads
+    (max_workers, LLM_MAX_CONCURRENCY par défaut). Les appels LLM de leurs
+    agents sont routés vers la boucle courante (llm_client.route_sync_calls):
+    les appels de documents différents sont en vol en même temps, avec un seul
+    pool de connexions HTTP et au plus LLM_MAX_CONCURRENCY requêtes simultanées.
+    Ce pool est fermé (llm_client.aclose) quand la dernière analyse en cours
+    sur la boucle se termine.
+    Autres options: voir analyze_pdf.
+    """
+    configure_logging()
+    if not file_paths:
+        return []
+    loop = asyncio.get_running_loop()
+    run_one = partial(
+        analyze_pdf,
+        use_llm=use_llm,
+        llm_model=llm_model,
+        force_type=force_type,
+        detection_mode=detection_mode,
+        use_cache=use_cache,
+        ingest_workers=ingest_workers,
+        timeout=timeout,
+        page_timeout=page_timeout,
+        max_memory_mb=max_memory_mb,
+        layout=layout,
+        term_index=term_index,
+        near_duplicates=near_duplicates,
+    )
+    workers = max(1, min(max_workers or LLM_MAX_CONCURRENCY, len(file_paths)))
+    logging.getLogger("orchestrator").info("Analyse asynchrone de %d documents (thread x%d)", len(file_paths), workers)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aanalyze")
+    _ASYNC_RUNS[loop] = _ASYNC_RUNS.get(loop, 0) + 1
+    try:
+        with route_sync_calls(loop):
+            # run_in_executor ne propage pas le contexte: chaque document part d'une copie (boucle de routage)
+            results = list(await asyncio.gather(*(
+                loop.run_in_executor(pool, contextvars.copy_context().run, run_one, source) for source in file_paths
+            )))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        _ASYNC_RUNS[loop] -= 1
+        if not _ASYNC_RUNS[loop]:
+            del _ASYNC_RUNS[loop]
+            await llm_aclose()
+    if detection_mode == "cascade":
+        _log_detection_counters(results)
     return results
@@ -0,0 +1,248 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import time
+
+from app.terms import TermFrequencies, is_term, tfidf_keywords, tokenize
+
+log = logging.getLogger("term_index")
+
+TERM_INDEX_PATH = os.environ.get("TERM_INDEX_PATH", os.path.join("data", "index", "terms.sqlite"))
+
+# Croissance relative du corpus au-delà de laquelle les mots-clés TF-IDF en cache sont recalculés
+TERM_INDEX_CACHE_GROWTH = float(os.environ.get("TERM_INDEX_CACHE_GROWTH", "0.25"))
+
+# Nombre de paramètres par requête "IN (...)" (bien en deçà de la limite sqlite)
+_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    document_type TEXT,
+    report_path TEXT,
+    total INTEGER NOT NULL,
+    terms_hash TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE,
+    df INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term_id, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+"""
+
+
+def query_terms(query: str) -> Tuple[List[str], List[str]]:
+    """
+    (termes cherchés, termes ignorés) d'une requête. Seuls les termes de l'index
+    sont cherchables: les mots de moins de MIN_TERM_LEN lettres (ex: "TVA",
+    "SA") et les mots vides ne sont pas indexés, search() les ignore.
+    """
+    words = tokenize(query.lower())
+    kept = sorted({w for w in words if is_term(w)})
+    ignored = list(dict.fromkeys(w for w in words if not is_term(w)))
+    return kept, ignored
+
+
+def _chunks(items: Sequence[Any]) -> Iterable[Sequence[Any]]:
+    for i in range(0, len(items), _CHUNK):
+        yield items[i:i + _CHUNK]
+
+
+def _terms_digest(counts: Counter) -> str:
+    h = hashlib.sha1()
+    for term, count in sorted(counts.items()):
+        h.update(f"{term}\t{count}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class TermIndex:
+    """
+    Index inversé persistant (sqlite) des documents analysés: postings
+    terme -> (document, tf) et table des fréquences documentaires (df),
+    mis à jour document par document. Sert à:
+      - classer les mots-clés d'un document en TF-IDF contre tout le corpus;
+      - retrouver les documents qui mentionnent un terme sans relire leur texte.
+    Les documents sont identifiés par le SHA-256 du PDF: réindexer un document
+    inchangé ne modifie rien. Le fichier peut être partagé entre threads et
+    processus (une connexion par instance, journal WAL, écritures en transaction).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or TERM_INDEX_PATH
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "TermIndex":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def generation(self) -> int:
+        """Compteur incrémenté à chaque modification du corpus."""
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def size_bucket(self, growth: Optional[float] = None) -> int:
+        """
+        Taille du corpus quantifiée en échelle géométrique (pas de 1 + growth,
+        défaut TERM_INDEX_CACHE_GROWTH): entre dans la clé de cache de
+        l'extraction. Les IDF ne bougent guère tant que le corpus ne grossit
+        pas de plus de growth; generation() changerait à chaque document et
+        l'extraction ne serait jamais reprise du cache.
+        """
+        growth = TERM_INDEX_CACHE_GROWTH if growth is None else growth
+        n = self.num_documents()
+        return int(math.log(n) / math.log1p(growth)) if n > 0 and growth > 0 else n
+
+    def num_documents(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        num_terms = self._conn.execute("SELECT COUNT(*) FROM terms WHERE df > 0").fetchone()[0]
+        return {"documents": self.num_documents(), "terms": num_terms, "path": self.path}
+
+    def add_document(
+        self,
+        sha256: str,
+        terms: TermFrequencies,
+        filename: Optional[str] = None,
+        document_type: Optional[str] = None,
+        report_path: Optional[str] = None,
+    ) -> bool:
+        """
+        Ajoute (ou remplace) les termes d'un document. Retourne False si le
+        document était déjà indexé avec les mêmes termes (seules ses métadonnées
+        sont alors mises à jour).
+        """
+        digest = _terms_digest(terms.counts)
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id, terms_hash FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None and row[1] == digest:
+                conn.execute(
+                    "UPDATE documents SET filename = ?, document_type = ?, report_path = COALESCE(?, report_path) WHERE id = ?",
+                    (filename, document_type, report_path, row[0]),
+                )
+                conn.execute("COMMIT")
+                return False
+            if row is not None:
+                self._remove(row[0])
+            cur = conn.execute(
+                "INSERT INTO documents (sha256, filename, document_type, report_path, total, terms_hash, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, filename, document_type, report_path, terms.total, digest, time.time()),
+            )
+            doc_id = cur.lastrowid
+            words = list(terms.counts)
+            conn.executemany("INSERT INTO terms (term) VALUES (?) ON CONFLICT (term) DO NOTHING", ((w,) for w in words))
+            ids = self._term_ids(words)
+            conn.executemany(
+                "INSERT INTO postings (term_id, doc_id, tf) VALUES (?, ?, ?)",
+                ((ids[w], doc_id, c) for w, c in terms.counts.items()),
+            )
+            conn.executemany("UPDATE terms SET df = df + 1 WHERE id = ?", ((ids[w],) for w in words))
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def set_report(self, sha256: str, report_path: Optional[str]) -> None:
+        self._conn.execute("UPDATE documents SET report_path = ? WHERE sha256 = ?", (report_path, sha256))
+
+    def remove_document(self, sha256: str) -> bool:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None:
+                self._remove(row[0])
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def _remove(self, doc_id: int) -> None:
+        conn = self._conn
+        conn.execute("UPDATE terms SET df = df - 1 WHERE id IN (SELECT term_id FROM postings WHERE doc_id = ?)", (doc_id,))
+        conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def _term_ids(self, words: Sequence[str]) -> Dict[str, int]:
+        ids: Dict[str, int] = {}
+        for chunk in _chunks(words):
+            marks = ",".join("?" * len(chunk))
+            ids.update((term, i) for i, term in self._conn.execute(f"SELECT id, term FROM terms WHERE term IN ({marks})", chunk))
+        return ids
+
+    def document_frequencies(self, words: Iterable[str]) -> Counter:
+        """Nombre de documents indexés contenant chaque terme demandé."""
+        words = list(words)
+        df: Counter = Counter()
+        for chunk in _chunks(words):
+            marks = ",".join("?" * len(chunk))
+            df.update(dict(self._conn.execute(f"SELECT term, df FROM terms WHERE term IN ({marks}) AND df > 0", chunk)))
+        return df
+
+    def keywords(self, terms: TermFrequencies, n: int = 15) -> List[str]:
+        """Mots-clés TF-IDF d'un document, df et nombre de documents pris sur tout le corpus indexé."""
+        if not terms.total:
+            return []
+        df = self.document_frequencies(terms.counts)
+        ranked = tfidf_keywords([terms], n=n, df=df, num_docs=max(self.num_documents(), 1))[0]
+        return [t for t, _ in ranked]
+
+    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Documents contenant tous les termes de la requête, classés par nombre
+        d'occurrences. Lecture des seuls postings des termes (index), sans texte.
+        Les termes non indexés sont ignorés (voir query_terms, pour les signaler).
+        """
+        words, _ = query_terms(query)
+        if not words:
+            return []
+        ids = self._term_ids(words)
+        if len(ids) < len(words):
+            return []
+        marks = ",".join("?" * len(ids))
+        rows = self._conn.execute(
+            f"""
+            SELECT d.sha256, d.filename, d.document_type, d.report_path, d.total, SUM(p.tf) AS hits
+            FROM postings p JOIN documents d ON d.id = p.doc_id
+            WHERE p.term_id IN ({marks})
+            GROUP BY p.doc_id
+            HAVING COUNT(*) = ?
+            ORDER BY hits DESC, d.filename
+            LIMIT ?
+            """,
+            (*ids.values(), len(ids), limit),
+        ).fetchall()
+        keys = ("sha256", "filename", "document_type", "report_path", "total", "occurrences")
+        return [dict(zip(keys, row)) for row in rows]
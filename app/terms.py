@@ -0,0 +1,102 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import Counter
+import math
+import re
+
+FR_STOPWORDS = set("""
+a au aux avec ce ces dans de des du elle en et eux il je la le leur lui ma mais me même mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous c d l j s t y n m qu\'
+""".split())
+EN_STOPWORDS = set("""
+the and or of to in on for by with as is are was were be been being a an at from that this these those into over under out up down not no yes can could may might should would will shall it its it's they them their he him his she her we our us you your i me my mine ours yours theirs
+""".split())
+STOPWORDS = FR_STOPWORDS | EN_STOPWORDS
+
+# Mot: lettres/chiffres, apostrophes et traits d'union internes (l'article, co-contractant).
+# Seule tokenisation du projet: DocumentText.tokens, termes, ancrage et indices de type.
+WORD_RE = re.compile(r"\w[\w'’-]*", re.UNICODE)
+
+MIN_TERM_LEN = 4
+
+
+def tokenize(text_lower: str) -> List[str]:
+    """Mots d'un texte déjà en minuscules (WORD_RE)."""
+    return WORD_RE.findall(text_lower)
+
+
+def is_term(word: str) -> bool:
+    return len(word) >= MIN_TERM_LEN and word not in STOPWORDS
+
+
+class TermFrequencies:
+    """
+    Fréquences des termes d'un document (hors mots vides et mots de moins de
+    MIN_TERM_LEN lettres) et des bigrammes de termes adjacents. Calculées une
+    fois par document (DocumentText.terms) puis partagées par l'extraction
+    (mots-clés) et la visualisation (nuage de mots, graphique de fréquences).
+    """
+
+    __slots__ = ("counts", "bigrams", "total")
+
+    def __init__(self, counts: Counter, bigrams: Counter):
+        self.counts = counts
+        self.bigrams = bigrams
+        self.total = sum(counts.values())
+
+    @classmethod
+    def from_text(cls, text_lower: str) -> "TermFrequencies":
+        return cls.from_tokens(tokenize(text_lower))
+
+    @classmethod
+    def from_tokens(cls, tokens: Sequence[str]) -> "TermFrequencies":
+        # None à la place des mots écartés: un bigramme ne franchit pas un mot vide
+        kept = [w if len(w) >= MIN_TERM_LEN and w not in STOPWORDS else None for w in tokens]
+        counts = Counter(filter(None, kept))
+        bigrams = Counter([f"{a} {b}" for a, b in zip(kept, kept[1:]) if a and b])
+        return cls(counts, bigrams)
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        return self.counts.most_common(n)
+
+    def keywords(self, n: int) -> List[str]:
+        return [w for w, _ in self.counts.most_common(n)]
+
+    def frequency(self, term: str) -> int:
+        """Occurrences d'un terme ou d'un bigramme (0 si inconnu)."""
+        term = term.lower().strip()
+        return self.bigrams.get(term, 0) if " " in term else self.counts.get(term, 0)
+
+
+def document_frequencies(corpus: Sequence[TermFrequencies], bigrams: bool = False) -> Counter:
+    """Nombre de documents du lot contenant chaque terme."""
+    df: Counter = Counter()
+    for tf in corpus:
+        df.update(tf.counts.keys())
+        if bigrams:
+            df.update(tf.bigrams.keys())
+    return df
+
+
+def tfidf_keywords(
+    corpus: Sequence[TermFrequencies],
+    n: int = 15,
+    bigrams: bool = False,
+    df: Optional[Counter] = None,
+    num_docs: Optional[int] = None,
+) -> List[List[Tuple[str, float]]]:
+    """
+    Mots-clés TF-IDF de chaque document d'un lot: tf / total * (log((1 + N) / (1 + df)) + 1).
+    df/num_docs peuvent venir d'un corpus plus large que le lot (ex: index persistant).
+    """
+    if df is None:
+        df = document_frequencies(corpus, bigrams=bigrams)
+    N = num_docs if num_docs is not None else len(corpus)
+    out: List[List[Tuple[str, float]]] = []
+    for tf in corpus:
+        items: Dict[str, int] = dict(tf.counts)
+        if bigrams:
+            items.update(tf.bigrams)
+        total = tf.total or 1
+        scores = {t: c / total * (math.log((1 + N) / (1 + df.get(t, 0))) + 1) for t, c in items.items()}
+        out.append(sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:n])
+    return out
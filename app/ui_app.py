@@ -11,10 +11,16 @@ for p in (ROOT,):
 import io
 import time
 import base64
+import hashlib
+import re
 import streamlit as st
 from typing import List
 
-from app.orchestrator import analyze_pdfs
+from app.orchestrator import iter_analyze_pdfs, detection_counters, downstream_stages, LLM_STAGES
+from app.cache import ResultCache, STAGES
+from app.term_index import TermIndex, query_terms
+from app.terms import MIN_TERM_LEN
+from app.agents.ingestion import PdfBuffer, PdfSource
 from app.llm_client import is_configured as llm_ready
 from app.llm_client import has_model, list_models
 
@@ -44,12 +50,81 @@ with st.sidebar:
     
     if use_llm and not llm_ready():
         st.warning("MISTRAL_API_KEY manquante. Définissez-la dans l'environnement.")
+    llm_stages = st.multiselect(
+        "Agents utilisant le LLM",
+        options=list(LLM_STAGES),
+        default=list(LLM_STAGES),
+        disabled=not use_llm,
+        help="Avec le cache, changer cette liste ne relance que les agents concernés et leurs dépendants."
+    )
     detection_mode = st.radio(
         "Mode de détection",
-        options=["Auto", "Aléatoire"],
+        options=["Auto", "Cascade", "Aléatoire"],
         index=0,
-        help="'Aléatoire' choisit un type au hasard (article/contrat/cv/cours/autre)."
+        help="'Cascade' n'appelle le LLM que si les heuristiques hésitent. "
+             "'Aléatoire' choisit un type au hasard (article/contrat/cv/cours/autre)."
+    )
+    max_workers = st.number_input(
+        "Documents analysés en parallèle",
+        min_value=1,
+        max_value=max(1, os.cpu_count() or 1),
+        value=1,
+        help="Au-delà de 1, les documents sont répartis sur un pool de processus (heuristiques) ou de threads (LLM)."
+    )
+    doc_timeout = st.number_input(
+        "Délai max d'extraction par document (s, 0 = aucun)",
+        min_value=0,
+        value=0,
+        help="Au-delà, l'extraction est interrompue et l'analyse continue sur les pages déjà lues."
+    )
+    use_layout = st.checkbox(
+        "Titres selon la mise en page",
+        value=False,
+        help="Repère les titres par la taille et la graisse de police (moins de sections parasites, extraction un peu plus lente)."
+    )
+    keep_uploads = st.checkbox(
+        "Conserver les PDF téléversés",
+        value=False,
+        help=f"Copie les fichiers dans {UPLOAD_DIR}. Sinon ils sont analysés directement en mémoire."
+    )
+    use_cache = st.checkbox(
+        "Réutiliser les analyses en cache",
+        value=True,
+        help="Un PDF déjà analysé avec les mêmes options est servi depuis le cache disque."
     )
+    use_term_index = st.checkbox(
+        "Mots-clés TF-IDF sur le corpus",
+        value=False,
+        help="Indexe chaque document analysé et classe ses mots-clés par rapport à tous les documents déjà indexés."
+    )
+    use_near_duplicates = st.checkbox(
+        "Repérer les quasi-doublons",
+        value=False,
+        help="Compare chaque document aux documents déjà analysés (MinHash/LSH). Avec le cache, la détection, "
+        "l'extraction et la synthèse d'une version quasi identique sont reprises au lieu d'être relancées."
+    )
+    with st.expander("Recherche dans les documents analysés"):
+        query = st.text_input("Terme(s)", value="", help="Documents indexés contenant tous ces termes.")
+        if query.strip():
+            searched, ignored = query_terms(query)
+            if ignored:
+                st.warning(
+                    f"Termes ignorés: {', '.join(ignored)}. Les mots de moins de {MIN_TERM_LEN} lettres "
+                    "(ex: sigles comme TVA ou SA) et les mots vides ne sont pas indexés."
+                )
+            with TermIndex() as term_idx:
+                hits = term_idx.search(query) if searched else []
+                st.caption(f"{len(hits)} document(s) sur {term_idx.num_documents()} indexé(s)")
+            for hit in hits:
+                st.write(f"**{hit['filename']}** ({hit['document_type']}): {hit['occurrences']} occurrence(s)")
+    with st.expander("Cache"):
+        cache = ResultCache()
+        stats = cache.stats()
+        st.caption(f"{stats['entries']} entrées, {stats['bytes'] / (1024 * 1024):.1f} Mo")
+        stage_to_reset = st.selectbox("Étape à invalider", options=list(STAGES))
+        if st.button("Invalider l'étape"):
+            n = sum(cache.invalidate(name) for name in [stage_to_reset, *downstream_stages(stage_to_reset)])
+            st.success(f"{n} entrée(s) supprimée(s) pour '{stage_to_reset}' et les étapes dépendantes")
 
 uploaded_files = st.file_uploader(
     "Choisissez un ou plusieurs fichiers PDF",
@@ -70,217 +145,276 @@ def _save_uploaded(files) -> List[str]:
     for f in files:
         name = f.name
         base, ext = os.path.splitext(name)
-        ts = int(time.time() * 1000)
-        safe = f"{base}_{ts}{ext}"
+        data = f.getbuffer()
+        # Nom adressé par le contenu: un même PDF re-téléversé n'est écrit qu'une fois
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        safe = f"{base}_{digest}{ext}"
         path = os.path.join(UPLOAD_DIR, safe)
-        with open(path, "wb") as out:
-            out.write(f.read())
+        if not os.path.exists(path):
+            with open(path, "wb") as out:
+                out.write(data)
         paths.append(path)
     return paths
 
-if run_btn and uploaded_files:
-    with st.spinner("Analyse en cours..."):
-        file_paths = _save_uploaded(uploaded_files)
-        start = time.time()
-        results = analyze_pdfs(
-            file_paths,
-            use_llm=use_llm and llm_ready(),
-            llm_model=llm_model if use_llm else None,
-            force_type=None,
-            detection_mode=("random" if detection_mode == "Aléatoire" else None),
-        )
-        elapsed = time.time() - start
 
-    st.success(f"Analyse terminée en {elapsed:.2f}s")
+def _uploaded_sources(files, persist: bool) -> List[PdfSource]:
+    if persist:
+        return _save_uploaded(files)
+    # Vue directe sur le buffer de l'upload: ni copie ni fichier temporaire
+    return [PdfBuffer(f.name, f.getbuffer()) for f in files]
 
-    for doc in results:
-        st.markdown(f"### Résultat: {doc['filename']}")
-        st.write(f"Type détecté: **{doc['document_type']}** (confiance {doc.get('type_confidence', 0):.2f})")
-        st.write(f"Pages: {doc.get('num_pages')}")
+def _md(text: str) -> str:
+    # Texte du PDF affiché tel quel dans du markdown (pas de gras/liens parasites)
+    return re.sub(r"([\\`*_{}\[\]<>()#+!|~-])", r"\\\1", " ".join(text.split()))
 
-        # Résumé
-        with st.expander("Résumé et points clés", expanded=True):
-            st.markdown("#### Résumé exécutif")
-            st.write(doc["synthesis"]["summary"]) 
-            st.markdown("#### Points clés")
-            for p in doc["synthesis"]["key_points"]:
-                st.write("- " + p)
-            if doc["synthesis"].get("risks_or_remarks"):
-                st.markdown("#### Risques / remarques")
-                for r in doc["synthesis"]["risks_or_remarks"]:
-                    st.write("- " + r)
 
-        # Alertes
-        with st.expander("Alertes / Vérification", expanded=False):
-            alerts = doc["verification"]["alerts"]
-            if alerts:
-                for a in alerts:
-                    st.error(a)
-            else:
-                st.info("Aucune alerte majeure détectée (heuristique).")
+def _quote_caption(quote, label: str = "p.") -> None:
+    st.caption(f"« {_md(quote['before'])} **{_md(quote['match'])}** {_md(quote['after'])} » ({label} {quote['page']})")
 
-        # Visualisations
-        visualizations = doc.get("visualizations", {})
-        if visualizations and visualizations.get("status") == "generated":
-            with st.expander("📊 Visualisations (Graphiques, Nuages de Mots, Mindmap)", expanded=False):
-                st.markdown("### Visualisations Générées")
-                
-                # Nuage de mots
-                if visualizations.get("wordcloud"):
-                    st.markdown("#### ☁️ Nuage de Mots")
-                    st.image(f"data:image/png;base64,{visualizations['wordcloud']}", use_container_width=True)
-                    st.caption("Visualisation des mots les plus fréquents dans le document")
-                    st.divider()
-                
-                # Graphiques statistiques
-                if visualizations.get("statistics"):
-                    st.markdown("#### 📈 Statistiques")
-                    st.image(f"data:image/png;base64,{visualizations['statistics']}", use_container_width=True)
-                    st.caption("Analyse statistique du contenu extrait")
-                    st.divider()
-                
-                # Mindmap
-                if visualizations.get("mindmap"):
-                    st.markdown("#### 🧠 Carte Mentale (Mindmap)")
-                    st.image(f"data:image/png;base64,{visualizations['mindmap']}", use_container_width=True)
-                    st.caption("Structure logique du document")
-        elif visualizations and visualizations.get("status") == "unavailable":
-            with st.expander("📊 Visualisations", expanded=False):
-                st.warning("⚠️ Visualisations indisponibles. Installez les dépendances: `pip install wordcloud matplotlib networkx`")
 
+def _render_result(doc) -> None:
+    st.markdown(f"### Résultat: {doc['filename']}")
+    if doc.get("error"):
+        st.error(f"Analyse interrompue ({doc['error']})")
+        st.divider()
+        return
+    st.write(f"Type détecté: **{doc['document_type']}** (confiance {doc.get('type_confidence', 0):.2f})")
+    st.write(f"Pages: {doc.get('num_pages')}")
+    dup = doc.get("near_duplicate")
+    if dup:
+        changed = ", ".join(map(str, dup["diff"]["changed_pages"])) or "aucune"
+        reused = ", ".join(dup.get("reused_stages", [])) or "aucun (analyse complète)"
+        st.info(f"Quasi-doublon de **{dup['filename']}** (similarité {dup['similarity']:.0%}). Pages modifiées: {changed}. Résultats repris: {reused}")
 
-        # Détails des agents
-        with st.expander("🔍 Détails des Agents (Pipeline)", expanded=False):
-            st.markdown("### Pipeline d'analyse multi-agents")
-            st.caption("Visualisez le travail de chaque agent dans le processus d'analyse")
-            
-            agent_details = doc.get("agent_details", {})
-            
-            # Agent 1: Ingestion
-            with st.container():
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    st.markdown(f"### {agent_details.get('ingestion', {}).get('status', '⏳')}")
-                with col2:
-                    st.markdown("#### 1️⃣ Agent d'Ingestion")
-                    st.write(f"**Rôle**: Extraire le texte brut du PDF page par page")
-                    st.write(f"**Résultat**: {agent_details.get('ingestion', {}).get('description', 'N/A')}")
-                st.divider()
-            
-            # Agent 2: Détection
-            with st.container():
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    st.markdown(f"### {agent_details.get('detection', {}).get('status', '⏳')}")
-                with col2:
-                    st.markdown("#### 2️⃣ Agent de Détection")
-                    st.write(f"**Rôle**: Identifier le type de document (article, contrat, CV, cours, autre)")
-                    st.write(f"**Résultat**: {agent_details.get('detection', {}).get('description', 'N/A')}")
-                    det_data = agent_details.get('detection', {}).get('data', {})
-                    if det_data:
-                        st.json(det_data)
-                st.divider()
-            
-            # Agent 3: Structuration
-            with st.container():
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    st.markdown(f"### {agent_details.get('structuration', {}).get('status', '⏳')}")
-                with col2:
-                    st.markdown("#### 3️⃣ Agent de Structuration")
-                    st.write(f"**Rôle**: Segmenter le document en sections logiques")
-                    st.write(f"**Résultat**: {agent_details.get('structuration', {}).get('description', 'N/A')}")
-                    struct_data = agent_details.get('structuration', {}).get('data', {})
-                    if struct_data.get('sections'):
-                        st.write("**Sections identifiées**:")
-                        for i, section in enumerate(struct_data['sections'][:10], 1):
-                            st.write(f"{i}. {section}")
-                        if len(struct_data['sections']) > 10:
-                            st.caption(f"... et {len(struct_data['sections']) - 10} autres sections")
-                st.divider()
-            
-            # Agent 4: Extraction
-            with st.container():
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    st.markdown(f"### {agent_details.get('extraction', {}).get('status', '⏳')}")
-                with col2:
-                    st.markdown("#### 4️⃣ Agent d'Extraction")
-                    st.write(f"**Rôle**: Extraire les informations structurées selon le type de document")
-                    st.write(f"**Résultat**: {agent_details.get('extraction', {}).get('description', 'N/A')}")
-                    ext_data = agent_details.get('extraction', {}).get('data', {})
-                    if ext_data.get('fields'):
-                        st.write("**Champs extraits**:", ", ".join(ext_data['fields']))
-                        st.caption(f"Méthode: {ext_data.get('method', 'N/A')}")
-                st.divider()
+    # Résumé
+    with st.expander("Résumé et points clés", expanded=True):
+        st.markdown("#### Résumé exécutif")
+        st.write(doc["synthesis"]["summary"]) 
+        st.markdown("#### Points clés")
+        annotated = doc["verification"].get("annotated_key_points", [])
+        for i, p in enumerate(doc["synthesis"]["key_points"]):
+            st.write("- " + p)
+            it = annotated[i] if i < len(annotated) else {}
+            if it.get("quote") and it.get("page_refs"):
+                _quote_caption(it["quote"])
+        if doc["synthesis"].get("risks_or_remarks"):
+            st.markdown("#### Risques / remarques")
+            for r in doc["synthesis"]["risks_or_remarks"]:
+                st.write("- " + r)
+
+    # Alertes
+    with st.expander("Alertes / Vérification", expanded=False):
+        alerts = doc["verification"]["alerts"]
+        alert_quotes = doc["verification"].get("alert_quotes", [])
+        if alerts:
+            for i, a in enumerate(alerts):
+                st.error(a)
+                if i < len(alert_quotes) and alert_quotes[i]:
+                    _quote_caption(alert_quotes[i], label="passage le plus proche, p.")
+        else:
+            st.info("Aucune alerte majeure détectée (heuristique).")
+
+    # Visualisations
+    visualizations = doc.get("visualizations", {})
+    if visualizations and visualizations.get("status") == "generated":
+        with st.expander("📊 Visualisations (Graphiques, Nuages de Mots, Mindmap)", expanded=False):
+            st.markdown("### Visualisations Générées")
             
-            # Agent 5: Synthèse
-            with st.container():
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    st.markdown(f"### {agent_details.get('synthese', {}).get('status', '⏳')}")
-                with col2:
-                    st.markdown("#### 5️⃣ Agent de Synthèse")
-                    st.write(f"**Rôle**: Générer un résumé exécutif et identifier les points clés")
-                    st.write(f"**Résultat**: {agent_details.get('synthese', {}).get('description', 'N/A')}")
-                    synth_data = agent_details.get('synthese', {}).get('data', {})
-                    if synth_data:
-                        st.caption(f"Longueur résumé: {synth_data.get('summary_length', 0)} caractères")
-                        st.caption(f"Méthode: {synth_data.get('method', 'N/A')}")
+            # Nuage de mots
+            if visualizations.get("wordcloud"):
+                st.markdown("#### ☁️ Nuage de Mots")
+                st.image(f"data:image/png;base64,{visualizations['wordcloud']}", use_container_width=True)
+                st.caption("Visualisation des mots les plus fréquents dans le document")
                 st.divider()
             
-            # Agent 6: Vérification
-            with st.container():
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    st.markdown(f"### {agent_details.get('verification', {}).get('status', '⏳')}")
-                with col2:
-                    st.markdown("#### 6️⃣ Agent de Vérification")
-                    st.write(f"**Rôle**: Vérifier la cohérence et identifier les anomalies potentielles")
-                    st.write(f"**Résultat**: {agent_details.get('verification', {}).get('description', 'N/A')}")
-                    ver_data = agent_details.get('verification', {}).get('data', {})
-                    if ver_data:
-                        severity = ver_data.get('severity', 'N/A')
-                        if severity == "Haute":
-                            st.error(f"⚠️ Sévérité: {severity}")
-                        else:
-                            st.success(f"✅ Sévérité: {severity}")
+            # Graphiques statistiques
+            if visualizations.get("statistics"):
+                st.markdown("#### 📈 Statistiques")
+                st.image(f"data:image/png;base64,{visualizations['statistics']}", use_container_width=True)
+                st.caption("Analyse statistique du contenu extrait")
                 st.divider()
             
-            # Agent 7: Visualisation
-            with st.container():
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    st.markdown(f"### {agent_details.get('visualisation', {}).get('status', '⏳')}")
-                with col2:
-                    st.markdown("#### 7️⃣ Agent de Visualisation")
-                    st.write(f"**Rôle**: Générer des graphiques, nuages de mots et mindmaps")
-                    st.write(f"**Résultat**: {agent_details.get('visualisation', {}).get('description', 'N/A')}")
-                    viz_data = agent_details.get('visualisation', {}).get('data', {})
-                    if viz_data:
-                        st.write(f"- Nuage de mots: {viz_data.get('wordcloud', 'N/A')}")
-                        st.write(f"- Statistiques: {viz_data.get('statistics', 'N/A')}")
-                        st.write(f"- Mindmap: {viz_data.get('mindmap', 'N/A')}")
+            # Mindmap
+            if visualizations.get("mindmap"):
+                st.markdown("#### 🧠 Carte Mentale (Mindmap)")
+                st.image(f"data:image/png;base64,{visualizations['mindmap']}", use_container_width=True)
+                st.caption("Structure logique du document")
+    elif visualizations and visualizations.get("status") == "unavailable":
+        with st.expander("📊 Visualisations", expanded=False):
+            st.warning("⚠️ Visualisations indisponibles. Installez les dépendances: `pip install wordcloud matplotlib networkx`")
 
-        # Rapport PDF
-        rp = doc["report_path"]
-        if os.path.exists(rp):
-            st.markdown("### 📄 Rapport PDF")
-            
-            with open(rp, "rb") as f:
-                pdf_bytes = f.read()
-            
-            # Bouton pour télécharger
-            st.download_button(
-                label="📥 Télécharger le rapport PDF",
-                data=pdf_bytes,
-                file_name=os.path.basename(rp),
-                mime="application/pdf",
-                use_container_width=True
-            )
-            
-            st.info("💡 Téléchargez le rapport et ouvrez-le avec votre lecteur PDF pour le consulter.")
+
+    # Détails des agents
+    with st.expander("🔍 Détails des Agents (Pipeline)", expanded=False):
+        st.markdown("### Pipeline d'analyse multi-agents")
+        st.caption("Visualisez le travail de chaque agent dans le processus d'analyse")
         
-        st.divider()
+        agent_details = doc.get("agent_details", {})
+        
+        # Agent 1: Ingestion
+        with st.container():
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"### {agent_details.get('ingestion', {}).get('status', '⏳')}")
+            with col2:
+                st.markdown("#### 1️⃣ Agent d'Ingestion")
+                st.write(f"**Rôle**: Extraire le texte brut du PDF page par page")
+                st.write(f"**Résultat**: {agent_details.get('ingestion', {}).get('description', 'N/A')}")
+            st.divider()
+        
+        # Agent 2: Détection
+        with st.container():
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"### {agent_details.get('detection', {}).get('status', '⏳')}")
+            with col2:
+                st.markdown("#### 2️⃣ Agent de Détection")
+                st.write(f"**Rôle**: Identifier le type de document (article, contrat, CV, cours, autre)")
+                st.write(f"**Résultat**: {agent_details.get('detection', {}).get('description', 'N/A')}")
+                det_data = agent_details.get('detection', {}).get('data', {})
+                if det_data:
+                    st.json(det_data)
+            st.divider()
+        
+        # Agent 3: Structuration
+        with st.container():
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"### {agent_details.get('structuration', {}).get('status', '⏳')}")
+            with col2:
+                st.markdown("#### 3️⃣ Agent de Structuration")
+                st.write(f"**Rôle**: Segmenter le document en sections logiques")
+                st.write(f"**Résultat**: {agent_details.get('structuration', {}).get('description', 'N/A')}")
+                struct_data = agent_details.get('structuration', {}).get('data', {})
+                if struct_data.get('sections'):
+                    st.write("**Sections identifiées**:")
+                    for i, section in enumerate(struct_data['sections'][:10], 1):
+                        st.write(f"{i}. {section}")
+                    if len(struct_data['sections']) > 10:
+                        st.caption(f"... et {len(struct_data['sections']) - 10} autres sections")
+            st.divider()
+        
+        # Agent 4: Extraction
+        with st.container():
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"### {agent_details.get('extraction', {}).get('status', '⏳')}")
+            with col2:
+                st.markdown("#### 4️⃣ Agent d'Extraction")
+                st.write(f"**Rôle**: Extraire les informations structurées selon le type de document")
+                st.write(f"**Résultat**: {agent_details.get('extraction', {}).get('description', 'N/A')}")
+                ext_data = agent_details.get('extraction', {}).get('data', {})
+                if ext_data.get('fields'):
+                    st.write("**Champs extraits**:", ", ".join(ext_data['fields']))
+                    st.caption(f"Méthode: {ext_data.get('method', 'N/A')}")
+            st.divider()
+        
+        # Agent 5: Synthèse
+        with st.container():
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"### {agent_details.get('synthese', {}).get('status', '⏳')}")
+            with col2:
+                st.markdown("#### 5️⃣ Agent de Synthèse")
+                st.write(f"**Rôle**: Générer un résumé exécutif et identifier les points clés")
+                st.write(f"**Résultat**: {agent_details.get('synthese', {}).get('description', 'N/A')}")
+                synth_data = agent_details.get('synthese', {}).get('data', {})
+                if synth_data:
+                    st.caption(f"Longueur résumé: {synth_data.get('summary_length', 0)} caractères")
+                    st.caption(f"Méthode: {synth_data.get('method', 'N/A')}")
+            st.divider()
+        
+        # Agent 6: Vérification
+        with st.container():
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"### {agent_details.get('verification', {}).get('status', '⏳')}")
+            with col2:
+                st.markdown("#### 6️⃣ Agent de Vérification")
+                st.write(f"**Rôle**: Vérifier la cohérence et identifier les anomalies potentielles")
+                st.write(f"**Résultat**: {agent_details.get('verification', {}).get('description', 'N/A')}")
+                ver_data = agent_details.get('verification', {}).get('data', {})
+                if ver_data:
+                    severity = ver_data.get('severity', 'N/A')
+                    if severity == "Haute":
+                        st.error(f"⚠️ Sévérité: {severity}")
+                    else:
+                        st.success(f"✅ Sévérité: {severity}")
+            st.divider()
+        
+        # Agent 7: Visualisation
+        with st.container():
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"### {agent_details.get('visualisation', {}).get('status', '⏳')}")
+            with col2:
+                st.markdown("#### 7️⃣ Agent de Visualisation")
+                st.write(f"**Rôle**: Générer des graphiques, nuages de mots et mindmaps")
+                st.write(f"**Résultat**: {agent_details.get('visualisation', {}).get('description', 'N/A')}")
+                viz_data = agent_details.get('visualisation', {}).get('data', {})
+                if viz_data:
+                    st.write(f"- Nuage de mots: {viz_data.get('wordcloud', 'N/A')}")
+                    st.write(f"- Statistiques: {viz_data.get('statistics', 'N/A')}")
+                    st.write(f"- Mindmap: {viz_data.get('mindmap', 'N/A')}")
+
+    # Rapport PDF
+    rp = doc["report_path"]
+    if os.path.exists(rp):
+        st.markdown("### 📄 Rapport PDF")
+        
+        with open(rp, "rb") as f:
+            pdf_bytes = f.read()
+        
+        # Bouton pour télécharger
+        st.download_button(
+            label="📥 Télécharger le rapport PDF",
+            data=pdf_bytes,
+            file_name=os.path.basename(rp),
+            mime="application/pdf",
+            use_container_width=True
+        )
+        
+        st.info("💡 Téléchargez le rapport et ouvrez-le avec votre lecteur PDF pour le consulter.")
+    
+    st.divider()
+
+if run_btn and uploaded_files:
+    file_paths = _uploaded_sources(uploaded_files, persist=keep_uploads)
+    stages_per_doc = 8
+    total_steps = stages_per_doc * len(file_paths)
+    progress_bar = st.progress(0.0, text="Analyse en cours...")
+    steps = 0
+    # Compteurs cumulés résultat par résultat: les documents ne sont pas gardés après affichage
+    counters = detection_counters([])
+    start = time.time()
+    for event in iter_analyze_pdfs(
+        file_paths,
+        use_llm=set(llm_stages) if use_llm and llm_ready() else False,
+        llm_model=llm_model if use_llm else None,
+        force_type=None,
+        detection_mode={"Aléatoire": "random", "Cascade": "cascade"}.get(detection_mode),
+        max_workers=int(max_workers),
+        progress=True,
+        use_cache=use_cache,
+        timeout=float(doc_timeout) or None,
+        layout=use_layout,
+        term_index=use_term_index,
+        near_duplicates=use_near_duplicates,
+    ):
+        if event["event"] == "stage":
+            steps += 1
+            progress_bar.progress(min(steps / total_steps, 1.0), text=f"{event['filename']}: {event['stage']} {event['status']}")
+        elif event["event"] == "result":
+            detection_counters([event["doc"]], counters)
+            _render_result(event["doc"])
+    elapsed = time.time() - start
+    progress_bar.empty()
+
+    st.success(f"Analyse terminée en {elapsed:.2f}s")
+    if detection_mode == "Cascade":
+        st.caption(
+            f"Détection en cascade: {counters['heuristic_only']}/{counters['documents']} documents tranchés sans LLM, "
+            f"{counters['llm_escalated']} escalades, {counters['llm_calls_saved']} appels LLM évités"
+        )
 
 st.markdown("---")
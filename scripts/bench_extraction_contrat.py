@@ -0,0 +1,126 @@
+from __future__ import annotations
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.agents.extraction import DATE_PAT, DUREE_PAT, MONTANT_PAT, _concat_sections_text, _extract_contrat
+from app.agents.ingestion import ingest_pdf
+from app.agents.structuration import segment_document
+
+SIZES = [10, 50, 200]
+
+CLAUSES = [
+    "Entre les soussignés, la société {societe} et le client {client}, ci-après dénommé le Client.",
+    "Le présent contrat est signé le {date} et prend effet le {date}.",
+    "Il est conclu pour une durée de {n} mois renouvelable, jusqu'au {date}.",
+    "Le Client s'engage à régler la somme de {montant} eur à réception de facture.",
+    "Le fournisseur doit livrer les prestations dans un délai de {n} jours.",
+    "Chaque partie est tenu de respecter la confidentialité des informations échangées.",
+    "En cas de manquement, une pénalité de {montant} € par jour de retard sera appliquée.",
+    "La résiliation anticipée est possible moyennant un préavis de {n} jours.",
+    "Tout dommage causé par le fournisseur donne lieu à réparation.",
+    "Les prestations sont décrites en annexe et font partie intégrante du contrat.",
+]
+
+
+def synthetic_contracts(num_contracts: int, pages_per_contract: int = 4, seed: int = 0) -> Dict[str, Any]:
+    # Plusieurs contrats à la suite dans un même PDF (liasse), ~40 lignes par page
+    rng = random.Random(seed)
+    pages = []
+    for c in range(num_contracts):
+        for p in range(pages_per_contract):
+            lines = [f"Article {p + 1}. Conditions du contrat {c + 1}"] if p else [f"CONTRAT DE PRESTATION N° {c + 1}"]
+            for _ in range(40):
+                lines.append(rng.choice(CLAUSES).format(
+                    societe=f"Alpha {rng.randint(1, 99)}",
+                    client=f"Client {rng.randint(1, 999)}",
+                    date=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/20{rng.randint(20, 30)}",
+                    n=rng.randint(1, 36),
+                    montant=f"{rng.randint(1, 99)} {rng.randint(100, 999)},00",
+                ))
+            pages.append({"page_number": len(pages) + 1, "text": "\n".join(lines)})
+    return {"filename": "liasse.pdf", "num_pages": len(pages), "pages": pages}
+
+
+def legacy_extract_contrat(sections: Dict[str, Any]) -> Dict[str, Any]:
+    # Ancienne version: une passe par champ, puis découpage en phrases et trois recherches par phrase.
+    # Les montants sont rendus en entier (ensemble non ordonné) pour la comparaison.
+    data: Dict[str, Any] = {
+        "parties": [],
+        "dates": {"signature": None, "debut": None, "fin": None},
+        "duree": None,
+        "montants": [],
+        "obligations_principales": [],
+        "clauses_resiliation": [],
+        "penalites": [],
+    }
+    text = _concat_sections_text(sections)
+    parties = []
+    for line in text.splitlines():
+        if re.search(r"\b(parties|entre|dénommé|dénomination|société|client|fournisseur)\b", line, re.IGNORECASE):
+            parties.append(line.strip())
+    data["parties"] = parties[:5]
+    dates = DATE_PAT.findall(text)
+    for slot, value in zip(["signature", "debut", "fin"], dates):
+        data["dates"][slot] = value
+    m = DUREE_PAT.search(text)
+    if m:
+        data["duree"] = m.group(1)
+    data["montants"] = {m.group(0) for m in MONTANT_PAT.finditer(text)}
+    for s in re.split(r"(?<=[.!?])\s+", text):
+        low = s.lower()
+        if any(k in low for k in ["doit", "s'engage", "obligation", "tenu de"]):
+            data["obligations_principales"].append(s.strip())
+        if "résiliation" in low or "résilier" in low:
+            data["clauses_resiliation"].append(s.strip())
+        if any(k in low for k in ["pénalité", "pénalités", "amende", "dommage"]):
+            data["penalites"].append(s.strip())
+    return data
+
+
+def differences(expected: Dict[str, Any], got: Dict[str, Any]) -> List[str]:
+    diffs = [k for k in expected if k != "montants" and expected[k] != got.get(k)]
+    montants = got.get("montants", [])
+    if len(montants) != min(10, len(expected["montants"])) or not set(montants) <= expected["montants"]:
+        diffs.append("montants")
+    return diffs
+
+
+def main():
+    """
+    Usage: python scripts/bench_extraction_contrat.py [fichier.pdf ...]
+    Compare l'ancienne extraction de contrat (une passe par champ) et le
+    scanner combiné en une passe, sur des liasses de contrats synthétiques
+    de taille croissante ou sur les PDF donnés.
+    """
+    if len(sys.argv) > 1:
+        cases = [(os.path.basename(p), ingest_pdf(p)) for p in sys.argv[1:]]
+    else:
+        cases = [(f"{n} contrats", synthetic_contracts(n)) for n in SIZES]
+
+    print(f"{'document':>16} {'pages':>6} {'ancien (s)':>11} {'nouveau (s)':>12} {'speedup':>8}")
+    failed = False
+    for name, doc in cases:
+        sections = segment_document(doc)
+        start = time.perf_counter()
+        expected = legacy_extract_contrat(sections)
+        t_old = time.perf_counter() - start
+        start = time.perf_counter()
+        got = _extract_contrat(sections)
+        t_new = time.perf_counter() - start
+        diffs = differences(expected, got)
+        if diffs:
+            print(f"ERREUR: {name}: champs différents: {', '.join(diffs)}")
+            failed = True
+        print(f"{name:>16} {doc['num_pages']:>6} {t_old:>11.3f} {t_new:>12.3f} {t_old / t_new:>7.1f}x")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
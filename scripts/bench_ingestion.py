@@ -0,0 +1,65 @@
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from app.agents.ingestion import ingest_pdf
+
+WORKERS = [1, 2, 4, 8]
+
+
+def write_synthetic_pdf(path: str, num_pages: int) -> None:
+    c = canvas.Canvas(path, pagesize=A4)
+    for p in range(num_pages):
+        y = 800
+        c.drawString(50, y, f"Article {p + 1} - Conditions générales")
+        for line in range(48):
+            y -= 16
+            c.drawString(50, y, f"Le Client s'engage à régler 1 250,00 EUR au Fournisseur (page {p + 1}, ligne {line}).")
+        c.showPage()
+    c.save()
+
+
+def main():
+    """
+    Usage: python scripts/bench_ingestion.py [fichier.pdf | nb_pages]
+    Compare l'extraction séquentielle et l'extraction par pool de processus.
+    """
+    arg = sys.argv[1] if len(sys.argv) > 1 else "400"
+    tmp = None
+    if os.path.exists(arg):
+        path = arg
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        tmp.close()
+        path = tmp.name
+        write_synthetic_pdf(path, int(arg))
+
+    try:
+        reference = None
+        base = None
+        print(f"{'workers':>8} {'pages':>6} {'temps (s)':>10} {'speedup':>8}")
+        for w in WORKERS:
+            start = time.perf_counter()
+            doc = ingest_pdf(path, workers=w)
+            elapsed = time.perf_counter() - start
+            texts = [p["text"] for p in doc["pages"]]
+            if reference is None:
+                reference, base = texts, elapsed
+            elif texts != reference:
+                print(f"ERREUR: texte différent avec {w} workers")
+                sys.exit(1)
+            print(f"{w:>8} {doc['num_pages']:>6} {elapsed:>10.2f} {base / elapsed:>7.2f}x")
+    finally:
+        if tmp is not None:
+            os.remove(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from app import llm_client
+from app.orchestrator import aanalyze_pdfs, analyze_pdfs
+
+LATENCY_S = 0.2
+NUM_CALLS = 32
+NUM_DOCS = 6
+
+CONTRACT_LINES = [
+    "CONTRAT DE PRESTATION",
+    "Le présent contrat est conclu entre la Société X (Fournisseur) et la Société Y (Client).",
+    "Ce contrat entre en vigueur le 15/01/2024 pour une durée de 12 mois.",
+    "Le montant total est de 10 000 EUR à payer mensuellement.",
+    "Chaque Partie peut résilier avec un préavis de 30 jours.",
+    "Des pénalités peuvent s'appliquer en cas de retard.",
+]
+
+
+class FakeMistral(BaseHTTPRequestHandler):
+    """Faux /v1/chat/completions: répond "{}" après LATENCY_S, compte requêtes, connexions et requêtes simultanées."""
+
+    protocol_version = "HTTP/1.1"
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "connections": set()}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            self.stats["connections"].add(self.client_address)
+        time.sleep(LATENCY_S)
+        with self.lock:
+            self.stats["in_flight"] -= 1
+        body = json.dumps({
+            "id": "fake", "object": "chat.completion", "model": "fake", "created": int(time.time()),
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "{}"}, "finish_reason": "stop"}],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def reset_stats() -> None:
+    FakeMistral.stats.update(requests=0, in_flight=0, max_in_flight=0, connections=set())
+
+
+def report(label: str, elapsed: float) -> None:
+    s = FakeMistral.stats
+    print(f"{label:<34} {elapsed:>8.2f} {s['requests']:>9} {s['max_in_flight']:>11} {len(s['connections']):>12}")
+
+
+def write_contracts(folder: str, n: int) -> List[str]:
+    paths = []
+    for i in range(n):
+        path = os.path.join(folder, f"contrat_{i}.pdf")
+        c = canvas.Canvas(path, pagesize=A4)
+        y = 800
+        for line in CONTRACT_LINES:
+            c.drawString(50, y, f"{line} (doc {i})")
+            y -= 16
+        c.save()
+        paths.append(path)
+    return paths
+
+
+async def gather_achat(n: int) -> None:
+    await asyncio.gather(*(llm_client.achat(f"question {i}") for i in range(n)))
+    await llm_client.aclose()
+
+
+async def run_aanalyze(paths: List[str]) -> None:
+    # aanalyze_pdfs ferme lui-même le pool HTTP de la boucle
+    await aanalyze_pdfs(paths, use_llm=True)
+
+
+def main():
+    """
+    Usage: python scripts/bench_llm_async.py [nb_appels] [nb_documents]
+    Lance un faux serveur Mistral local (latence fixe, MISTRAL_SERVER_URL) et
+    compare: chat() en séquence contre achat() en asyncio.gather, puis
+    analyze_pdfs séquentiel (use_llm=True) contre aanalyze_pdfs. Affiche le
+    temps, les requêtes, le maximum de requêtes simultanées (borné par
+    LLM_MAX_CONCURRENCY) et le nombre de connexions TCP ouvertes.
+    """
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_CALLS
+    num_docs = int(sys.argv[2]) if len(sys.argv) > 2 else NUM_DOCS
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMistral)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["MISTRAL_SERVER_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.setdefault("MISTRAL_API_KEY", "fake")
+
+    print(f"latence simulée {LATENCY_S * 1000:.0f} ms, LLM_MAX_CONCURRENCY={llm_client.LLM_MAX_CONCURRENCY}")
+    print(f"{'':<34} {'temps (s)':>8} {'requêtes':>9} {'simultanées':>11} {'connexions':>12}")
+    reset_stats()
+    start = time.perf_counter()
+    for i in range(num_calls):
+        llm_client.chat(f"question {i}")
+    report(f"chat x{num_calls} (séquentiel)", time.perf_counter() - start)
+
+    reset_stats()
+    start = time.perf_counter()
+    asyncio.run(gather_achat(num_calls))
+    report(f"achat x{num_calls} (gather)", time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_contracts(tmp, num_docs)
+        reset_stats()
+        start = time.perf_counter()
+        analyze_pdfs(paths, use_llm=True, executor="thread")
+        report(f"analyze_pdfs x{num_docs} (séquentiel)", time.perf_counter() - start)
+
+        reset_stats()
+        start = time.perf_counter()
+        asyncio.run(run_aanalyze(paths))
+        report(f"aanalyze_pdfs x{num_docs}", time.perf_counter() - start)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
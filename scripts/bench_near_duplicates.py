@@ -0,0 +1,85 @@
+from __future__ import annotations
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+
+from app.near_duplicates import NearDuplicateIndex, estimated_similarity, minhash_signature, page_fingerprints
+
+CORPUS_SIZES = [100, 1000, 5000]
+WORDS_PER_DOC = 600
+QUERIES = 50
+
+VOCAB = [f"mot{i}" for i in range(5000)]
+
+
+def synthetic_words(rng: random.Random, n: int = WORDS_PER_DOC) -> List[str]:
+    return [rng.choice(VOCAB) for _ in range(n)]
+
+
+def edited(rng: random.Random, words: List[str], ratio: float = 0.01) -> List[str]:
+    # Copie légèrement modifiée (quelques mots remplacés), comme un contrat retouché
+    out = list(words)
+    for i in rng.sample(range(len(out)), max(1, int(len(out) * ratio))):
+        out[i] = rng.choice(VOCAB)
+    return out
+
+
+def main():
+    """
+    Usage: python scripts/bench_near_duplicates.py [taille_corpus_max]
+    Remplit un index de quasi-doublons (fichier temporaire) avec des documents
+    synthétiques, puis compare par taille de corpus le temps de find() (seaux
+    LSH) à une relecture de toutes les signatures, pour des copies retouchées
+    de documents indexés et pour des documents nouveaux.
+    """
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else CORPUS_SIZES[-1]
+    sizes = [n for n in CORPUS_SIZES if n <= max_size] or [max_size]
+    rng = random.Random(0)
+
+    print(f"{'corpus':>7} {'signature (ms)':>15} {'lsh (ms)':>9} {'parcours (ms)':>14} {'doublons trouvés':>17} {'faux positifs':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(os.path.join(tmp, "bench.sqlite"))
+        scan = sqlite3.connect(index.path)
+        corpus: List[List[str]] = []
+        sign_time = 0.0
+        for size in sizes:
+            while len(corpus) < size:
+                words = synthetic_words(rng)
+                start = time.perf_counter()
+                sig = minhash_signature(words)
+                sign_time += time.perf_counter() - start
+                index.add_document(f"doc{len(corpus)}", sig, page_fingerprints([" ".join(words)]), filename=f"doc{len(corpus)}.pdf")
+                corpus.append(words)
+
+            queries = [(minhash_signature(edited(rng, rng.choice(corpus))), True) for _ in range(QUERIES // 2)]
+            queries += [(minhash_signature(synthetic_words(rng)), False) for _ in range(QUERIES - len(queries))]
+            found = false_pos = 0
+            start = time.perf_counter()
+            for sig, is_dup in queries:
+                match = index.find("requete", sig)
+                found += bool(match) and is_dup
+                false_pos += bool(match) and not is_dup
+            t_lsh = (time.perf_counter() - start) / len(queries)
+            start = time.perf_counter()
+            for sig, _ in queries:
+                # Sans LSH: relire et comparer toutes les signatures du corpus
+                max(estimated_similarity(sig, np.frombuffer(blob, dtype=np.uint64)) for (blob,) in scan.execute("SELECT signature FROM documents"))
+            t_scan = (time.perf_counter() - start) / len(queries)
+            print(
+                f"{size:>7} {sign_time / len(corpus) * 1000:>15.2f} {t_lsh * 1000:>9.2f} {t_scan * 1000:>14.2f}"
+                f" {found:>11}/{QUERIES // 2:<5} {false_pos:>14}"
+            )
+        scan.close()
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
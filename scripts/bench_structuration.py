@@ -0,0 +1,84 @@
+from __future__ import annotations
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.agents.structuration import _is_heading, segment_document
+
+SIZES = [250, 500, 1000, 2000]
+
+
+def synthetic_doc(num_pages: int, lines_per_page: int = 48, pages_per_section: int = 200) -> Dict[str, Any]:
+    # Peu de titres: des sections de plusieurs centaines de pages (pire cas de l'ancien code)
+    pages = []
+    for p in range(num_pages):
+        lines = []
+        if p % pages_per_section == 0:
+            lines.append(f"{p // pages_per_section + 1}. Conditions particulières")
+        for line in range(lines_per_page):
+            lines.append(f"le client s'engage à régler 1 250,00 eur au fournisseur (page {p + 1}, ligne {line}).")
+        pages.append({"page_number": p + 1, "text": "\n".join(lines)})
+    return {"filename": "synthetique.pdf", "num_pages": num_pages, "pages": pages}
+
+
+def legacy_segment(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Ancienne boucle: content += ligne et recherche linéaire dans pages
+    sections: List[Dict[str, Any]] = []
+    current: Dict[str, Any] | None = None
+    for page in doc.get("pages", []):
+        page_no = page.get("page_number")
+        for line in page.get("text", "").splitlines():
+            if _is_heading(line):
+                if current:
+                    sections.append(current)
+                current = {"title": line.strip(), "content": "", "pages": [page_no]}
+            else:
+                if not current:
+                    current = {"title": "Document", "content": "", "pages": [page_no]}
+                current["content"] += (line + "\n")
+                if page_no not in current["pages"]:
+                    current["pages"].append(page_no)
+    if current:
+        sections.append(current)
+    return {"sections": sections}
+
+
+def same_sections(expected: Dict[str, Any], got: Dict[str, Any]) -> bool:
+    # Les sections sont des intervalles du buffer (start/end): on compare title, pages et
+    # content lu, sans le "\n" final que l'ancienne boucle ajoutait après chaque ligne
+    if len(expected["sections"]) != len(got["sections"]):
+        return False
+    return all(
+        e["title"] == g["title"] and e["pages"] == g["pages"] and e["content"].rstrip("\n") == g["content"].rstrip("\n")
+        for e, g in zip(expected["sections"], got["sections"])
+    )
+
+
+def main():
+    """
+    Usage: python scripts/bench_structuration.py [nb_pages_max]
+    Compare l'ancien découpage (concaténations successives) et le nouveau
+    (lignes jointes une fois) sur des documents synthétiques de taille croissante.
+    """
+    max_pages = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    sizes = [n for n in SIZES if n <= max_pages] or [max_pages]
+    print(f"{'pages':>6} {'ancien (s)':>11} {'µs/page':>8} {'nouveau (s)':>12} {'µs/page':>8}")
+    for n in sizes:
+        doc = synthetic_doc(n)
+        start = time.perf_counter()
+        expected = legacy_segment(doc)
+        t_old = time.perf_counter() - start
+        start = time.perf_counter()
+        got = segment_document(doc)
+        t_new = time.perf_counter() - start
+        if not same_sections(expected, got):
+            print(f"ERREUR: sections différentes pour {n} pages")
+            sys.exit(1)
+        print(f"{n:>6} {t_old:>11.3f} {t_old / n * 1e6:>8.0f} {t_new:>12.3f} {t_new / n * 1e6:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.agents.type_detection import DETECTOR, HINTS
+
+VOCAB = (
+    "abstract introduction méthodes résultats discussion références doi university "
+    "contrat entre les parties ci-après dénommé le présent contrat durée résiliation "
+    "signature clause article euros eur prix paiement obligations pénalités confidentialité "
+    "expérience formation compétences langues profil email téléphone linkedin github "
+    "chapitre leçon exercice objectifs cours module séance évaluation travaux pratiques "
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "le la les de des du un une et à en pour par sur avec dans"
+).split()
+
+
+def legacy_scores(text: str):
+    # Ancienne implémentation: un re.search par motif
+    return {cls: sum(1 for pat in patterns if re.search(pat, text)) for cls, patterns in HINTS.items()}
+
+
+def synthetic_texts(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        words = [rng.choice(VOCAB) for _ in range(rng.randint(50, 600))]
+        texts.append(" ".join(words)[:3000])
+    return texts
+
+
+def main():
+    """
+    Usage: python scripts/bench_type_detection.py [nb_textes]
+    Compare re.search motif par motif et le détecteur compilé (HintDetector).
+    """
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    texts = synthetic_texts(n)
+
+    start = time.perf_counter()
+    expected = [legacy_scores(t) for t in texts]
+    t_legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    got = [DETECTOR.scores(t) for t in texts]
+    t_compiled = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, got) if a != b)
+    print(f"{'méthode':>10} {'textes':>7} {'temps (s)':>10} {'textes/s':>9}")
+    print(f"{'re.search':>10} {n:>7} {t_legacy:>10.2f} {n / t_legacy:>9.0f}")
+    print(f"{'compilé':>10} {n:>7} {t_compiled:>10.2f} {n / t_compiled:>9.0f}")
+    print(f"speedup: {t_legacy / t_compiled:.2f}x, écarts: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
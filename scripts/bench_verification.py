@@ -0,0 +1,101 @@
+from __future__ import annotations
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from rapidfuzz import fuzz
+
+from app.agents.verification import verify_and_annotate
+from app.document_text import document_text
+
+PAGE_SIZES = [50, 200, 500, 1000]
+KEY_POINT_COUNTS = [5, 20, 50]
+
+SUBJECTS = ["Le client", "Le fournisseur", "Le prestataire", "La société", "Chaque partie"]
+VERBS = ["s'engage à régler", "doit livrer", "est tenu de fournir", "peut résilier", "garantit"]
+OBJECTS = [
+    "les prestations décrites en annexe", "la somme de {n} 000 eur", "un préavis de {n} jours",
+    "la confidentialité des données", "les pénalités de retard prévues à l'article {n}",
+    "la maintenance du logiciel", "les frais de déplacement", "un rapport mensuel d'activité",
+]
+
+
+def synthetic_doc(num_pages: int, sentences_per_page: int = 25, seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    pages = []
+    for p in range(num_pages):
+        sentences = [
+            f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS).format(n=rng.randint(1, 99))} (clause {p + 1}.{s})."
+            for s in range(sentences_per_page)
+        ]
+        pages.append({"page_number": p + 1, "text": "\n".join(sentences)})
+    return {"filename": "synthetique.pdf", "num_pages": num_pages, "pages": pages}
+
+
+def key_points(doc: Dict[str, Any], n: int, seed: int = 1) -> List[str]:
+    # Moitié reprises du texte (légèrement raccourcies), moitié absentes du document
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        if i % 2 == 0:
+            line = rng.choice(rng.choice(doc["pages"])["text"].splitlines())
+            out.append(f"Obligation: {line[:-1]}")
+        else:
+            out.append(f"Point {i}: le contrat prévoit une assurance tous risques chantier numéro {i}")
+    return out
+
+
+def legacy_verify(doc: Dict[str, Any], synthesis: Dict[str, Any]) -> List[List[int]]:
+    # Ancienne version: token_set_ratio de chaque point clé contre chaque page entière
+    pages = list(document_text(doc).iter_pages())
+    refs = []
+    for kp in synthesis.get("key_points", []):
+        scores = sorted(((fuzz.token_set_ratio(kp, text), page_no) for page_no, text in pages), reverse=True, key=lambda x: x[0])
+        refs.append([pg for sc, pg in scores[:2] if sc >= 40])
+    return refs
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+
+def main():
+    """
+    Usage: python scripts/bench_verification.py [nb_pages_max] [nb_points_cles_max]
+    Compare, sur des documents synthétiques de taille croissante, la boucle
+    page par page (ancienne version), la matrice cdist (engine="matrix") et
+    l'index d'ancrage (engine="index": construction une fois, puis requêtes).
+    Vérifie que la matrice donne les mêmes pages que la boucle.
+    """
+    max_pages = int(sys.argv[1]) if len(sys.argv) > 1 else PAGE_SIZES[-1]
+    max_points = int(sys.argv[2]) if len(sys.argv) > 2 else KEY_POINT_COUNTS[-1]
+    page_sizes = [p for p in PAGE_SIZES if p <= max_pages] or [max_pages]
+    point_counts = [n for n in KEY_POINT_COUNTS if n <= max_points] or [max_points]
+
+    print(f"{'pages':>6} {'points':>7} {'boucle (ms)':>12} {'matrice (ms)':>13} {'index constr. (ms)':>19} {'index (ms)':>11}")
+    failed = False
+    for num_pages in page_sizes:
+        doc = synthetic_doc(num_pages)
+        for n in point_counts:
+            doc.pop("document_text", None)
+            synthesis = {"summary": "", "key_points": key_points(doc, n)}
+            expected, t_loop = timed(lambda: legacy_verify(doc, synthesis))
+            ver, t_matrix = timed(lambda: verify_and_annotate(doc, synthesis, engine="matrix"))
+            _, t_build = timed(lambda: document_text(doc).grounding)
+            _, t_index = timed(lambda: verify_and_annotate(doc, synthesis, engine="index"))
+            if [kp["page_refs"] for kp in ver["annotated_key_points"]] != expected:
+                print(f"ERREUR: pages différentes entre boucle et matrice ({num_pages} pages, {n} points)")
+                failed = True
+            print(f"{num_pages:>6} {n:>7} {t_loop * 1000:>12.1f} {t_matrix * 1000:>13.1f} {t_build * 1000:>19.1f} {t_index * 1000:>11.1f}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,17 @@ from typing import List
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from app.agents.ingestion import ingest_pdfs
-from app.agents.type_detection import detect_document_type
+from app.agents.type_detection import detect_document_type, detect_document_types
 
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python scripts/evaluate_types.py data/examples/labels_types.csv [--llm]")
+        print("Usage: python scripts/evaluate_types.py data/examples/labels_types.csv [--llm] [--model modele.json]")
         sys.exit(1)
 
     labels_csv = sys.argv[1]
     use_llm = "--llm" in sys.argv
+    model = sys.argv[sys.argv.index("--model") + 1] if "--model" in sys.argv else None
 
     rows = []
     with open(labels_csv, newline='', encoding='utf-8') as f:
@@ -25,13 +26,18 @@ def main():
             rows.append(r)
 
     file_paths: List[str] = [os.path.join(os.path.dirname(labels_csv), r["filename"]) for r in rows]
-    docs = ingest_pdfs(file_paths)
+    # Lecture paresseuse: la détection ne lit que les premières pages
+    docs = ingest_pdfs(file_paths, lazy=True)
 
     gold = [r["type"].strip() for r in rows]
     pred = []
 
-    for doc in docs:
-        t, c = detect_document_type(doc, use_llm=use_llm)
+    if use_llm:
+        results = [detect_document_type(doc, use_llm=True) for doc in docs]
+    else:
+        # Sans LLM, tout le corpus est classé en un seul lot vectorisé
+        results = detect_document_types(docs, model=model)
+    for doc, (t, c) in zip(docs, results):
         pred.append(t)
         print(f"{doc['filename']}: pred={t} (conf={c:.2f})")
 
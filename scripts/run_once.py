@@ -11,4 +11,4 @@ files = [
 if __name__ == '__main__':
     res = analyze_pdfs(files, use_llm=False, llm_model=None, force_type=None)
     for d in res:
-        print(d['filename'], d['document_type'], d.get('report_path'))
+        print(d['filename'], d.get('document_type'), d.get('report_path') or d.get('error'))
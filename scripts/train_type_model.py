@@ -0,0 +1,44 @@
+from __future__ import annotations
+import csv
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.agents.ingestion import ingest_pdfs
+from app.agents.type_detection import DETECTOR, TypeModel, _sample_text
+
+
+def main():
+    """
+    Usage: python scripts/train_type_model.py data/examples/labels_types.csv [sortie.json]
+    Entraîne le modèle linéaire de type sur les indices et le sauvegarde en JSON
+    (à désigner ensuite par TYPE_MODEL_PATH ou --model dans evaluate_types.py).
+    """
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    labels_csv = sys.argv[1]
+    out_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join("data", "type_model.json")
+
+    with open(labels_csv, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+
+    file_paths = [os.path.join(os.path.dirname(labels_csv), r["filename"]) for r in rows]
+    docs = ingest_pdfs(file_paths, lazy=True)
+    labels = [r["type"].strip() for r in rows]
+
+    X = DETECTOR.matrix([_sample_text(doc) for doc in docs])
+    model = TypeModel.fit(X, labels)
+    pred, _, _ = model.predict(X)
+    correct = sum(1 for g, p in zip(labels, pred) if g == p)
+    print(f"Classes: {', '.join(model.classes)}")
+    print(f"Exactitude (entraînement): {correct / len(labels):.2%} ({correct}/{len(labels)})")
+
+    model.save(out_path)
+    print(f"Modèle sauvegardé: {out_path}")
+
+
+if __name__ == "__main__":
+    main()